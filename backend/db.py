@@ -1,13 +1,99 @@
-from pymongo import MongoClient
+from pymongo import ASCENDING, DESCENDING, AsyncMongoClient, MongoClient, IndexModel
+from pymongo.errors import OperationFailure
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-client = MongoClient(os.getenv("MONGO_URI"))
-db = client["resourcenest"]
+DB_NAME = "resourcenest"
 
-# Collections (optional shortcut aliases)
-users_col = db["users"]
-bookmarks_col = db["bookmarks"]
-collections_col = db["collections"]
+
+def _ms(name: str, default=None):
+    value = os.getenv(name, default)
+    return int(value) if value not in (None, "") else None
+
+
+# Connection pool and timeout settings shared by both clients. The
+# defaults fail requests within a few seconds when Mongo is unreachable or
+# the pool is exhausted, instead of hanging on pymongo's unbounded waits.
+CLIENT_OPTIONS = {
+    "maxPoolSize": _ms("MONGO_MAX_POOL_SIZE", "100"),
+    "minPoolSize": _ms("MONGO_MIN_POOL_SIZE", "0"),
+    "maxIdleTimeMS": _ms("MONGO_MAX_IDLE_MS"),
+    "connectTimeoutMS": _ms("MONGO_CONNECT_TIMEOUT_MS", "5000"),
+    "serverSelectionTimeoutMS": _ms("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"),
+    "socketTimeoutMS": _ms("MONGO_SOCKET_TIMEOUT_MS", "30000"),
+    "waitQueueTimeoutMS": _ms("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"),
+}
+CLIENT_OPTIONS = {k: v for k, v in CLIENT_OPTIONS.items() if v is not None}
+
+# The app (routes, workers, search index) uses the asyncio client on the
+# event loop. The blocking client is only for command-line scripts.
+client = AsyncMongoClient(os.getenv("MONGO_URI"), **CLIENT_OPTIONS)
+db = client[DB_NAME]
+
+_sync_db = None
+
+
+def get_sync_db():
+    """Blocking database handle for scripts/; created on first use."""
+    global _sync_db
+    if _sync_db is None:
+        _sync_db = MongoClient(os.getenv("MONGO_URI"), **CLIENT_OPTIONS)[DB_NAME]
+    return _sync_db
+
+# Indexes required by the query shapes in routes/ and workers/, created at
+# startup by ensure_indexes(). scripts/audit_queries.py checks that every
+# shape is served by one of them.
+INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email", unique=True),
+    ],
+    "bookmarks": [
+        # Listings filter on equality fields and page by _id, so _id comes last.
+        IndexModel([("user_id", ASCENDING), ("_id", ASCENDING)], name="user_id_page"),
+        IndexModel([("user_id", ASCENDING), ("tags", ASCENDING), ("_id", ASCENDING)], name="user_tags_page"),
+        IndexModel([("user_id", ASCENDING), ("is_broken", ASCENDING), ("_id", ASCENDING)], name="user_broken_page"),
+        IndexModel([("shared", ASCENDING), ("_id", ASCENDING)], name="shared_page"),
+        IndexModel([("user_id", ASCENDING), ("url", ASCENDING)], name="user_url"),
+        IndexModel([("user_id", ASCENDING), ("canonical_url", ASCENDING)], name="user_canonical_url"),
+        IndexModel([("user_id", ASCENDING), ("updated_at", ASCENDING)], name="user_updated"),
+        IndexModel([("user_id", ASCENDING), ("created_at", ASCENDING)], name="user_created"),
+        IndexModel([("user_id", ASCENDING), ("cluster", ASCENDING), ("_id", ASCENDING)], name="user_cluster"),
+        IndexModel([("last_checked", ASCENDING)], name="last_checked"),
+        IndexModel([("url", ASCENDING)], name="url"),
+    ],
+    "collections": [
+        IndexModel([("user_id", ASCENDING), ("name", ASCENDING)], name="user_name"),
+    ],
+    "tag_counts": [
+        IndexModel([("count", DESCENDING)], name="count"),
+    ],
+    "user_tags": [
+        IndexModel([("user_id", ASCENDING), ("tag", ASCENDING)], name="user_tag", unique=True),
+        IndexModel([("user_id", ASCENDING), ("count", DESCENDING)], name="user_count"),
+    ],
+    "import_jobs": [
+        IndexModel([("status", ASCENDING), ("lease_until", ASCENDING)], name="status_lease"),
+    ],
+    "import_rows": [
+        IndexModel([("job_id", ASCENDING), ("state", ASCENDING), ("seq", ASCENDING)], name="job_state_seq"),
+        IndexModel(
+            [("job_id", ASCENDING), ("url", ASCENDING)],
+            name="job_url",
+            unique=True,
+            partialFilterExpression={"url": {"$type": "string"}},
+        ),
+    ],
+}
+
+
+async def ensure_indexes():
+    """Creates any missing indexes; existing ones with the same spec are left alone."""
+    for name, models in INDEXES.items():
+        for model in models:
+            try:
+                await db[name].create_indexes([model])
+            except OperationFailure as e:
+                # e.g. duplicate emails blocking a unique index; keep serving.
+                print(f"Could not create index {model.document['name']} on {name}: {e}")
@@ -1,3 +1,12 @@
+import time
+
+_import_started = time.perf_counter()
+
+import asyncio
+import os
+import threading
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from routes.auth import auth
@@ -6,9 +15,48 @@ from routes.admin import admin
 from routes.import_bookmarks import router as import_bookmarks_router
 from routes.analytics import analytics 
 from routes.collection import collection_router
+from routes.tags import tags_router
+from routes.duplicates import duplicates_router
+from db import client, ensure_indexes
+from responses import MongoJSONResponse
+from ml import embedding, scraper
+from ml.enrich import warm_up
+import passwords
+import share_cache
+from workers import import_jobs, link_checker, stats
+
+IMPORT_SECONDS = time.perf_counter() - _import_started
+print(f"App imported in {IMPORT_SECONDS:.2f}s")
+
+# Set ML_WARMUP=0 to load the model on the first request that needs it instead.
+ML_WARMUP = os.getenv("ML_WARMUP", "1") == "1"
+
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await ensure_indexes()
+    if ML_WARMUP:
+        threading.Thread(target=warm_up, name="ml-warmup", daemon=True).start()
+    threading.Thread(target=passwords.warm_up, name="password-pool-warmup", daemon=True).start()
+    tasks = [
+        asyncio.create_task(import_jobs.resume_forever()),
+        asyncio.create_task(stats.run_forever()),
+    ]
+    if share_cache.SHARE_CACHE_DIR:
+        tasks.append(asyncio.create_task(share_cache.run_forever()))
+    if link_checker.LINK_CHECK_ENABLED:
+        tasks.append(asyncio.create_task(link_checker.run_forever()))
+    yield
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await import_jobs.shutdown()
+    passwords.shutdown()
+    await scraper.close_client()
+    await client.close()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan, default_response_class=MongoJSONResponse)
 
 # Add this CORS config
 origins = [
@@ -22,6 +70,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],         # Allow all HTTP methods (GET, POST, etc.)
     allow_headers=["*"],         # Allow all headers
+    expose_headers=["X-Next-Cursor"],
 )
 
 # ✅ Router registrations
@@ -31,3 +80,24 @@ app.include_router(admin)
 app.include_router(import_bookmarks_router)
 app.include_router(analytics)
 app.include_router(collection_router)
+app.include_router(tags_router)
+app.include_router(duplicates_router)
+
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving non-ML routes."""
+    return {"status": "ok", "import_seconds": round(IMPORT_SECONDS, 3)}
+
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: the embedding model is loaded and ML routes will not block on it."""
+    body = {
+        "model_loaded": embedding.model_ready.is_set(),
+        "model_load_seconds": embedding.load_seconds,
+        "encoder_backend": embedding.ENCODER_BACKEND,
+    }
+    if not body["model_loaded"]:
+        return MongoJSONResponse(status_code=503, content={"status": "loading", **body})
+    return {"status": "ready", **body}
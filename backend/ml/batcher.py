@@ -0,0 +1,135 @@
+# ml/batcher.py
+"""
+Micro-batching front end for SentenceTransformer.encode.
+
+Async route handlers and import tasks await encode_async(), which wraps
+the submitted future for the event loop; KeyBERT's candidate encodes
+(ml/tags.py, run in an executor) and the startup warm-up block on
+submit()/encode() instead. A single worker thread collects whatever
+arrives within max_wait_ms, up to max_batch texts, runs one batched
+encode call and fans the rows back out to the waiting futures. Futures
+cancelled while queued are skipped.
+"""
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "32"))
+EMBED_MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", "5"))
+
+
+class EmbeddingBatcher:
+    def __init__(self, encode_fn, max_batch: int = EMBED_MAX_BATCH, max_wait_ms: float = EMBED_MAX_WAIT_MS):
+        self.encode_fn = encode_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "batches": 0,
+            "texts": 0,
+            "max_batch_size": 0,
+            "queue_wait_seconds": 0.0,
+            "encode_seconds": 0.0,
+            "errors": 0,
+        }
+
+    def _ensure_worker(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._thread.start()
+
+    def submit(self, texts) -> Future:
+        """Queues texts for encoding; the future resolves to one vector per text."""
+        fut = Future()
+        self._ensure_worker()
+        self._queue.put((list(texts), fut, time.perf_counter()))
+        return fut
+
+    def encode(self, text: str):
+        return self.submit([text]).result()[0]
+
+    async def encode_async(self, text: str):
+        vectors = await asyncio.wrap_future(self.submit([text]))
+        return vectors[0]
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch, size
+
+    def _run(self):
+        while True:
+            batch, _ = self._collect()
+            # Callers cancelled while queued (asyncio.wrap_future cancels the future)
+            # are dropped; the rest can no longer be cancelled under us.
+            batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                self._run_batch(batch)
+            except Exception as e:
+                # One bad batch must not take down the only worker thread.
+                print(f"Embedding batch failed: {e}")
+                for _, fut, _ in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+
+    def _run_batch(self, batch):
+        texts = [t for item in batch for t in item[0]]
+        size = len(texts)
+        started = time.perf_counter()
+        try:
+            vectors = self.encode_fn(texts)
+        except Exception as e:
+            for _, fut, _ in batch:
+                fut.set_exception(e)
+            with self._stats_lock:
+                self._stats["errors"] += 1
+            return
+        finished = time.perf_counter()
+
+        offset = 0
+        for item_texts, fut, _ in batch:
+            fut.set_result(vectors[offset:offset + len(item_texts)])
+            offset += len(item_texts)
+
+        with self._stats_lock:
+            s = self._stats
+            s["requests"] += len(batch)
+            s["batches"] += 1
+            s["texts"] += size
+            s["max_batch_size"] = max(s["max_batch_size"], size)
+            s["queue_wait_seconds"] += sum(started - queued for _, _, queued in batch)
+            s["encode_seconds"] += finished - started
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            s = dict(self._stats)
+        batches = s["batches"] or 1
+        requests = s["requests"] or 1
+        s["avg_batch_size"] = s["texts"] / batches
+        s["avg_queue_wait_ms"] = 1000 * s["queue_wait_seconds"] / requests
+        s["avg_encode_ms"] = 1000 * s["encode_seconds"] / batches
+        s["queue_depth"] = self._queue.qsize()
+        return s
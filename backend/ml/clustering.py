@@ -0,0 +1,267 @@
+# ml/clustering.py
+"""
+Suggested collections: groups of a user's bookmarks found by clustering
+their embeddings.
+
+rebuild() runs MiniBatchKMeans over the user's normalized float32
+embedding matrix, labels every cluster from its most distinctive tags
+(the KeyBERT tags stored on the bookmarks, weighted against how common
+each tag is across the whole library), stamps each bookmark with its
+`cluster` and stores the model, one document per user, in `suggestions`.
+
+New bookmarks are then assigned to their nearest centroid on insert
+(assign()), and deletes and re-embeds adjust the sizes, so the library is
+not re-clustered per write. Once ADDED_RATIO of the library has arrived
+since the last build, or the model is older than SUGGEST_MAX_AGE_HOURS,
+the next read schedules a rebuild in the background.
+
+GET /collections/suggestions reads the stored document only, so it costs
+one indexed lookup however large the library is.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+
+import numpy as np
+from bson import Binary, ObjectId
+from pymongo import UpdateMany
+
+from db import db
+from search import embedding_codec
+
+SUGGEST_MAX_K = int(os.getenv("SUGGEST_MAX_K", "30"))
+SUGGEST_MIN_SIZE = int(os.getenv("SUGGEST_MIN_SIZE", "3"))
+SUGGEST_MIN_LIBRARY = int(os.getenv("SUGGEST_MIN_LIBRARY", "20"))
+SUGGEST_MAX_AGE_HOURS = float(os.getenv("SUGGEST_MAX_AGE_HOURS", "24"))
+# Rebuild once this share of the library was added since the last build.
+ADDED_RATIO = 0.25
+LABEL_TAGS = 3
+SAMPLE_SIZE = 3
+CENTROID_CACHE_USERS = 1000
+
+_centroids = OrderedDict()
+_building = {}
+
+
+def _normalize(m: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    return m / np.where(norms == 0, 1, norms)
+
+
+def choose_k(n: int) -> int:
+    return max(2, min(SUGGEST_MAX_K, int(round(math.sqrt(n / 2)))))
+
+
+def label_clusters(labels: np.ndarray, tags: list, k: int) -> list:
+    """Top LABEL_TAGS tags per cluster, by in-cluster count x inverse library frequency."""
+    library = Counter(t for doc_tags in tags for t in set(doc_tags))
+    per_cluster = [Counter() for _ in range(k)]
+    for cluster, doc_tags in zip(labels.tolist(), tags):
+        per_cluster[cluster].update(set(doc_tags))
+    n = len(tags)
+    return [
+        [t for t, _ in sorted(
+            counts.items(),
+            key=lambda item: item[1] * math.log(1 + n / library[item[0]]),
+            reverse=True,
+        )[:LABEL_TAGS]]
+        for counts in per_cluster
+    ]
+
+
+def fit(vectors: np.ndarray, tags: list, seed: int = 0) -> dict:
+    """Clusters normalized vectors; CPU-bound, run it in an executor."""
+    from sklearn.cluster import MiniBatchKMeans
+
+    km = MiniBatchKMeans(n_clusters=choose_k(len(vectors)), batch_size=1024, n_init=3, random_state=seed)
+    labels = km.fit_predict(vectors)
+
+    # k is a guess; clusters that end up with the same label are one topic split in two.
+    keys = [tuple(label) or ("#", c) for c, label in enumerate(label_clusters(labels, tags, km.n_clusters))]
+    merged = {}
+    for key in keys:
+        merged.setdefault(key, len(merged))
+    labels = np.array([merged[key] for key in keys])[labels]
+    k = len(merged)
+
+    sums = np.zeros((k, vectors.shape[1]), dtype=np.float64)
+    np.add.at(sums, labels, vectors)
+    centroids = _normalize(sums).astype(np.float32)
+    sizes = np.bincount(labels, minlength=k)
+    # The members closest to each centroid show what the cluster is about.
+    closeness = np.einsum("ij,ij->i", vectors, centroids[labels])
+    samples = []
+    for c in range(k):
+        members = np.flatnonzero(labels == c)
+        samples.append(members[np.argsort(-closeness[members])[:SAMPLE_SIZE]].tolist())
+    return {
+        "labels": labels,
+        "centroids": centroids,
+        "sizes": sizes.tolist(),
+        "tags": label_clusters(labels, tags, k),
+        "samples": samples,
+    }
+
+
+async def rebuild(user_id: str):
+    started = time.perf_counter()
+    uid = ObjectId(user_id)
+    docs = await db.bookmarks.find(
+        {"user_id": uid, "embedding": {"$exists": True}},
+        {"embedding": 1, "tags": 1, "title": 1, "url": 1},
+    ).to_list()
+    if len(docs) < SUGGEST_MIN_LIBRARY:
+        await db.suggestions.delete_one({"_id": uid})
+        return None
+    vectors = _normalize(np.array([embedding_codec.decode(d["embedding"]) for d in docs], dtype=np.float32))
+    tags = [d.get("tags") or [] for d in docs]
+    model = await asyncio.get_running_loop().run_in_executor(None, fit, vectors, tags)
+
+    members = {}
+    for doc, cluster in zip(docs, model["labels"].tolist()):
+        members.setdefault(cluster, []).append(doc["_id"])
+    ops = [
+        UpdateMany({"_id": {"$in": ids[i:i + 1000]}, "user_id": uid}, {"$set": {"cluster": cluster}})
+        for cluster, ids in members.items()
+        for i in range(0, len(ids), 1000)
+    ]
+    if ops:
+        await db.bookmarks.bulk_write(ops, ordered=False)
+
+    built_at = datetime.utcnow()
+    clusters = [
+        {
+            "id": c,
+            "label": " / ".join(model["tags"][c]) or f"Group {c + 1}",
+            "tags": model["tags"][c],
+            "size": model["sizes"][c],
+            "sample": [
+                {"_id": docs[i]["_id"], "title": docs[i].get("title"), "url": docs[i].get("url")}
+                for i in model["samples"][c]
+            ],
+        }
+        for c in range(len(model["sizes"]))
+    ]
+    await db.suggestions.replace_one(
+        {"_id": uid},
+        {
+            "built_at": built_at,
+            "built_size": len(docs),
+            "added_since": 0,
+            "dim": int(vectors.shape[1]),
+            "centroids": Binary(model["centroids"].tobytes()),
+            "clusters": clusters,
+            "build_seconds": round(time.perf_counter() - started, 3),
+        },
+        upsert=True,
+    )
+    _centroids.pop(user_id, None)
+    print(f"Clustered {len(docs)} bookmarks for {user_id} into {len(clusters)} groups")
+    return built_at
+
+
+def schedule_rebuild(user_id: str):
+    """Starts a background rebuild unless one is already running for this user."""
+    user_id = str(user_id)
+    task = _building.get(user_id)
+    if task is not None and not task.done():
+        return
+    task = _building[user_id] = asyncio.create_task(rebuild(user_id))
+    task.add_done_callback(lambda t: _building.pop(user_id, None) if _building.get(user_id) is t else None)
+
+
+def is_building(user_id: str) -> bool:
+    task = _building.get(str(user_id))
+    return task is not None and not task.done()
+
+
+def _is_stale(model: dict) -> bool:
+    if model["added_since"] > ADDED_RATIO * model["built_size"]:
+        return True
+    return datetime.utcnow() - model["built_at"] > timedelta(hours=SUGGEST_MAX_AGE_HOURS)
+
+
+async def get_suggestions(user_id: str, min_size: int = SUGGEST_MIN_SIZE) -> dict:
+    """The stored suggestions, scheduling a rebuild when missing or stale."""
+    model = await db.suggestions.find_one({"_id": ObjectId(user_id)}, {"centroids": 0})
+    if model is None or _is_stale(model):
+        schedule_rebuild(user_id)
+    if model is None:
+        return {"status": "building" if is_building(user_id) else "empty", "suggestions": []}
+    clusters = sorted(
+        (c for c in model["clusters"] if c["size"] >= min_size),
+        key=lambda c: c["size"],
+        reverse=True,
+    )
+    return {
+        "status": "rebuilding" if is_building(user_id) else "ready",
+        "built_at": model["built_at"],
+        "suggestions": clusters,
+    }
+
+
+async def _get_centroids(uid: ObjectId):
+    user_id = str(uid)
+    model = await db.suggestions.find_one({"_id": uid}, {"built_at": 1})
+    if model is None:
+        return None
+    cached = _centroids.get(user_id)
+    if cached is None or cached[0] != model["built_at"]:
+        full = await db.suggestions.find_one({"_id": uid}, {"built_at": 1, "centroids": 1, "dim": 1})
+        if full is None:
+            return None
+        matrix = np.frombuffer(full["centroids"], dtype=np.float32).reshape(-1, full["dim"])
+        cached = _centroids[user_id] = (full["built_at"], matrix)
+        while len(_centroids) > CENTROID_CACHE_USERS:
+            _centroids.popitem(last=False)
+    _centroids.move_to_end(user_id)
+    return cached[1]
+
+
+async def assign(user_id, docs: list, embeddings: list):
+    """
+    Files new or re-embedded bookmarks under their nearest centroid.
+    docs carry _id and, for re-embeds, the previous `cluster`. Errors are
+    logged, never raised.
+    """
+    if not docs:
+        return
+    uid = ObjectId(user_id)
+    try:
+        centroids = await _get_centroids(uid)
+        if centroids is None or centroids.shape[1] != len(embeddings[0]):
+            return
+        nearest = (_normalize(np.asarray(embeddings, dtype=np.float32)) @ centroids.T).argmax(axis=1).tolist()
+        by_cluster = {}
+        inc = Counter()
+        for doc, cluster in zip(docs, nearest):
+            by_cluster.setdefault(cluster, []).append(ObjectId(doc["_id"]))
+            inc[f"clusters.{cluster}.size"] += 1
+            if doc.get("cluster") is not None:
+                inc[f"clusters.{doc['cluster']}.size"] -= 1
+            else:
+                inc["added_since"] += 1
+        await db.bookmarks.bulk_write(
+            [UpdateMany({"_id": {"$in": ids}, "user_id": uid}, {"$set": {"cluster": c}}) for c, ids in by_cluster.items()],
+            ordered=False,
+        )
+        await db.suggestions.update_one({"_id": uid}, {"$inc": {k: v for k, v in inc.items() if v}})
+    except Exception as e:
+        print(f"Cluster assignment failed for user {user_id}: {e}")
+
+
+async def unassign(user_id, docs: list):
+    """Shrinks the clusters of deleted bookmarks; errors are logged, never raised."""
+    inc = Counter()
+    for doc in docs:
+        if doc.get("cluster") is not None:
+            inc[f"clusters.{doc['cluster']}.size"] -= 1
+    if not inc:
+        return
+    try:
+        await db.suggestions.update_one({"_id": ObjectId(user_id)}, {"$inc": dict(inc)})
+    except Exception as e:
+        print(f"Cluster update failed for user {user_id}: {e}")
@@ -1,8 +1,47 @@
 # ml/embedding.py
-from sentence_transformers import SentenceTransformer
+# The single SentenceTransformer instance shared by search embeddings and
+# KeyBERT tagging (ml/tags.py); both go through the same batcher.
+# The model is loaded on first use (or by warm_up() at startup) so that
+# importing the app stays cheap for routes that never touch it. Which
+# runtime encodes (fp32 torch, int8 torch, ONNX) is ENCODER_BACKEND; see
+# ml/encoders.py.
+import threading
+import time
+
+from ml.batcher import EmbeddingBatcher
+from ml.encoders import ENCODER_BACKEND, load_encoder
+
+MODEL_NAME = "paraphrase-MiniLM-L3-v2"
+
+_model = None
+_model_lock = threading.Lock()
+model_ready = threading.Event()
+load_seconds = None
+
+
+def get_model():
+    global _model, load_seconds
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                started = time.perf_counter()
+                _model = load_encoder(MODEL_NAME)
+                load_seconds = time.perf_counter() - started
+                model_ready.set()
+                print(f"Loaded {MODEL_NAME} ({ENCODER_BACKEND}) in {load_seconds:.2f}s")
+    return _model
+
+
+batcher = EmbeddingBatcher(lambda texts: get_model().encode(texts, batch_size=len(texts)))
+
+
+def document_text(title: str, description: str) -> str:
+    return f"{title} {description}".strip()
 
-model = SentenceTransformer("paraphrase-MiniLM-L3-v2")
 
 def get_embedding(title: str = "", description: str = ""):
-    text = f"{title} {description}".strip()
-    return model.encode(text).tolist()
+    return batcher.encode(document_text(title, description)).tolist()
+
+
+async def get_embedding_async(title: str = "", description: str = ""):
+    return (await batcher.encode_async(document_text(title, description))).tolist()
@@ -0,0 +1,137 @@
+# ml/encoders.py
+"""
+CPU encoder backends for the shared embedding model, selected with
+ENCODER_BACKEND:
+
+  torch       SentenceTransformer in fp32 (the default; what stored
+              embeddings were produced with)
+  torch-int8  the same model with its nn.Linear layers dynamically
+              quantized to int8 (torch.quantization.quantize_dynamic)
+  onnx        the transformer exported once to ONNX under ENCODER_ONNX_DIR
+              and run by onnxruntime, with mean pooling in NumPy; needs
+              the optional `onnx` and `onnxruntime` packages
+
+ENCODER_THREADS sets the intra-op thread count (0 keeps the library
+default). Every backend exposes encode(texts, batch_size) -> float32
+array, so ml/embedding.py and its batcher do not care which one runs.
+Check a backend against stored vectors with scripts/check_encoder_parity.py
+before switching, and time it with scripts/bench_encoder.py.
+"""
+import os
+
+import numpy as np
+
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "torch")
+ENCODER_THREADS = int(os.getenv("ENCODER_THREADS", "0"))
+ENCODER_ONNX_DIR = os.getenv("ENCODER_ONNX_DIR", "model_data")
+
+
+def _set_torch_threads():
+    if ENCODER_THREADS:
+        import torch
+        torch.set_num_threads(ENCODER_THREADS)
+
+
+class TorchEncoder:
+    name = "torch"
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+        _set_torch_threads()
+        self.model = SentenceTransformer(model_name, device="cpu")
+
+    def encode(self, texts, batch_size: int = 32) -> np.ndarray:
+        return np.asarray(self.model.encode(list(texts), batch_size=batch_size, convert_to_numpy=True), dtype=np.float32)
+
+
+class QuantizedTorchEncoder(TorchEncoder):
+    name = "torch-int8"
+
+    def __init__(self, model_name: str):
+        super().__init__(model_name)
+        import torch
+        # Weights are stored as int8; activations are quantized per batch at run time.
+        torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def _onnx_path(model_name: str) -> str:
+    return os.path.join(ENCODER_ONNX_DIR, model_name.replace("/", "__") + ".onnx")
+
+
+def export_onnx(model, model_name: str) -> str:
+    """Exports the SentenceTransformer's transformer module once; returns the file path."""
+    path = _onnx_path(model_name)
+    if os.path.exists(path):
+        return path
+    import torch
+
+    transformer = model[0].auto_model.eval()
+    sample = model.tokenizer(["export"], return_tensors="pt")
+    # Positional order of BertModel.forward and friends.
+    inputs = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+    axes = {n: {0: "batch", 1: "sequence"} for n in inputs + ["last_hidden_state"]}
+    os.makedirs(ENCODER_ONNX_DIR, exist_ok=True)
+    tmp = path + ".tmp"
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[n] for n in inputs),
+            tmp,
+            input_names=inputs,
+            output_names=["last_hidden_state"],
+            dynamic_axes=axes,
+            opset_version=17,
+        )
+    os.replace(tmp, path)
+    print(f"Exported {model_name} to {path}")
+    return path
+
+
+class OnnxEncoder:
+    name = "onnx"
+
+    def __init__(self, model_name: str):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise RuntimeError("ENCODER_BACKEND=onnx needs the onnx and onnxruntime packages")
+        from sentence_transformers import SentenceTransformer
+
+        model = SentenceTransformer(model_name, device="cpu")
+        pooling = model[1] if len(model) > 1 else None
+        if len(model) != 2 or not getattr(pooling, "pooling_mode_mean_tokens", False):
+            raise RuntimeError(f"ENCODER_BACKEND=onnx supports mean-pooled models only, not {model_name}")
+        self.tokenizer = model.tokenizer
+        self.max_length = model.max_seq_length
+        path = export_onnx(model, model_name)
+        del model
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if ENCODER_THREADS:
+            options.intra_op_num_threads = ENCODER_THREADS
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.inputs = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, texts, batch_size: int = 32) -> np.ndarray:
+        texts = list(texts)
+        out = []
+        for i in range(0, len(texts), batch_size):
+            enc = self.tokenizer(
+                texts[i:i + batch_size], padding=True, truncation=True,
+                max_length=self.max_length, return_tensors="np",
+            )
+            hidden = self.session.run(None, {k: v.astype(np.int64) for k, v in enc.items() if k in self.inputs})[0]
+            mask = enc["attention_mask"][..., None].astype(np.float32)
+            out.append((hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None))
+        return np.concatenate(out).astype(np.float32) if out else np.empty((0, 0), dtype=np.float32)
+
+
+BACKENDS = {cls.name: cls for cls in (TorchEncoder, QuantizedTorchEncoder, OnnxEncoder)}
+
+
+def load_encoder(model_name: str, backend: str = None):
+    backend = backend or ENCODER_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown ENCODER_BACKEND {backend!r}; expected one of {', '.join(BACKENDS)}")
+    return BACKENDS[backend](model_name)
@@ -0,0 +1,35 @@
+# ml/enrich.py
+"""
+Tags and embedding for a bookmark from a single document encode.
+
+The document vector computed for search is handed to KeyBERT as
+doc_embeddings, so only the candidate keywords are encoded on top of it
+(as one batch through the shared model).
+"""
+import asyncio
+
+from ml.embedding import batcher, document_text
+from ml.tags import extract_tags
+
+
+def enrich(title: str = "", description: str = ""):
+    """Returns (tags, embedding) for a bookmark."""
+    text = document_text(title, description)
+    embedding = batcher.encode(text)
+    return extract_tags(text, embedding), embedding.tolist()
+
+
+async def enrich_async(title: str = "", description: str = ""):
+    text = document_text(title, description)
+    embedding = await batcher.encode_async(text)
+    loop = asyncio.get_running_loop()
+    tags = await loop.run_in_executor(None, extract_tags, text, embedding)
+    return tags, embedding.tolist()
+
+
+def warm_up():
+    """Loads the model and tagger and runs one enrich so first requests are fast."""
+    try:
+        enrich("ResourceNest", "warm up the embedding model and keyword extractor")
+    except Exception as e:
+        print(f"Model warm-up failed: {e}")
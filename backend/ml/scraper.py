@@ -1,34 +1,173 @@
-# utils/scraper.py
-import requests
-from bs4 import BeautifulSoup
+# ml/scraper.py
+"""
+Async link fetcher: health check and page metadata from one GET.
+
+All fetches share one keep-alive httpx.AsyncClient, are limited per host,
+and stream only until the <head> has been parsed (or SCRAPE_MAX_BYTES was
+read), so large pages cost a few KB instead of a full download.
+"""
+import asyncio
+import codecs
+import os
+from contextlib import asynccontextmanager
+from html.parser import HTMLParser
 from urllib.parse import urlparse
 
+import httpx
+
+SCRAPE_TIMEOUT = float(os.getenv("SCRAPE_TIMEOUT", "10"))
+SCRAPE_MAX_BYTES = int(os.getenv("SCRAPE_MAX_BYTES", str(64 * 1024)))
+SCRAPE_PER_HOST = int(os.getenv("SCRAPE_PER_HOST", "4"))
+SCRAPE_MAX_CONNECTIONS = int(os.getenv("SCRAPE_MAX_CONNECTIONS", "100"))
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36"
+}
+# Error statuses that still prove the server is up (auth walls, bot blocks,
+# HEAD/GET restrictions, rate limiting), so the link is not reported broken.
+ALIVE_ERROR_STATUSES = {401, 403, 405, 429}
+
+_client = None
+# host -> [semaphore, fetches holding or waiting for it]; dropped when idle.
+_host_limits = {}
+
+
 def clean_url(url: str):
     if not url.startswith("http://") and not url.startswith("https://"):
         return "https://" + url
     return url
-def scrape_metadata(url: str) -> dict:
+
+
+class HeadParser(HTMLParser):
+    """Incremental parser that picks <title> and meta descriptions out of <head>."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = ""
+        self.description = ""
+        self.og_description = ""
+        self.done = False
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "title":
+            self._in_title = True
+        elif tag == "meta":
+            a = {k.lower(): (v or "") for k, v in attrs}
+            if a.get("name", "").lower() == "description":
+                self.description = self.description or a.get("content", "")
+            elif a.get("property", "").lower() == "og:description":
+                self.og_description = self.og_description or a.get("content", "")
+        elif tag == "body":
+            self.done = True
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+        elif tag == "head":
+            self.done = True
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+
+
+@asynccontextmanager
+async def _host_slot(host: str):
+    """Limits concurrent fetches per host without keeping every host ever seen."""
+    entry = _host_limits.get(host)
+    if entry is None:
+        entry = _host_limits[host] = [asyncio.Semaphore(SCRAPE_PER_HOST), 0]
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            del _host_limits[host]
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            headers=HEADERS,
+            timeout=SCRAPE_TIMEOUT,
+            follow_redirects=True,
+            limits=httpx.Limits(
+                max_connections=SCRAPE_MAX_CONNECTIONS,
+                max_keepalive_connections=SCRAPE_MAX_CONNECTIONS // 4,
+            ),
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def _read_head(response: httpx.Response) -> HeadParser:
+    parser = HeadParser()
+    try:
+        decoder = codecs.getincrementaldecoder(response.charset_encoding or "utf-8")(errors="replace")
+    except LookupError:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    read = 0
+    async for chunk in response.aiter_bytes():
+        parser.feed(decoder.decode(chunk))
+        read += len(chunk)
+        if parser.done or read >= SCRAPE_MAX_BYTES:
+            break
+    return parser
+
+
+def link_status(status_code) -> str:
+    if status_code is None:
+        return "broken"
+    if status_code < 400 or status_code in ALIVE_ERROR_STATUSES:
+        return "alive"
+    return "broken"
+
+
+async def fetch_link(url: str, etag: str = None, last_modified: str = None, read_metadata: bool = True) -> dict:
+    """
+    Fetches url once and returns its HTTP status, final URL after redirects,
+    title, description, caching validators and a health verdict ("alive" or
+    "broken"). Network errors count as broken.
+
+    Passing etag/last_modified makes the request conditional; a 304 counts
+    as alive. read_metadata=False skips reading the body entirely.
+    """
+    result = {
+        "status_code": None,
+        "final_url": url,
+        "title": url,
+        "description": "",
+        "etag": None,
+        "last_modified": None,
+    }
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
     try:
-        headers = {"User-Agent": "Mozilla/5.0"}
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, "html.parser")
-
-        title = soup.title.string.strip() if soup.title and soup.title.string else url
-        description = ""
-        if soup.find("meta", attrs={"name": "description"}):
-            description = soup.find("meta", attrs={"name": "description"}).get("content", "")
-        elif soup.find("meta", attrs={"property": "og:description"}):
-            description = soup.find("meta", attrs={"property": "og:description"}).get("content", "")
-
-        return {
-            "title": title or url,
-            "description": description.strip()
-        }
+        async with _host_slot(urlparse(url).hostname or ""):
+            async with get_client().stream("GET", url, headers=headers) as response:
+                result["status_code"] = response.status_code
+                result["final_url"] = str(response.url)
+                result["etag"] = response.headers.get("etag")
+                result["last_modified"] = response.headers.get("last-modified")
+                if read_metadata and response.is_success:
+                    head = await _read_head(response)
+                    result["title"] = " ".join(head.title.split()) or url
+                    result["description"] = (head.description or head.og_description).strip()
     except Exception as e:
-        print(f"Scraping failed for {url}: {e}")
-        return {
-            "title": url,
-            "description": "",
-        }
+        print(f"Fetching failed for {url}: {e}")
 
+    result["status"] = link_status(result["status_code"])
+    return result
@@ -1,7 +1,34 @@
 # ml/tags.py
-from keybert import KeyBERT
+import threading
 
-tagger = KeyBERT("paraphrase-MiniLM-L3-v2")
+import numpy as np
 
-def extract_tags(text: str):
-    return [kw[0] for kw in tagger.extract_keywords(text, top_n=5)]
+from ml.embedding import batcher
+
+_tagger = None
+_tagger_lock = threading.Lock()
+
+
+def get_tagger():
+    global _tagger
+    if _tagger is None:
+        with _tagger_lock:
+            if _tagger is None:
+                from keybert import KeyBERT
+                from keybert.backend import BaseEmbedder
+
+                class SharedEmbedder(BaseEmbedder):
+                    """Sends KeyBERT's candidate encodes through the shared model's batcher."""
+
+                    def embed(self, documents, verbose=False):
+                        return np.asarray(batcher.submit(documents).result())
+
+                _tagger = KeyBERT(model=SharedEmbedder())
+    return _tagger
+
+
+def extract_tags(text: str, doc_embedding=None):
+    kwargs = {}
+    if doc_embedding is not None:
+        kwargs["doc_embeddings"] = np.asarray(doc_embedding).reshape(1, -1)
+    return [kw[0] for kw in get_tagger().extract_keywords(text, top_n=5, **kwargs)]
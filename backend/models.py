@@ -1,5 +1,6 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
+from datetime import datetime
 
 
 class User(BaseModel):
@@ -19,12 +20,29 @@ class Bookmark(BaseModel):
 class SearchQuery(BaseModel):
     query: str
     limit: int = 20
+    nprobe: Optional[int] = Field(None, ge=1)
+    mode: Literal["hybrid", "semantic", "lexical"] = "hybrid"
+    # Filters, applied before scoring
+    tags: List[str] = []
+    collection_id: Optional[str] = None
+    is_broken: Optional[bool] = None
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
 
 
 class ShareRequest(BaseModel):
     bookmark_ids: List[str]
 
 
+class MergeGroup(BaseModel):
+    keep: str
+    duplicates: List[str]
+
+
+class MergeRequest(BaseModel):
+    groups: List[MergeGroup]
+
+
 class CollectionInput(BaseModel):
     name: str
     bookmark_ids: List[str]
\ No newline at end of file
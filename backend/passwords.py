@@ -0,0 +1,80 @@
+# passwords.py
+"""
+bcrypt hashing off the event loop and off the shared threadpool.
+
+Hashes and verifications run in a dedicated process pool, so a burst of
+logins neither holds the GIL nor occupies the threads that other requests
+use. At most PASSWORD_MAX_PENDING operations are admitted at once; beyond
+that callers get a 503 with Retry-After instead of queueing without bound.
+
+Keep imports here light: every spawned worker imports this module.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_MAX_PENDING = int(os.getenv("PASSWORD_MAX_PENDING", str(PASSWORD_WORKERS * 16)))
+
+_pool = None
+_pool_lock = threading.Lock()
+stats = {"pending": 0, "completed": 0, "rejected": 0}
+
+
+def hash_pass(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_pass(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the parent has an event loop, Mongo and model threads.
+            _pool = ProcessPoolExecutor(PASSWORD_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+async def _run(fn, *args):
+    if stats["pending"] >= PASSWORD_MAX_PENDING:
+        stats["rejected"] += 1
+        raise HTTPException(status_code=503, detail="Too many sign-ins in progress, retry shortly", headers={"Retry-After": "1"})
+    stats["pending"] += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_pool(), fn, *args)
+    finally:
+        stats["pending"] -= 1
+        stats["completed"] += 1
+
+
+async def hash_pass_async(password: str) -> str:
+    return await _run(hash_pass, password)
+
+
+async def verify_pass_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run(verify_pass, plain_password, hashed_password)
+
+
+def warm_up():
+    """Starts the worker processes so the first login does not pay for it."""
+    pool = _get_pool()
+    for future in [pool.submit(os.getpid) for _ in range(PASSWORD_WORKERS)]:
+        future.result()
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
@@ -0,0 +1,42 @@
+# responses.py
+"""
+JSON responses for Mongo documents.
+
+orjson serializes dicts, lists, datetimes and numpy arrays natively in one
+pass; ObjectIds go through `_default` and become their hex string, and
+packed embedding vectors become number arrays. Routes that return
+documents return a MongoJSONResponse directly, which skips FastAPI's
+jsonable_encoder walk as well as the old convert_objectid_to_str copy.
+"""
+import orjson
+from bson import ObjectId
+from bson.binary import Binary, VECTOR_SUBTYPE
+from bson.decimal128 import Decimal128
+from fastapi.responses import JSONResponse
+
+from search import embedding_codec
+
+OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, Binary) and obj.subtype == VECTOR_SUBTYPE:
+        return embedding_codec.decode(obj)
+    if isinstance(obj, Decimal128):
+        return str(obj.to_decimal())
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=_default, option=OPTIONS)
+
+
+class MongoJSONResponse(JSONResponse):
+    """JSONResponse that accepts raw Mongo documents (ObjectId, datetime, numpy)."""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -1,34 +1,33 @@
-from fastapi import APIRouter, Header, HTTPException, Depends
-from db import db
-from utils import decode_token
+from fastapi import APIRouter, Depends
+from utils import require_admin
+from ml.embedding import batcher
+from ml.encoders import ENCODER_BACKEND
+from workers import link_checker, stats
+from routes.auth import login_stats
+import passwords
 
 admin = APIRouter()
 
-# Check if the requester is an admin user
-def is_admin(authorization: str = Header(...)):
-    try:
-        token = authorization.replace("Bearer ", "")
-        payload = decode_token(token)
-        if not payload.get("admin"):
-            raise HTTPException(status_code=403, detail="Admin access only")
-        return True
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
 @admin.get("/admin/analytics")
-def get_analytics(admin_auth=Depends(is_admin)):
-    total_users = db.users.count_documents({})
-    total_bookmarks = db.bookmarks.count_documents({})
-    top_tags = list(
-        db.bookmarks.aggregate([
-            {"$unwind": "$tags"},
-            {"$group": {"_id": "$tags", "count": {"$sum": 1}}},
-            {"$sort": {"count": -1}},
-            {"$limit": 10}
-        ])
-    )
+async def get_analytics(admin_auth=Depends(require_admin)):
+    """Dashboard totals, top tags and daily series, read from the materialized stats."""
+    return await stats.get_dashboard()
+
+@admin.post("/admin/analytics/reconcile")
+async def reconcile_analytics(admin_auth=Depends(require_admin)):
+    return await stats.reconcile()
+
+@admin.get("/admin/embedding_stats")
+async def get_embedding_stats(admin_auth=Depends(require_admin)):
+    return {**batcher.stats(), "encoder_backend": ENCODER_BACKEND}
+
+@admin.get("/admin/link_checker")
+async def get_link_checker_metrics(admin_auth=Depends(require_admin)):
+    return await link_checker.get_metrics()
+
+@admin.get("/admin/auth_stats")
+async def get_auth_stats(admin_auth=Depends(require_admin)):
     return {
-        "total_users": total_users,
-        "total_bookmarks": total_bookmarks,
-        "top_tags": top_tags
+        "login_latency": login_stats.summary(),
+        "password_pool": {**passwords.stats, "workers": passwords.PASSWORD_WORKERS, "max_pending": passwords.PASSWORD_MAX_PENDING},
     }
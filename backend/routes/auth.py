@@ -1,29 +1,45 @@
 from fastapi import APIRouter, HTTPException
 from models import User
 from db import db
-from utils import hash_pass, verify_pass, create_token
-from bson import ObjectId
+from passwords import hash_pass_async, verify_pass_async
+from utils import LatencyStats, create_token
+from pymongo.errors import DuplicateKeyError
+from workers import stats
+import time
 
 auth = APIRouter()
 
+# End-to-end /login and /admin/login durations, reported by /admin/auth_stats.
+login_stats = LatencyStats()
+
 @auth.post("/register")
-def register(user: User):
-    if db.users.find_one({"email": user.email}):
+async def register(user: User):
+    if await db.users.find_one({"email": user.email}):
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    db.users.insert_one({
-        "email": user.email,
-        "password_hash": hash_pass(user.password),
-        "is_admin": False
-    })
+    password_hash = await hash_pass_async(user.password)
+    try:
+        await db.users.insert_one({
+            "email": user.email,
+            "password_hash": password_hash,
+            "is_admin": False
+        })
+    except DuplicateKeyError:
+        # Lost a race with a concurrent registration; the unique email index decides.
+        raise HTTPException(status_code=400, detail="Email already registered")
+    await stats.on_user_created()
 
     return {"msg": "Registration successful"}
 
 @auth.post("/login")
-def login(user: User):
-    record = db.users.find_one({"email": user.email})
-    if not record or not verify_pass(user.password, record["password_hash"]):
-        raise HTTPException(status_code=401, detail="Invalid email or password")
+async def login(user: User):
+    started = time.perf_counter()
+    try:
+        record = await db.users.find_one({"email": user.email})
+        if not record or not await verify_pass_async(user.password, record["password_hash"]):
+            raise HTTPException(status_code=401, detail="Invalid email or password")
+    finally:
+        login_stats.record(time.perf_counter() - started)
 
     token = create_token(str(record["_id"]), record.get("is_admin", False))
     return {
@@ -36,10 +52,14 @@ def login(user: User):
     }
 
 @auth.post("/admin/login")
-def admin_login(user: User):
-    record = db.users.find_one({"email": user.email, "is_admin": True})
-    if not record or not verify_pass(user.password, record["password_hash"]):
-        raise HTTPException(status_code=401, detail="Invalid admin credentials")
+async def admin_login(user: User):
+    started = time.perf_counter()
+    try:
+        record = await db.users.find_one({"email": user.email, "is_admin": True})
+        if not record or not await verify_pass_async(user.password, record["password_hash"]):
+            raise HTTPException(status_code=401, detail="Invalid admin credentials")
+    finally:
+        login_stats.record(time.perf_counter() - started)
 
     token = create_token(str(record["_id"]), True)
     return {
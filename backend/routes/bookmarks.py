@@ -1,153 +1,318 @@
-from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from models import Bookmark, SearchQuery, ShareRequest
 from db import db
-from utils import decode_token, normalize_url, convert_objectid_to_str
-from ml.embedding import get_embedding
-from ml.tags import extract_tags
-from ml.scraper import scrape_metadata
-from bson import ObjectId
-from sklearn.metrics.pairwise import cosine_similarity
+from utils import canonical_url, get_user_id, normalize_url
+from utils import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, bookmark_projection, find_page
+from ml.embedding import get_embedding_async
+from ml.enrich import enrich_async
+from ml.scraper import fetch_link
+from ml import clustering
+from search import embedding_codec, lexical_index, tag_index, vector_index
+from workers import stats
+from responses import MongoJSONResponse
+import share_cache
+from bson import ObjectId, errors
+from pymongo import ReturnDocument
+from datetime import datetime
 import uuid
-from utils import check_url_health
+from typing import Optional
 
 book = APIRouter()
 
-def get_user_id(authorization: str = Header(...)):
-    try:
-        token = authorization.replace("Bearer ", "")
-        return decode_token(token)["sub"]
-    except:
-        raise HTTPException(401, "Invalid token")
+class PageParams:
+    """limit/cursor/fields query parameters shared by the listing endpoints."""
+
+    def __init__(self, limit: int, cursor: Optional[str], fields: Optional[str]):
+        self.limit = limit
+        self.cursor = cursor
+        self.projection = bookmark_projection(fields)
+
+    async def fetch(self, query: dict):
+        return await find_page(db.bookmarks, query, self.limit, self.cursor, self.projection)
+
+    async def respond(self, query: dict) -> MongoJSONResponse:
+        """One page as a JSON list, with the next cursor in X-Next-Cursor."""
+        docs, next_cursor = await self.fetch(query)
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+        return MongoJSONResponse(docs, headers=headers)
+
+
+# A coroutine rather than the class itself, so FastAPI does not resolve it in the threadpool.
+async def page_params(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+) -> PageParams:
+    return PageParams(limit, cursor, fields)
+
 
 @book.get("/bookmarks/")
-def get_all(user_id=Depends(get_user_id)):
-    raw_bookmarks = list(db.bookmarks.find({"user_id": ObjectId(user_id)}))
-    return convert_objectid_to_str(raw_bookmarks)
+async def get_all(page: PageParams = Depends(page_params), user_id=Depends(get_user_id)):
+    return await page.respond({"user_id": ObjectId(user_id)})
     
 @book.post("/bookmarks/add")
-def add(bm: Bookmark, user_id=Depends(get_user_id)):
+async def add(bm: Bookmark, user_id=Depends(get_user_id)):
     url = normalize_url(bm.url)
-    print(bm.description)
-    title = bm.title or url
-    description = bm.description or ""
-
-    # Only call scraper if description is missing
-    if not description:
-        scraped = scrape_metadata(url)
-        description = scraped.get("description", "")
-        title = title or scraped.get("title", url)
+    # One GET gives both the health verdict and any missing metadata
+    link = await fetch_link(url)
+    title = bm.title or link["title"]
+    description = bm.description or link["description"]
+    status = link["status"]
 
-    status = check_url_health(url)
-
-    emb = get_embedding(title, description)
-    tags = extract_tags(f"{title} {description}")
+    tags, emb = await enrich_async(title, description)
 
     data = bm.dict()
     data.update({
         "url": url,
+        "canonical_url": canonical_url(url),
         "title": title,
         "description": description,
         "user_id": ObjectId(user_id),
-        "embedding": emb,
+        "embedding": embedding_codec.encode(emb),
         "tags": tags,
         "status": status,
         "visit_count": 0,
         "is_broken": (status == "broken"),
+        "http_status": link["status_code"],
+        "final_url": link["final_url"],
+        "etag": link["etag"],
+        "last_modified": link["last_modified"],
         "shared": False,
-        "last_checked": None
+        "created_at": datetime.utcnow(),
+        "last_checked": datetime.utcnow(),
+        "updated_at": datetime.utcnow()
     })
     # Clean up
     data.pop("category", None)
-    db.bookmarks.insert_one(data)
+    res = await db.bookmarks.insert_one(data)
+    await vector_index.upsert(user_id, res.inserted_id, emb)
+    await lexical_index.upsert_many(user_id, [data])
+    await clustering.assign(user_id, [data], [emb])
+    await stats.on_bookmarks_added([data])
+    await tag_index.add_bookmarks(user_id, [data])
     return {"msg": "Added"}
 
 
 @book.put("/bookmarks/edit/{id}")
-def edit(id: str, bm: Bookmark, user_id=Depends(get_user_id)):
+async def edit(id: str, bm: Bookmark, user_id=Depends(get_user_id)):
     url = normalize_url(bm.url)
     title = bm.title.strip() if bm.title else ""
     description = bm.description.strip() if bm.description else ""
 
-    # Re-generate metadata if not provided
-    if not title or not description:
-        scraped_title, scraped_description = scrape_metadata(url)
-        title = title or scraped_title or url
-        description = description or scraped_description or ""
+    # Re-check the link and fill in any metadata that was not provided
+    link = await fetch_link(url)
+    title = title or link["title"]
+    description = description or link["description"]
+    status = link["status"]
 
-    tags = bm.tags if bm.tags else extract_tags(f"{title} {description}")
-    embedding = get_embedding(title, description)
-    status = check_url_health(url)
+    if bm.tags:
+        tags, embedding = bm.tags, await get_embedding_async(title, description)
+    else:
+        tags, embedding = await enrich_async(title, description)
 
     updated_data = {
         "url": url,
+        "canonical_url": canonical_url(url),
         "title": title,
         "description": description,
         "tags": tags or [],
-        "embedding": embedding,
+        "embedding": embedding_codec.encode(embedding),
         "shared": bm.shared,
         "status": status,
         "is_broken": (status == "broken"),
-        "last_checked": None
+        "http_status": link["status_code"],
+        "final_url": link["final_url"],
+        "etag": link["etag"],
+        "last_modified": link["last_modified"],
+        "last_checked": datetime.utcnow(),
+        "updated_at": datetime.utcnow()
     }
 
-    result = db.bookmarks.update_one(
+    before = await db.bookmarks.find_one_and_update(
         {"_id": ObjectId(id), "user_id": ObjectId(user_id)},
-        {"$set": updated_data}
+        {"$set": updated_data},
+        projection={"tags": 1, "is_broken": 1, "shared": 1, "cluster": 1},
+        return_document=ReturnDocument.BEFORE,
     )
-    if result.matched_count == 0:
+    if before is None:
         raise HTTPException(404, "Bookmark not found or not owned by user")
+    await vector_index.upsert(user_id, id, embedding)
+    await lexical_index.upsert_many(user_id, [{"_id": id, **updated_data}])
+    await clustering.assign(user_id, [{"_id": id, "cluster": before.get("cluster")}], [embedding])
+    await stats.on_bookmark_changed(before, updated_data)
+    await tag_index.apply(user_id, tag_index.tag_deltas(before.get("tags"), updated_data["tags"]))
+    await share_cache.touch([before.get("shared")])
     return {"msg": "Updated"}
 
 @book.delete("/bookmarks/delete/{id}")
-def delete(id: str, user_id=Depends(get_user_id)):
-    result = db.bookmarks.delete_one({"_id": ObjectId(id), "user_id": ObjectId(user_id)})
-    if result.deleted_count == 0:
+async def delete(id: str, user_id=Depends(get_user_id)):
+    deleted = await db.bookmarks.find_one_and_delete(
+        {"_id": ObjectId(id), "user_id": ObjectId(user_id)},
+        projection={"tags": 1, "is_broken": 1, "shared": 1, "cluster": 1},
+    )
+    if deleted is None:
         raise HTTPException(404, "Bookmark not found or not owned by user")
+    await vector_index.remove(user_id, id)
+    await lexical_index.remove(user_id, id)
+    await clustering.unassign(user_id, [deleted])
+    await stats.on_bookmarks_deleted([deleted])
+    await tag_index.remove_bookmarks(user_id, [deleted])
+    await share_cache.touch([deleted.get("shared")])
     return {"msg": "Deleted"}
 
 @book.post("/bookmarks/share")
-def share(req: ShareRequest, user_id=Depends(get_user_id)):
+async def share(req: ShareRequest, user_id=Depends(get_user_id)):
     share_id = str(uuid.uuid4())
-    db.bookmarks.update_many(
-        {"_id": {"$in": [ObjectId(bid) for bid in req.bookmark_ids]}, "user_id": ObjectId(user_id)},
-        {"$set": {"shared": share_id}}
-    )
+    query = {"_id": {"$in": [ObjectId(bid) for bid in req.bookmark_ids]}, "user_id": ObjectId(user_id)}
+    # Bookmarks move out of any share they were in; those pages change too.
+    previous = await db.bookmarks.distinct("shared", query)
+    await db.bookmarks.update_many(query, {"$set": {"shared": share_id, "updated_at": datetime.utcnow()}})
+    await share_cache.touch(previous + [share_id])
     return {"share_id": share_id}
 
 @book.get("/shared/{share_id}")
-def shared_bookmarks(share_id: str):
-    raw_shared = list(db.bookmarks.find({"shared": share_id}))
-    return convert_objectid_to_str(raw_shared)
+async def shared_bookmarks(share_id: str, request: Request, page: PageParams = Depends(page_params)):
+    """Public, cached listing of a share with ETag/Last-Modified validation (see share_cache.py)."""
+    async def fetch(projection):
+        return await find_page(db.bookmarks, {"shared": share_id}, page.limit, page.cursor, projection)
+
+    cached = await share_cache.get_page(share_id, page.limit, page.cursor, page.projection, fetch)
+    headers = {
+        "ETag": cached["etag"],
+        "Last-Modified": cached["last_modified"],
+        "Cache-Control": f"public, max-age={int(share_cache.SHARE_CACHE_TTL)}",
+    }
+    if cached["next_cursor"]:
+        headers["X-Next-Cursor"] = cached["next_cursor"]
+    if share_cache.is_fresh(cached, request.headers.get("if-none-match"), request.headers.get("if-modified-since")):
+        return Response(status_code=304, headers=headers)
+    return Response(cached["body"], media_type="application/json", headers=headers)
+
+# Reciprocal-rank fusion: score = sum of 1 / (RRF_K + rank) over the rankings.
+RRF_K = 60
+# Each ranking contributes this many hits (at least) to the fusion.
+HYBRID_DEPTH = 50
+
+
+async def _prefilter(q: SearchQuery, user_id: str) -> Optional[set]:
+    """Ids of the user's bookmarks passing the filters, or None when there are none."""
+    query = {"user_id": ObjectId(user_id)}
+    if q.tags:
+        query["tags"] = {"$all": q.tags}
+    if q.is_broken is not None:
+        query["is_broken"] = q.is_broken
+    created = {}
+    if q.created_after:
+        created["$gte"] = q.created_after
+    if q.created_before:
+        created["$lt"] = q.created_before
+    if created:
+        query["created_at"] = created
+    if q.collection_id:
+        try:
+            collection_id = ObjectId(q.collection_id)
+        except errors.InvalidId:
+            raise HTTPException(400, "Invalid ID format provided.")
+        coll = await db.collections.find_one(
+            {"_id": collection_id, "user_id": ObjectId(user_id)}, {"bookmarks": 1}
+        )
+        if coll is None:
+            raise HTTPException(404, "Collection not found")
+        query["_id"] = {"$in": coll.get("bookmarks", [])}
+    if len(query) == 1:
+        return None
+    return {str(d["_id"]) async for d in db.bookmarks.find(query, {"_id": 1})}
+
+
+def _fuse(rankings: dict, k: int) -> list:
+    fused = {}
+    for hits in rankings.values():
+        for rank, (bid, _) in enumerate(hits):
+            fused[bid] = fused.get(bid, 0.0) + 1.0 / (RRF_K + rank + 1)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+
 
 @book.post("/search")
-def search(q: SearchQuery, user_id=Depends(get_user_id)):
-    query_emb = get_embedding(q.query, "")
-    raw_bookmarks = list(db.bookmarks.find({"user_id": ObjectId(user_id)}))
-    bookmarks = convert_objectid_to_str(raw_bookmarks)
-
-    scored = [
-        (cosine_similarity([query_emb], [bm["embedding"]])[0][0], bm)
-        for bm in bookmarks if "embedding" in bm
-    ]
-    scored.sort(reverse=True, key=lambda x: x[0])
-    return [bm for _, bm in scored[:q.limit]]
+async def search(q: SearchQuery, user_id=Depends(get_user_id)):
+    """
+    mode=semantic ranks by embedding similarity, mode=lexical by BM25 over
+    title, description, tags and host, and mode=hybrid (the default) fuses
+    both rankings. Filters narrow the candidates before anything is scored.
+    """
+    candidates = await _prefilter(q, user_id)
+    if candidates is not None and not candidates:
+        return MongoJSONResponse([])
+
+    depth = q.limit if q.mode != "hybrid" else max(q.limit, HYBRID_DEPTH)
+    rankings = {}
+    if q.mode != "lexical":
+        query_emb = await get_embedding_async(q.query, "")
+        rankings["similarity_score"] = await vector_index.search(user_id, query_emb, depth, q.nprobe, candidates)
+    if q.mode != "semantic":
+        rankings["lexical_score"] = await lexical_index.search(user_id, q.query, depth, candidates)
+    hits = _fuse(rankings, q.limit) if q.mode == "hybrid" else next(iter(rankings.values()))
+    if not hits:
+        return MongoJSONResponse([])
+
+    # Only the winning documents are fetched; embeddings stay server-side.
+    docs = {
+        str(doc["_id"]): doc
+        async for doc in db.bookmarks.find(
+            {"_id": {"$in": [ObjectId(bid) for bid, _ in hits]}, "user_id": ObjectId(user_id)},
+            {"embedding": 0},
+        )
+    }
+    component = {name: dict(ranked) for name, ranked in rankings.items()}
+    results = []
+    for bid, score in hits:
+        doc = docs.get(bid)
+        if doc:
+            for name, scores in component.items():
+                if bid in scores:
+                    doc[name] = scores[bid]
+            if q.mode == "hybrid":
+                doc["score"] = score
+            results.append(doc)
+    return MongoJSONResponse(results)
 
 @book.get("/bookmarks/broken")
-def get_broken_bookmarks(user_id=Depends(get_user_id), tag: str = Query(None)):
+async def get_broken_bookmarks(user_id=Depends(get_user_id), tag: str = Query(None), page: PageParams = Depends(page_params)):
     query = {"user_id": ObjectId(user_id), "is_broken": True}
     if tag:
         query["tags"] = tag
-    broken = list(db.bookmarks.find(query))
-    count = len(broken)
-    return {
+    broken, next_cursor = await page.fetch(query)
+    count = await db.bookmarks.count_documents(query)
+    return MongoJSONResponse({
         "count": count,
-        "bookmarks": convert_objectid_to_str(broken)
-    }
+        "bookmarks": broken,
+        "next_cursor": next_cursor
+    })
 
 @book.get("/bookmarks/tag/{tag}")
-def get_bookmarks_by_tag(tag: str, user_id=Depends(get_user_id)):
-    bookmarks = list(db.bookmarks.find({
+async def get_bookmarks_by_tag(tag: str, page: PageParams = Depends(page_params), user_id=Depends(get_user_id)):
+    return await page.respond({
         "user_id": ObjectId(user_id),
         "tags": tag
-    }))
-    return convert_objectid_to_str(bookmarks)
+    })
+
+@book.get("/bookmarks/tags")
+async def get_bookmarks_by_tags(
+    tags: str = Query(..., description="Comma-separated tags"),
+    mode: str = Query("and", pattern="^(and|or)$"),
+    page: PageParams = Depends(page_params),
+    user_id=Depends(get_user_id),
+):
+    """Bookmarks carrying all (mode=and) or any (mode=or) of the given tags."""
+    wanted = list(dict.fromkeys(t.strip() for t in tags.split(",") if t.strip()))
+    if not wanted:
+        raise HTTPException(400, "No tags given")
+    if mode == "or":
+        return await page.respond({"user_id": ObjectId(user_id), "tags": {"$in": wanted}})
+
+    counts = await tag_index.counts(user_id, wanted)
+    if len(counts) < len(wanted):
+        # A tag the user never used: nothing can match all of them.
+        return MongoJSONResponse([])
+    # $all walks the index on its first element, so lead with the rarest tag.
+    wanted.sort(key=lambda t: counts[t])
+    return await page.respond({"user_id": ObjectId(user_id), "tags": {"$all": wanted}})
@@ -1,23 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 from bson import ObjectId, errors
+from pymongo import ReturnDocument
+from datetime import datetime
 from db import db
 from models import CollectionInput # Assuming this is defined in models.py
-from utils import decode_token, convert_objectid_to_str # Assuming these are in utils.py
+from utils import get_user_id
+from responses import MongoJSONResponse
+from routes.bookmarks import PageParams, page_params
+from ml import clustering
 
 collection_router = APIRouter()
 
-def get_user_id(authorization: str = Header(...)):
-    """Extracts user ID from the Authorization header token."""
-    try:
-        token = authorization.replace("Bearer ", "")
-        payload = decode_token(token)
-        if not payload or "sub" not in payload:
-            raise HTTPException(status_code=401, detail="Invalid token payload")
-        return payload["sub"]
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid token")
+# Collections are returned without their member id array; members come
+# from a $lookup over one page of it, so the cost of a read depends on the
+# page size rather than on how large the collection is.
+SUMMARY_PROJECTION = {
+    "name": 1,
+    "user_id": 1,
+    "created_at": 1,
+    "bookmark_count": {"$size": {"$ifNull": ["$bookmarks", []]}},
+}
+PREVIEW_SIZE = 3
+PREVIEW_FIELDS = {"title": 1, "url": 1}
 
 class CollectionUpdateInput(BaseModel):
     name: str
@@ -25,107 +31,186 @@ class CollectionUpdateInput(BaseModel):
 class BookmarkIdsInput(BaseModel):
     bookmark_ids: List[str]
 
-@collection_router.post("/collections/", status_code=201)
-def create_collection(data: CollectionInput, user_id: str = Depends(get_user_id)):
-    """Creates a new collection for the user."""
+class AcceptSuggestionInput(BaseModel):
+    name: Optional[str] = None
+
+
+def _object_id(value: str) -> ObjectId:
     try:
-        user_object_id = ObjectId(user_id)
-        bookmark_object_ids = [ObjectId(bid) for bid in data.bookmark_ids]
+        return ObjectId(value)
     except errors.InvalidId:
         raise HTTPException(status_code=400, detail="Invalid ID format provided.")
 
+
+def _member_lookup(local_field: str, as_field: str, user_id: ObjectId, projection: dict) -> dict:
+    # localField + pipeline resolves each id through the _id index (MongoDB 5.0+).
+    return {"$lookup": {
+        "from": "bookmarks",
+        "localField": local_field,
+        "foreignField": "_id",
+        "pipeline": [{"$match": {"user_id": user_id}}, {"$project": projection}],
+        "as": as_field,
+    }}
+
+
+async def _collection_page(collection_id: str, user_id: str, page: PageParams):
+    """
+    The collection summary with one page of member bookmarks, in the order
+    they were added. The cursor is the offset of the next page.
+    """
+    try:
+        offset = int(page.cursor or 0)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    uid = ObjectId(user_id)
+    cursor = await db.collections.aggregate([
+        {"$match": {"_id": _object_id(collection_id), "user_id": uid}},
+        {"$project": {
+            **SUMMARY_PROJECTION,
+            "bookmarks": {"$slice": [{"$ifNull": ["$bookmarks", []]}, offset, page.limit]},
+        }},
+        _member_lookup("bookmarks", "members", uid, page.projection),
+    ])
+    found = await cursor.to_list(1)
+    if not found:
+        raise HTTPException(status_code=404, detail="Collection not found")
+
+    coll = found[0]
+    # $lookup does not keep the array order.
+    by_id = {doc["_id"]: doc for doc in coll.pop("members")}
+    coll["bookmarks"] = [by_id[bid] for bid in coll["bookmarks"] if bid in by_id]
+    end = offset + page.limit
+    next_cursor = str(end) if end < coll["bookmark_count"] else None
+    return coll, next_cursor
+
+
+async def _update(collection_id: str, user_id: str, update: dict):
+    """Applies update and returns the collection summary as it is afterwards."""
+    coll = await db.collections.find_one_and_update(
+        {"_id": _object_id(collection_id), "user_id": ObjectId(user_id)},
+        update,
+        projection=SUMMARY_PROJECTION,
+        return_document=ReturnDocument.AFTER,
+    )
+    if coll is None:
+        raise HTTPException(status_code=404, detail="Collection not found or user not authorized")
+    return MongoJSONResponse(coll)
+
+
+async def _validate_bookmarks(bookmark_object_ids: list, user_id: str):
     # Validate that all provided bookmarks exist and belong to the user
-    valid_bms_count = db.bookmarks.count_documents({
+    valid_bms_count = await db.bookmarks.count_documents({
         "_id": {"$in": bookmark_object_ids},
-        "user_id": user_object_id
+        "user_id": ObjectId(user_id)
     })
-    if valid_bms_count != len(data.bookmark_ids):
+    if valid_bms_count != len(set(bookmark_object_ids)):
         raise HTTPException(status_code=400, detail="One or more bookmarks are invalid or do not belong to the user")
 
+
+@collection_router.post("/collections/", status_code=201)
+async def create_collection(data: CollectionInput, user_id: str = Depends(get_user_id)):
+    """Creates a new collection for the user."""
+    bookmark_object_ids = list(dict.fromkeys(_object_id(bid) for bid in data.bookmark_ids))
+    await _validate_bookmarks(bookmark_object_ids, user_id)
+
     collection_data = {
-        "user_id": user_object_id,
+        "user_id": ObjectId(user_id),
         "name": data.name,
-        "bookmarks": bookmark_object_ids # Changed from bookmark_ids to match frontend Collection type
+        "bookmarks": bookmark_object_ids, # Changed from bookmark_ids to match frontend Collection type
+        "created_at": datetime.utcnow(),
     }
-    res = db.collections.insert_one(collection_data)
-    
-    # Return the newly created collection object
-    new_collection = db.collections.find_one({"_id": res.inserted_id})
-    return convert_objectid_to_str(new_collection)
+    res = await db.collections.insert_one(collection_data)
+
+    # Return the new collection in summary form; no need to read it back
+    collection_data["_id"] = res.inserted_id
+    collection_data["bookmark_count"] = len(collection_data.pop("bookmarks"))
+    return MongoJSONResponse(collection_data, status_code=201)
 
 @collection_router.get("/collections/")
-def get_collections(user_id: str = Depends(get_user_id)):
-    """Retrieves all collections for the user."""
-    collections = list(db.collections.find({"user_id": ObjectId(user_id)}))
-    return convert_objectid_to_str(collections)
+async def get_collections(user_id: str = Depends(get_user_id)):
+    """The user's collections with member counts and the latest few members as a preview."""
+    uid = ObjectId(user_id)
+    cursor = await db.collections.aggregate([
+        {"$match": {"user_id": uid}},
+        {"$project": {
+            **SUMMARY_PROJECTION,
+            "preview": {"$slice": [{"$ifNull": ["$bookmarks", []]}, -PREVIEW_SIZE]},
+        }},
+        _member_lookup("preview", "preview", uid, PREVIEW_FIELDS),
+    ])
+    return MongoJSONResponse(await cursor.to_list())
+
+# Declared before /collections/{collection_id}, which would otherwise match them.
+@collection_router.get("/collections/suggestions")
+async def get_suggestions(min_size: int = Query(clustering.SUGGEST_MIN_SIZE, ge=1), user_id: str = Depends(get_user_id)):
+    """Suggested collections from clustering the user's bookmarks (see ml/clustering.py)."""
+    return MongoJSONResponse(await clustering.get_suggestions(user_id, min_size))
+
+@collection_router.post("/collections/suggestions/rebuild", status_code=202)
+async def rebuild_suggestions(user_id: str = Depends(get_user_id)):
+    """Re-clusters the library in the background."""
+    clustering.schedule_rebuild(user_id)
+    return {"status": "building"}
+
+@collection_router.post("/collections/suggestions/{cluster_id}/accept", status_code=201)
+async def accept_suggestion(cluster_id: int, data: AcceptSuggestionInput, user_id: str = Depends(get_user_id)):
+    """Creates a collection from a suggested cluster, named after its label unless a name is given."""
+    uid = ObjectId(user_id)
+    model = await db.suggestions.find_one({"_id": uid}, {"clusters": {"$elemMatch": {"id": cluster_id}}})
+    if not model or not model.get("clusters"):
+        raise HTTPException(status_code=404, detail="Suggestion not found")
+    member_ids = [d["_id"] async for d in db.bookmarks.find({"user_id": uid, "cluster": cluster_id}, {"_id": 1}).sort("_id", 1)]
+    if not member_ids:
+        raise HTTPException(status_code=404, detail="Suggestion has no bookmarks")
+    collection_data = {
+        "user_id": uid,
+        "name": data.name or model["clusters"][0]["label"],
+        "bookmarks": member_ids,
+        "created_at": datetime.utcnow(),
+    }
+    res = await db.collections.insert_one(collection_data)
+    collection_data["_id"] = res.inserted_id
+    collection_data["bookmark_count"] = len(collection_data.pop("bookmarks"))
+    return MongoJSONResponse(collection_data, status_code=201)
 
 @collection_router.get("/collections/{collection_id}")
-def get_collection(collection_id: str, user_id: str = Depends(get_user_id)):
-    """Retrieves a single collection and its bookmarks."""
-    coll = db.collections.find_one({"_id": ObjectId(collection_id), "user_id": ObjectId(user_id)})
-    if not coll:
-        raise HTTPException(status_code=404, detail="Collection not found")
-
-    # Populate bookmarks within the collection
-    coll["bookmarks"] = list(db.bookmarks.find({
-        "_id": {"$in": coll.get("bookmarks", [])}
-    }))
-    
-    return convert_objectid_to_str(coll)
+async def get_collection(collection_id: str, page: PageParams = Depends(page_params), user_id: str = Depends(get_user_id)):
+    """Retrieves a single collection and one page of its bookmarks."""
+    coll, next_cursor = await _collection_page(collection_id, user_id, page)
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return MongoJSONResponse(coll, headers=headers)
+
+@collection_router.get("/collections/{collection_id}/bookmarks")
+async def get_collection_bookmarks(collection_id: str, page: PageParams = Depends(page_params), user_id: str = Depends(get_user_id)):
+    """One page of a collection's bookmarks as a plain list."""
+    coll, next_cursor = await _collection_page(collection_id, user_id, page)
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return MongoJSONResponse(coll["bookmarks"], headers=headers)
 
 @collection_router.put("/collections/{collection_id}/rename")
-def rename_collection(collection_id: str, data: CollectionUpdateInput, user_id: str = Depends(get_user_id)):
+async def rename_collection(collection_id: str, data: CollectionUpdateInput, user_id: str = Depends(get_user_id)):
     """Renames a collection."""
-    res = db.collections.update_one(
-        {"_id": ObjectId(collection_id), "user_id": ObjectId(user_id)},
-        {"$set": {"name": data.name}}
-    )
-    if res.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Collection not found or user not authorized")
-    
-    updated_collection = db.collections.find_one({"_id": ObjectId(collection_id)})
-    return convert_objectid_to_str(updated_collection)
+    return await _update(collection_id, user_id, {"$set": {"name": data.name}})
 
 @collection_router.delete("/collections/{collection_id}", status_code=204)
-def delete_collection(collection_id: str, user_id: str = Depends(get_user_id)):
+async def delete_collection(collection_id: str, user_id: str = Depends(get_user_id)):
     """Deletes a collection."""
-    res = db.collections.delete_one({"_id": ObjectId(collection_id), "user_id": ObjectId(user_id)})
+    res = await db.collections.delete_one({"_id": _object_id(collection_id), "user_id": ObjectId(user_id)})
     if res.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Collection not found or user not authorized")
     return
 
 @collection_router.post("/collections/{collection_id}/add-bookmarks")
-def add_bookmarks_to_collection(collection_id: str, data: BookmarkIdsInput, user_id: str = Depends(get_user_id)):
+async def add_bookmarks_to_collection(collection_id: str, data: BookmarkIdsInput, user_id: str = Depends(get_user_id)):
     """Adds bookmarks to a specific collection."""
-    bookmark_object_ids = [ObjectId(bid) for bid in data.bookmark_ids]
-    
-    # Validate bookmarks
-    valid_bms_count = db.bookmarks.count_documents({
-        "_id": {"$in": bookmark_object_ids},
-        "user_id": ObjectId(user_id)
-    })
-    if valid_bms_count != len(data.bookmark_ids):
-        raise HTTPException(status_code=400, detail="One or more bookmarks are invalid or do not belong to the user")
-
-    res = db.collections.update_one(
-        {"_id": ObjectId(collection_id), "user_id": ObjectId(user_id)},
-        {"$addToSet": {"bookmarks": {"$each": bookmark_object_ids}}}
-    )
-    if res.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Collection not found")
-
-    updated_collection = db.collections.find_one({"_id": ObjectId(collection_id)})
-    return convert_objectid_to_str(updated_collection)
+    bookmark_object_ids = [_object_id(bid) for bid in data.bookmark_ids]
+    await _validate_bookmarks(bookmark_object_ids, user_id)
+    return await _update(collection_id, user_id, {"$addToSet": {"bookmarks": {"$each": bookmark_object_ids}}})
 
 @collection_router.post("/collections/{collection_id}/remove-bookmarks")
-def remove_bookmarks_from_collection(collection_id: str, data: BookmarkIdsInput, user_id: str = Depends(get_user_id)):
+async def remove_bookmarks_from_collection(collection_id: str, data: BookmarkIdsInput, user_id: str = Depends(get_user_id)):
     """Removes bookmarks from a specific collection."""
-    res = db.collections.update_one(
-        {"_id": ObjectId(collection_id), "user_id": ObjectId(user_id)},
-        {"$pull": {"bookmarks": {"$in": [ObjectId(bid) for bid in data.bookmark_ids]}}}
-    )
-    if res.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Collection not found")
-    
-    updated_collection = db.collections.find_one({"_id": ObjectId(collection_id)})
-    return convert_objectid_to_str(updated_collection)
+    bookmark_object_ids = [_object_id(bid) for bid in data.bookmark_ids]
+    return await _update(collection_id, user_id, {"$pull": {"bookmarks": {"$in": bookmark_object_ids}}})
@@ -0,0 +1,151 @@
+import asyncio
+import time
+from datetime import datetime
+
+import numpy as np
+from bson import ObjectId, errors
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from db import db
+from ml import clustering
+from models import MergeRequest
+from responses import MongoJSONResponse
+from search import duplicates, embedding_codec, lexical_index, tag_index, vector_index
+from utils import get_user_id
+from workers import stats
+import share_cache
+
+duplicates_router = APIRouter()
+
+SUMMARY_FIELDS = ("url", "title", "tags", "created_at", "visit_count", "is_broken")
+
+
+def _suggested_keep(docs: list) -> dict:
+    # Prefer a working link, then the most visited, then the oldest.
+    return min(docs, key=lambda d: (
+        bool(d.get("is_broken")),
+        -(d.get("visit_count") or 0),
+        d.get("created_at") or datetime.max,
+    ))
+
+
+@duplicates_router.get("/bookmarks/duplicates")
+async def find_duplicates(
+    threshold: float = Query(duplicates.DUPLICATE_THRESHOLD, ge=0.8, le=1.0),
+    limit: int = Query(100, ge=1, le=1000),
+    user_id=Depends(get_user_id),
+):
+    """
+    Clusters of bookmarks that point at the same resource (canonical URL)
+    or have near-identical embeddings, biggest first, each with a
+    suggested bookmark to keep.
+    """
+    started = time.perf_counter()
+    docs = await db.bookmarks.find(
+        {"user_id": ObjectId(user_id)},
+        {**{f: 1 for f in SUMMARY_FIELDS}, "final_url": 1, "embedding": 1},
+    ).to_list()
+
+    vectors = None
+    decoded = [embedding_codec.decode(d.pop("embedding")) if d.get("embedding") is not None else None for d in docs]
+    dims = {len(v) for v in decoded if v is not None}
+    if len(dims) == 1:
+        vectors = np.zeros((len(docs), dims.pop()), dtype=np.float32)
+        for row, vec in enumerate(decoded):
+            if vec is not None:
+                vectors[row] = vec
+    del decoded
+
+    try:
+        clusters = await asyncio.get_running_loop().run_in_executor(
+            None, duplicates.find_clusters, docs, vectors, threshold
+        )
+    except duplicates.TooManyPairs as e:
+        raise HTTPException(422, f"{e}; raise the threshold")
+    results = []
+    for cluster in clusters[:limit]:
+        members = [docs[i] for i in cluster["members"]]
+        for doc in members:
+            doc.pop("final_url", None)
+        results.append({
+            "keep": _suggested_keep(members)["_id"],
+            "reasons": sorted(cluster["reasons"]),
+            "min_similarity": cluster["score"],
+            "bookmarks": members,
+        })
+    return MongoJSONResponse({
+        "clusters": results,
+        "total_clusters": len(clusters),
+        "scanned": len(docs),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    })
+
+
+@duplicates_router.post("/bookmarks/duplicates/merge")
+async def merge_duplicates(req: MergeRequest, user_id=Depends(get_user_id)):
+    """
+    Folds each group's duplicates into its `keep` bookmark: tags are
+    merged, visit counts added up, the earliest created_at kept, and
+    collection memberships moved over. The duplicates are then deleted.
+    """
+    uid = ObjectId(user_id)
+    try:
+        groups = [
+            (ObjectId(g.keep), list(dict.fromkeys(ObjectId(d) for d in g.duplicates if d != g.keep)))
+            for g in req.groups
+        ]
+    except errors.InvalidId:
+        raise HTTPException(400, "Invalid ID format provided.")
+    wanted = [keep for keep, _ in groups] + [d for _, dups in groups for d in dups]
+    if len(set(wanted)) != len(wanted):
+        raise HTTPException(400, "A bookmark appears in more than one group")
+    found = {
+        d["_id"]: d
+        async for d in db.bookmarks.find(
+            {"_id": {"$in": wanted}, "user_id": uid},
+            {"url": 1, "title": 1, "description": 1, "tags": 1, "is_broken": 1,
+             "shared": 1, "visit_count": 1, "created_at": 1, "cluster": 1},
+        )
+    }
+    missing = [str(keep) for keep, _ in groups if keep not in found]
+    if missing:
+        raise HTTPException(404, f"Bookmarks to keep not found: {', '.join(missing)}")
+
+    removed = 0
+    for keep, dup_ids in groups:
+        kept = found[keep]
+        dups = [found[d] for d in dup_ids if d in found]
+        if not dups:
+            continue
+        dup_ids = [d["_id"] for d in dups]
+        tags = list(dict.fromkeys(t for d in [kept, *dups] for t in d.get("tags") or []))
+        created = [d["created_at"] for d in [kept, *dups] if d.get("created_at")]
+        merged = {
+            "tags": tags,
+            "visit_count": sum(d.get("visit_count") or 0 for d in [kept, *dups]),
+            "updated_at": datetime.utcnow(),
+        }
+        if created:
+            merged["created_at"] = min(created)
+
+        await db.bookmarks.update_one({"_id": keep, "user_id": uid}, {"$set": merged})
+        await db.collections.update_many(
+            {"user_id": uid, "bookmarks": {"$in": dup_ids}}, {"$addToSet": {"bookmarks": keep}}
+        )
+        await db.collections.update_many(
+            {"user_id": uid, "bookmarks": {"$in": dup_ids}}, {"$pull": {"bookmarks": {"$in": dup_ids}}}
+        )
+        res = await db.bookmarks.delete_many({"_id": {"$in": dup_ids}, "user_id": uid})
+        removed += res.deleted_count
+
+        for bid in dup_ids:
+            await vector_index.remove(user_id, bid)
+            await lexical_index.remove(user_id, bid)
+        await lexical_index.upsert_many(user_id, [{**kept, **merged}])
+        await clustering.unassign(user_id, dups)
+        await stats.on_bookmarks_deleted(dups)
+        await stats.on_bookmark_changed(kept, {**kept, **merged})
+        await tag_index.remove_bookmarks(user_id, dups)
+        await tag_index.apply(user_id, tag_index.tag_deltas(kept.get("tags"), tags))
+        await share_cache.touch([d.get("shared") for d in [kept, *dups]])
+    return {"merged": len(groups), "removed": removed}
@@ -1,199 +1,349 @@
 from fastapi import APIRouter, File, UploadFile, Depends, HTTPException
-from fastapi.responses import JSONResponse
-from typing import List
-from bson import ObjectId
-import io
-from bs4 import BeautifulSoup, Tag
+from fastapi.responses import StreamingResponse
+from html.parser import HTMLParser
+from typing import AsyncIterator
+import codecs
 import csv
+import io
 import json
 import asyncio
-from datetime import datetime
-from urllib.parse import urlparse
 
-from db import db
 from utils import get_current_user
-from ml.embedding import get_embedding
-from ml.tags import extract_tags
-from utils import check_url_health
-from ml.scraper import scrape_metadata
+from workers import import_jobs
+from responses import MongoJSONResponse, dumps
 
 router = APIRouter()
 
-def normalize_url(url: str) -> str:
-    parsed = urlparse(url)
-    if not parsed.scheme:
-        return "https://" + url
-    return url
-
-def import_bookmark_html(html_content: str):
-    soup = BeautifulSoup(html_content, "html.parser")
-    bookmarks = []
-    top_dl = soup.find('dl')
-    if not top_dl:
-        return bookmarks
-
-    dt_tags = top_dl.find_all('dt')
-    for dt in dt_tags:
-        a_tag = dt.find('a')
-        if a_tag and a_tag.has_attr('href'):
-            bookmarks.append({
-                'url': a_tag['href'],
-                'title': a_tag.get_text(strip=True),
-                'collections': []
-            })
-    return bookmarks
+# Uploads are consumed in chunks of this size, so parser memory stays
+# bounded by the chunk plus one record regardless of the file size.
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# A single JSON array element may not exceed this; a malformed element
+# would otherwise pull the rest of the upload into the buffer.
+JSON_MAX_ELEMENT = 1024 * 1024
+# Same bound for one CSV record (a quoted field may span lines).
+CSV_MAX_RECORD = 1024 * 1024
 
-async def parse_bookmark_json(file_bytes: bytes) -> List[dict]:
-    try:
-        data = json.loads(file_bytes.decode("utf-8"))
-        if isinstance(data, list):
-            bookmarks = []
-            for item in data:
-                url = item.get("url")
-                title = item.get("title") or url
-                collections = item.get("collections") or []
-                if url:
-                    bookmarks.append({
-                        "url": url,
-                        "title": title,
-                        "collections": collections,
-                        "description": item.get("description", "")
-                    })
-            return bookmarks
-        else:
-            return []
-    except Exception:
-        return []
-
-async def parse_bookmark_csv(file_bytes: bytes) -> List[dict]:
-    try:
-        decoded = file_bytes.decode("utf-8")
-        reader = csv.DictReader(io.StringIO(decoded))
-        bookmarks = []
-        for row in reader:
-            url = row.get("url")
-            if not url:
-                continue
-            title = row.get("title") or url
-            description = row.get("description") or ""
-            collections = row.get("collections", "")
-            collections_list = [c.strip() for c in collections.split(";")] if collections else []
-            bookmarks.append({
+
+class ImportFileError(ValueError):
+    """The upload cannot be parsed; answered with 400."""
+
+
+async def iter_text(file: UploadFile, errors: str = "replace") -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors=errors)
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+class NetscapeBookmarkParser(HTMLParser):
+    """
+    Event-driven parser for browser bookmark exports. Folders are <H3>
+    headings followed by a nested <DL>; each link is recorded with its
+    folder path joined by " / " as its collection.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.records = []
+        self._folders = []
+        self._pending_folder = None
+        self._heading = None
+        self._link = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "h3":
+            self._heading = []
+        elif tag == "dl":
+            # Every <DL> closes with a pop, so push None for the unnamed root list.
+            self._folders.append(self._pending_folder)
+            self._pending_folder = None
+        elif tag == "a":
+            href = dict(attrs).get("href")
+            self._link = {"url": href, "title": []} if href else None
+
+    def handle_endtag(self, tag):
+        if tag == "h3" and self._heading is not None:
+            self._pending_folder = "".join(self._heading).strip() or None
+            self._heading = None
+        elif tag == "dl" and self._folders:
+            self._folders.pop()
+        elif tag == "a" and self._link is not None:
+            path = [f for f in self._folders if f]
+            url = self._link["url"]
+            self.records.append({
                 "url": url,
-                "title": title,
-                "description": description,
-                "collections": collections_list
+                "title": "".join(self._link["title"]).strip() or url,
+                "collections": [" / ".join(path)] if path else []
             })
-        return bookmarks
-    except Exception:
-        return []
+            self._link = None
+
+    def handle_data(self, data):
+        if self._heading is not None:
+            self._heading.append(data)
+        elif self._link is not None:
+            self._link["title"].append(data)
+
+
+async def parse_bookmark_html(file: UploadFile) -> AsyncIterator[dict]:
+    parser = NetscapeBookmarkParser()
+    async for text in iter_text(file, errors="ignore"):
+        parser.feed(text)
+        for record in parser.records:
+            yield record
+        parser.records.clear()
+    parser.close()
+    for record in parser.records:
+        yield record
+
+
+class JsonArrayStream:
+    """Splits a top-level JSON array into its elements as text arrives."""
+
+    _ws = json.decoder.WHITESPACE
+
+    def __init__(self):
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.state = "start"
+
+    def feed(self, text: str, final: bool = False) -> list:
+        self.buf += text
+        items, pos = [], 0
+        while self.state != "done":
+            pos = self._ws.match(self.buf, pos).end()
+            if pos >= len(self.buf):
+                break
+            c = self.buf[pos]
+            if self.state == "start":
+                if c != "[":
+                    raise ImportFileError("Expected a JSON array")
+                pos += 1
+                self.state = "first"
+            elif self.state in ("first", "item"):
+                if c == "]" and self.state == "first":
+                    self.state = "done"
+                    pos += 1
+                    break
+                try:
+                    item, end = self.decoder.raw_decode(self.buf, pos)
+                except json.JSONDecodeError as e:
+                    if final:
+                        raise ImportFileError(f"Invalid JSON: {e}")
+                    if len(self.buf) - pos > JSON_MAX_ELEMENT:
+                        raise ImportFileError(f"Invalid JSON or element over {JSON_MAX_ELEMENT} bytes: {e}")
+                    break  # element continues in the next chunk
+                if end >= len(self.buf) and not final:
+                    break  # a trailing scalar could still be truncated
+                items.append(item)
+                pos = end
+                self.state = "sep"
+            else:
+                if c == ",":
+                    self.state = "item"
+                elif c == "]":
+                    self.state = "done"
+                else:
+                    raise ImportFileError(f"Unexpected {c!r} in JSON array")
+                pos += 1
+        if self.state == "done":
+            if self._ws.match(self.buf, pos).end() < len(self.buf):
+                raise ImportFileError("Unexpected data after the JSON array")
+            pos = len(self.buf)
+        self.buf = self.buf[pos:]
+        if final and self.state != "done":
+            raise ImportFileError("JSON array is not closed")
+        return items
+
+
+def _json_record(item) -> dict:
+    if not isinstance(item, dict):
+        raise ImportFileError("Expected an object per bookmark")
+    # Rows without a usable url are passed on and counted as errors by the job.
+    url = item.get("url")
+    return {
+        "url": url,
+        "title": item.get("title") or url,
+        "collections": item.get("collections") or [],
+        "description": item.get("description", "")
+    }
+
+
+async def parse_bookmark_json(file: UploadFile) -> AsyncIterator[dict]:
+    """Raises ImportFileError for malformed or truncated files."""
+    stream = JsonArrayStream()
+    async for text in iter_text(file):
+        for item in stream.feed(text):
+            yield _json_record(item)
+    for item in stream.feed("", final=True):
+        yield _json_record(item)
+
+
+class _NeedMore(Exception):
+    pass
 
-async def generate_embedding(title: str, description: str):
-    loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(None, get_embedding, title, description)
 
-async def generate_tags(title: str, description: str):
-    loop = asyncio.get_running_loop()
-    text = f"{title} {description}".strip()
-    return await loop.run_in_executor(None, extract_tags, text)
+class CsvRecordStream:
+    """
+    Runs one csv.reader over the upload's lines as text arrives, so csv's own
+    quoting rules decide where a record ends. The reader pulls lines from
+    this object; when a record needs a line that has not arrived yet, the
+    attempt is abandoned and replayed from the record's first line on the
+    next feed.
+    """
+
+    def __init__(self):
+        self.lines = []
+        self.start = 0  # first line of the record being read
+        self.pos = 0
+        self.partial = ""  # text after the last newline
+        self.final = False
+        self.truncated = False
+        self.reader = csv.reader(self)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.pos < len(self.lines):
+            self.pos += 1
+            return self.lines[self.pos - 1]
+        if not self.final:
+            raise _NeedMore
+        # The input ended while the current record still wanted more.
+        self.truncated = self.pos > self.start
+        raise StopIteration
+
+    def feed(self, text: str, final: bool = False) -> list:
+        *complete, self.partial = (self.partial + text).split("\n")
+        self.lines.extend(line + "\n" for line in complete)
+        if final:
+            if self.partial:
+                self.lines.append(self.partial)
+            self.partial = ""
+            self.final = True
+        records = []
+        while True:
+            self.pos = self.start
+            try:
+                record = next(self.reader)
+            except _NeedMore:
+                if sum(map(len, self.lines[self.start:])) + len(self.partial) > CSV_MAX_RECORD:
+                    raise ImportFileError(f"CSV record over {CSV_MAX_RECORD} bytes")
+                break
+            except StopIteration:
+                break
+            except csv.Error as e:
+                raise ImportFileError(f"Invalid CSV: {e}")
+            if self.truncated:
+                raise ImportFileError("CSV ends inside a quoted field")
+            records.append(record)
+            self.start = self.pos
+        del self.lines[:self.start]
+        self.start = 0
+        return records
+
 
-async def find_bookmark(user_id, url):
-    loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(None, lambda: db.bookmarks.find_one({"user_id": ObjectId(user_id), "url": url}))
+async def parse_bookmark_csv(file: UploadFile) -> AsyncIterator[dict]:
+    """Raises ImportFileError for malformed or truncated files."""
+    stream = CsvRecordStream()
+    header = None
 
-async def insert_bookmark(bookmark_doc):
-    loop = asyncio.get_running_loop()
-    result = await loop.run_in_executor(None, lambda: db.bookmarks.insert_one(bookmark_doc))
-    return result
+    async def records():
+        async for text in iter_text(file):
+            for fields in stream.feed(text):
+                yield fields
+        for fields in stream.feed("", final=True):
+            yield fields
 
+    async for fields in records():
+        if header is None:
+            header = [h.strip() for h in fields]
+            continue
+        if not any(f.strip() for f in fields):
+            continue  # blank line
+        row = dict(zip(header, fields))
+        url = row.get("url")
+        title = row.get("title") or url
+        description = row.get("description") or ""
+        collections = row.get("collections", "")
+        collections_list = [c.strip() for c in collections.split(";")] if collections else []
+        yield {
+            "url": url,
+            "title": title,
+            "description": description,
+            "collections": collections_list
+        }
 
-@router.post("/bookmarks/import")
+
+@router.post("/bookmarks/import", status_code=202)
 async def import_bookmarks(
     file: UploadFile = File(...),
     current_user=Depends(get_current_user)
 ):
-    content = await file.read()
+    """
+    Streams the upload into a queued import job and returns its id; poll or
+    stream the job for progress.
+    """
     filename = file.filename.lower()
     content_type = file.content_type
 
     if filename.endswith(".html") or content_type == "text/html":
-        bookmarks = import_bookmark_html(content.decode("utf-8", errors="ignore"))
+        bookmarks = parse_bookmark_html(file)
     elif filename.endswith(".json") or content_type == "application/json":
-        bookmarks = await parse_bookmark_json(content)
+        bookmarks = parse_bookmark_json(file)
     elif filename.endswith(".csv") or content_type == "text/csv":
-        bookmarks = await parse_bookmark_csv(content)
+        bookmarks = parse_bookmark_csv(file)
     else:
         raise HTTPException(status_code=400, detail="Unsupported file type")
 
-    if not bookmarks:
+    try:
+        job = await import_jobs.create_job(current_user["_id"], file.filename, bookmarks)
+    except ImportFileError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if job is None:
         raise HTTPException(status_code=400, detail="No bookmarks found in file")
 
+    print(f"Total bookmarks parsed: {job['total']}")
+    import_jobs.start_job(job["_id"])
+    return MongoJSONResponse(import_jobs.job_summary(job), status_code=202)
 
-    errors = []
 
-    semaphore = asyncio.Semaphore(10)
+async def _load_job(job_id: str, user_id):
+    job = await import_jobs.get_job(job_id, user_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
 
-    print(f"Total bookmarks parsed: {len(bookmarks)}")
-    counters = {
-        "inserted": 0,
-        "duplicates": 0,
-        "errors": 0
-    }
-    async def process_bookmark(bm):
-        try:
-            existing = await find_bookmark(current_user["_id"], bm["url"])
-            if existing:
-                print(f"Duplicate bookmark skipped: {bm['url']}")
-                counters["duplicates"] += 1
-                return
-            # fallback title/description scrape if missing
-            title = bm.get("title") or bm["url"]
-            description = bm.get("description") or ""
-            if not description:
-                scraped = scrape_metadata(bm["url"])
-                description = scraped.get("description", "")
-                title = title or scraped.get("title", bm["url"])
-
-            tags = await generate_tags(title, description)
-            embedding = await generate_embedding(title, description)
-            broken = not check_url_health(bm["url"])
-
-            bookmark_doc = {
-                "user_id": ObjectId(current_user["_id"]),
-                "url": bm["url"],
-                "title": title,
-                "description": description,
-                "category": " / ".join(bm.get("collections", [])) if bm.get("collections") else "",
-                "tags": tags,
-                "embedding": embedding,
-                "shared": False,
-                "created_at": datetime.utcnow(),
-                "is_broken": broken,
-                "visit_count": 0,
-                "last_checked": None
-            }
-            await insert_bookmark(bookmark_doc)
-            print(f"Inserted bookmark: {bm['url']}")
-        except Exception as e:
-            print(f"Error inserting bookmark {bm.get('url')}: {e}")
-            error_count += 1
-
-        await insert_bookmark(bookmark_doc)
-        counters["inserted"] += 1
-
-    async def sem_task(bm):
-        async with semaphore:
-            try:
-                await process_bookmark(bm)
-            except Exception as e:
-                errors.append({"bookmark": bm, "error": str(e)})
-                counters["errors"] += 1
 
-    await asyncio.gather(*(sem_task(bm) for bm in bookmarks))
+@router.get("/bookmarks/import/{job_id}")
+async def get_import_job(job_id: str, current_user=Depends(get_current_user)):
+    job = await _load_job(job_id, current_user["_id"])
+    return MongoJSONResponse(import_jobs.job_summary(job))
 
-    return {
-        "importedCount": counters["inserted"],
-        "duplicatesSkipped": counters["duplicates"],
-        "errors": counters["errors"],
-        "total": len(bookmarks)
-    }
+
+@router.get("/bookmarks/import/{job_id}/stream")
+async def stream_import_job(job_id: str, current_user=Depends(get_current_user)):
+    """Streams job progress as NDJSON, one line per change, until the job ends."""
+    job = await _load_job(job_id, current_user["_id"])
+
+    async def progress():
+        last = None
+        current = job
+        while True:
+            summary = import_jobs.job_summary(current)
+            if summary != last:
+                yield dumps(summary) + b"\n"
+                last = summary
+            if current["status"] in ("done", "failed"):
+                return
+            await asyncio.sleep(1)
+            current = await _load_job(job_id, current_user["_id"])
+
+    return StreamingResponse(progress(), media_type="application/x-ndjson")
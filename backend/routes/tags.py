@@ -0,0 +1,22 @@
+from fastapi import APIRouter, Depends, Query
+from search import tag_index
+from utils import get_user_id
+
+tags_router = APIRouter()
+
+
+@tags_router.get("/tags/facets")
+async def tag_facets(limit: int = Query(20, ge=1, le=200), user_id=Depends(get_user_id)):
+    """The user's most used tags with bookmark counts."""
+    return await tag_index.facets(user_id, limit)
+
+
+@tags_router.get("/tags/autocomplete")
+async def autocomplete_tags(
+    prefix: str = Query("", max_length=100),
+    limit: int = Query(10, ge=1, le=50),
+    user_id=Depends(get_user_id),
+):
+    """Tags starting with prefix (case-insensitive), most used first."""
+    trie = await tag_index.get_trie(user_id)
+    return [{"tag": tag, "count": count} for tag, count in trie.complete(prefix, limit)]
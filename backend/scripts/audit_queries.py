@@ -0,0 +1,112 @@
+# scripts/audit_queries.py
+"""
+Runs explain() on every query shape used by routes/ and workers/ and fails
+if any of them is planned as a collection scan.
+
+Usage (from backend/):
+    python -m scripts.audit_queries
+
+Indexes are created first via db.ensure_indexes(), so this can run against
+an empty database in CI as well as against production data. Add a shape
+here whenever a route starts filtering on something new.
+"""
+import asyncio
+import sys
+from datetime import datetime
+
+from bson import ObjectId
+
+from db import ensure_indexes, get_sync_db
+
+USER = ObjectId()
+OTHER = ObjectId()
+NOW = datetime.utcnow()
+
+# (collection, filter, sort) for every find/update/delete/count filter.
+QUERY_SHAPES = [
+    ("users", {"email": "someone@example.com"}, None),
+    ("users", {"email": "someone@example.com", "is_admin": True}, None),
+    ("users", {"_id": USER}, None),
+
+    ("bookmarks", {"user_id": USER}, None),
+    ("bookmarks", {"user_id": USER, "_id": {"$gt": OTHER}}, [("_id", 1)]),
+    ("bookmarks", {"user_id": USER, "embedding": {"$exists": True}}, None),
+    ("bookmarks", {"user_id": USER, "embedding": {"$exists": True}, "updated_at": {"$gte": NOW}}, None),
+    ("bookmarks", {"user_id": USER, "updated_at": {"$gte": NOW}}, None),
+    ("bookmarks", {"user_id": USER, "created_at": {"$gte": NOW, "$lt": NOW}}, None),
+    ("bookmarks", {"user_id": USER, "tags": {"$all": ["python"]}, "is_broken": False}, None),
+    ("bookmarks", {"user_id": USER, "_id": {"$in": [OTHER]}, "is_broken": False}, None),
+    ("bookmarks", {"user_id": USER, "url": "https://example.com"}, None),
+    ("bookmarks", {"user_id": USER, "url": {"$in": ["https://a.example", "https://b.example"]}}, None),
+    ("bookmarks", {"user_id": USER, "$or": [{"canonical_url": {"$in": ["a.example"]}}, {"url": {"$in": ["https://a.example"]}}]}, None),
+    ("collections", {"user_id": USER, "bookmarks": {"$in": [OTHER]}}, None),
+    ("bookmarks", {"user_id": USER, "tags": "python"}, [("_id", 1)]),
+    ("bookmarks", {"user_id": USER, "is_broken": True}, [("_id", 1)]),
+    ("bookmarks", {"user_id": USER, "is_broken": True, "tags": "python"}, [("_id", 1)]),
+    ("bookmarks", {"_id": OTHER, "user_id": USER}, None),
+    ("bookmarks", {"_id": {"$in": [OTHER]}, "user_id": USER}, None),
+    ("bookmarks", {"_id": {"$in": [OTHER]}}, None),
+    ("bookmarks", {"shared": "share-id"}, [("_id", 1)]),
+    ("bookmarks", {"shared": "share-id", "_id": {"$gt": OTHER}}, [("_id", 1)]),
+    ("bookmarks", {"url": "https://example.com"}, None),
+    ("bookmarks", {"$or": [{"last_checked": None}, {"last_checked": {"$lt": NOW}}]}, [("last_checked", 1)]),
+
+    ("collections", {"user_id": USER}, None),
+    ("collections", {"_id": OTHER, "user_id": USER}, None),
+    ("collections", {"user_id": USER, "name": "Reading"}, None),
+
+    ("tag_counts", {"count": {"$gt": 0}}, [("count", -1)]),
+    ("daily_stats", {"_id": {"$gte": "2024-01-01"}}, [("_id", 1)]),
+    ("stats", {"_id": "global"}, None),
+    ("user_tags", {"user_id": USER, "count": {"$gt": 0}}, [("count", -1)]),
+    ("user_tags", {"user_id": USER, "tag": {"$in": ["python", "ml"]}}, None),
+    ("bookmarks", {"user_id": USER, "tags": {"$all": ["python", "ml"]}}, [("_id", 1)]),
+    ("bookmarks", {"user_id": USER, "tags": {"$in": ["python", "ml"]}}, [("_id", 1)]),
+
+    ("import_jobs", {"_id": OTHER, "user_id": USER}, None),
+    ("import_jobs", {"status": {"$in": ["queued", "running"]}, "lease_until": {"$lt": NOW}}, None),
+    ("import_jobs", {"status": "uploading", "lease_until": {"$lt": NOW}}, None),
+    ("import_rows", {"job_id": OTHER, "state": "pending"}, [("seq", 1)]),
+    ("import_rows", {"_id": OTHER}, None),
+
+    ("locks", {"_id": "link_checker"}, None),
+    ("shares", {"_id": "share-id"}, None),
+    ("suggestions", {"_id": USER}, None),
+    ("bookmarks", {"user_id": USER, "cluster": 3}, [("_id", 1)]),
+]
+
+
+def _stages(plan):
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _stages(item)
+
+
+def audit(shapes=QUERY_SHAPES) -> list:
+    """Returns (collection, filter, stages) for every shape that scans."""
+    db = get_sync_db()
+    failures = []
+    for name, filt, sort in shapes:
+        cursor = db[name].find(filt)
+        if sort:
+            cursor = cursor.sort(sort)
+        stages = list(_stages(cursor.explain()["queryPlanner"]["winningPlan"]))
+        status = "COLLSCAN" if "COLLSCAN" in stages else "ok"
+        print(f"{status:9} {name:12} {filt} {' > '.join(stages)}")
+        if status != "ok":
+            failures.append((name, filt, stages))
+    return failures
+
+
+if __name__ == "__main__":
+    asyncio.run(ensure_indexes())
+    failed = audit()
+    if failed:
+        print(f"\n{len(failed)} query shape(s) fall back to a collection scan")
+        sys.exit(1)
+    print(f"\nAll {len(QUERY_SHAPES)} query shapes use an index")
@@ -0,0 +1,50 @@
+# scripts/bench_duplicates.py
+"""
+Times search/duplicates.py on a synthetic library with planted
+near-duplicates and checks that every planted pair is found.
+
+Usage (from backend/):
+    python -m scripts.bench_duplicates [--n 50000] [--dim 384] [--every 97] [--tile 1024]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from search import duplicates
+
+
+def synthetic_library(n: int, dim: int, every: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(n, dim)).astype(np.float32)
+    # Row k*every + 1 is a slightly perturbed copy of row k*every.
+    copies = vectors[1::every]
+    copies[:] = vectors[0::every][:len(copies)] + 0.01 * rng.normal(size=copies.shape)
+    docs = [{"url": f"https://site{i}.example/"} for i in range(n)]
+    return docs, vectors, len(copies)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--every", type=int, default=97)
+    parser.add_argument("--tile", type=int, default=duplicates.DUPLICATE_TILE)
+    parser.add_argument("--threshold", type=float, default=duplicates.DUPLICATE_THRESHOLD)
+    args = parser.parse_args()
+
+    docs, vectors, planted = synthetic_library(args.n, args.dim, args.every)
+    duplicates.DUPLICATE_TILE = args.tile
+    started = time.perf_counter()
+    pairs = list(duplicates.similar_pairs(vectors, args.threshold, args.tile))
+    scan = time.perf_counter() - started
+    started = time.perf_counter()
+    clusters = duplicates.find_clusters(docs, vectors, args.threshold)
+    total = time.perf_counter() - started
+
+    found = {(i, j) for i, j, _ in pairs}
+    missed = sum(1 for k in range(planted) if (k * args.every, k * args.every + 1) not in found)
+    print(f"{args.n} vectors x {args.dim}, tile {args.tile}")
+    print(f"pair scan   {scan:6.2f} s  ({len(pairs)} pairs >= {args.threshold})")
+    print(f"clustering  {total:6.2f} s  ({len(clusters)} clusters)")
+    print(f"planted pairs missed: {missed} of {planted}")
@@ -0,0 +1,78 @@
+# scripts/bench_encoder.py
+"""
+Latency and throughput of the encoder backends in ml/encoders.py.
+
+For each backend: load time, single-text encode latency (the /search and
+/bookmarks/add path) as percentiles, and texts/s for batched encodes at
+several batch sizes (the import and batcher path).
+
+Usage (from backend/):
+    python -m scripts.bench_encoder [--backends torch torch-int8 onnx] [--queries 200] [--threads 4]
+"""
+import argparse
+import random
+import time
+
+from ml import encoders
+from ml.embedding import MODEL_NAME
+
+WORDS = (
+    "python rust database index query cache latency async http api guide tutorial "
+    "docs paper neural network embedding search vector kubernetes docker linux git "
+    "recipe pasta travel design react typescript css performance benchmark"
+).split()
+
+
+def sample_texts(n: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    # Titles plus descriptions of varying length, like real bookmarks.
+    return [" ".join(rng.choices(WORDS, k=rng.randint(4, 40))) for _ in range(n)]
+
+
+def percentiles(samples: list) -> str:
+    ordered = sorted(samples)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+
+    return f"p50 {pct(0.50):6.1f} ms  p95 {pct(0.95):6.1f} ms  p99 {pct(0.99):6.1f} ms"
+
+
+def bench(backend: str, queries: int, batch_sizes: list):
+    started = time.perf_counter()
+    encoder = encoders.load_encoder(MODEL_NAME, backend)
+    print(f"\n{backend}: loaded in {time.perf_counter() - started:.2f}s")
+
+    texts = sample_texts(max(queries, max(batch_sizes) * 4))
+    encoder.encode(texts[:8])  # warm-up
+    times = []
+    for text in texts[:queries]:
+        t = time.perf_counter()
+        encoder.encode([text], batch_size=1)
+        times.append(time.perf_counter() - t)
+    print(f"  single  {percentiles(times)}  ({1 / (sum(times) / len(times)):.0f} texts/s)")
+
+    for size in batch_sizes:
+        batch = texts[:size * 4]
+        t = time.perf_counter()
+        encoder.encode(batch, batch_size=size)
+        elapsed = time.perf_counter() - t
+        print(f"  batch {size:4d}  {len(batch) / elapsed:8.0f} texts/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", nargs="+", default=list(encoders.BACKENDS), choices=list(encoders.BACKENDS))
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[8, 32, 128])
+    parser.add_argument("--threads", type=int, default=None, help="overrides ENCODER_THREADS")
+    args = parser.parse_args()
+
+    if args.threads is not None:
+        encoders.ENCODER_THREADS = args.threads
+    print(f"{MODEL_NAME}, threads {encoders.ENCODER_THREADS or 'default'}")
+    for backend in args.backends:
+        try:
+            bench(backend, args.queries, args.batch_sizes)
+        except Exception as e:
+            print(f"\n{backend}: skipped ({e})")
@@ -0,0 +1,77 @@
+# scripts/bench_login.py
+"""
+Login storm against a running server: fires concurrent /login requests
+while probing /healthz, and reports latency percentiles for both. A healthy
+result keeps /healthz fast while logins queue in the password pool.
+
+Usage (from backend/, with the API running):
+    python -m scripts.bench_login --url http://localhost:8000 [--logins 200] [--concurrency 50]
+
+A throwaway account is registered first unless --email/--password are given.
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+import httpx
+
+
+def percentiles(samples: list) -> str:
+    if not samples:
+        return "no samples"
+    ordered = sorted(samples)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+
+    return f"p50 {pct(0.50):7.1f} ms  p95 {pct(0.95):7.1f} ms  p99 {pct(0.99):7.1f} ms  max {ordered[-1] * 1000:7.1f} ms"
+
+
+async def run(url: str, email: str, password: str, logins: int, concurrency: int):
+    limits = httpx.Limits(max_connections=concurrency + 5)
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+        if email is None:
+            email, password = f"bench-{uuid.uuid4().hex[:8]}@example.com", uuid.uuid4().hex
+            (await client.post("/register", json={"email": email, "password": password})).raise_for_status()
+
+        login_times, health_times, statuses = [], [], {}
+        semaphore = asyncio.Semaphore(concurrency)
+        done = asyncio.Event()
+
+        async def login():
+            async with semaphore:
+                started = time.perf_counter()
+                r = await client.post("/login", json={"email": email, "password": password})
+                login_times.append(time.perf_counter() - started)
+                statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+        async def probe():
+            while not done.is_set():
+                started = time.perf_counter()
+                await client.get("/healthz")
+                health_times.append(time.perf_counter() - started)
+                await asyncio.sleep(0.05)
+
+        prober = asyncio.create_task(probe())
+        started = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(logins)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await prober
+
+    print(f"{logins} logins at concurrency {concurrency} in {elapsed:.1f}s ({logins / elapsed:.1f}/s)")
+    print(f"status codes: {statuses}")
+    print(f"/login   {percentiles(login_times)}")
+    print(f"/healthz {percentiles(health_times)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--email")
+    parser.add_argument("--password")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.email, args.password, args.logins, args.concurrency))
@@ -0,0 +1,93 @@
+# scripts/bench_serialization.py
+"""
+Compares the old response path (convert_objectid_to_str, then FastAPI's
+jsonable_encoder, then json.dumps) with responses.dumps on synthetic
+bookmark documents shaped like the ones the listing routes return.
+
+Usage (from backend/):
+    python -m scripts.bench_serialization [--docs 500] [--rounds 20] [--with-embeddings]
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+
+from responses import dumps
+
+
+def convert_objectid_to_str(doc):
+    # The helper every route used to call before responses.py existed.
+    if isinstance(doc, list):
+        return [convert_objectid_to_str(item) for item in doc]
+    if isinstance(doc, dict):
+        return {k: convert_objectid_to_str(v) for k, v in doc.items()}
+    if isinstance(doc, ObjectId):
+        return str(doc)
+    return doc
+
+
+def make_docs(n: int, with_embeddings: bool) -> list:
+    user_id = ObjectId()
+    now = datetime.utcnow()
+    docs = []
+    for i in range(n):
+        doc = {
+            "_id": ObjectId(),
+            "user_id": user_id,
+            "url": f"https://example.com/articles/{i}",
+            "title": f"Example article number {i}",
+            "description": "A reasonably long description of the page " * 3,
+            "tags": ["python", "fastapi", "mongodb", "search", "ml"],
+            "status": "alive",
+            "is_broken": False,
+            "http_status": 200,
+            "final_url": f"https://example.com/articles/{i}",
+            "etag": f'W/"{i:08x}"',
+            "last_modified": None,
+            "shared": False,
+            "visit_count": i % 7,
+            "created_at": now,
+            "last_checked": now,
+            "updated_at": now,
+        }
+        if with_embeddings:
+            doc["embedding"] = [((i * 31 + j) % 997) / 997.0 for j in range(384)]
+        docs.append(doc)
+    return docs
+
+
+def old_path(docs) -> bytes:
+    return json.dumps(jsonable_encoder(convert_objectid_to_str(docs))).encode()
+
+
+def new_path(docs) -> bytes:
+    return dumps(docs)
+
+
+def bench(fn, docs, rounds: int) -> float:
+    fn(docs)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fn(docs)
+    return (time.perf_counter() - started) / rounds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--with-embeddings", action="store_true")
+    args = parser.parse_args()
+
+    docs = make_docs(args.docs, args.with_embeddings)
+    assert json.loads(old_path(docs)) == json.loads(new_path(docs)), "outputs differ"
+
+    old = bench(old_path, docs, args.rounds)
+    new = bench(new_path, docs, args.rounds)
+    print(f"{args.docs} docs, embeddings={'yes' if args.with_embeddings else 'no'}")
+    print(f"convert_objectid_to_str + jsonable_encoder: {old * 1000:8.2f} ms")
+    print(f"MongoJSONResponse (orjson):                 {new * 1000:8.2f} ms")
+    print(f"speedup: {old / new:.1f}x")
@@ -0,0 +1,95 @@
+# scripts/check_encoder_parity.py
+"""
+Checks that an encoder backend (ml/encoders.py) reproduces the embeddings
+already stored for bookmarks, before ENCODER_BACKEND is switched in
+production.
+
+A sample of bookmarks is re-encoded from the same text the app embeds
+(ml/embedding.document_text) and compared with the stored vectors by
+cosine similarity. Exits non-zero if the mean or the worst case falls
+below the thresholds.
+
+Usage (from backend/):
+    python -m scripts.check_encoder_parity --backend torch-int8 [--sample 500]
+    python -m scripts.check_encoder_parity --backend onnx --offline   # vs fresh fp32, no database
+
+Stored int8 embeddings (EMBEDDING_FORMAT=int8) carry their own ~0.999
+quantization error, which shows up in the numbers as well.
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from ml.embedding import MODEL_NAME, document_text
+from ml.encoders import BACKENDS, load_encoder
+from search import embedding_codec
+
+OFFLINE_TEXTS = [
+    "Requests: HTTP for Humans Python library for sending HTTP requests",
+    "The Rust Programming Language book",
+    "PostgreSQL documentation: indexes and query planning",
+    "How to make fresh pasta at home",
+    "MDN Web Docs: Using the Fetch API",
+    "Attention Is All You Need (transformer paper)",
+    "Kubernetes deployment strategies explained",
+    "FastAPI tutorial: dependencies and background tasks",
+    "NumPy broadcasting rules",
+    "A visual guide to git rebase",
+    "",
+    "x",
+]
+
+
+def load_sample(n: int):
+    from db import get_sync_db
+    docs = list(get_sync_db().bookmarks.aggregate([
+        {"$match": {"embedding": {"$exists": True}}},
+        {"$sample": {"size": n}},
+        {"$project": {"title": 1, "description": 1, "embedding": 1}},
+    ]))
+    texts = [document_text(d.get("title") or "", d.get("description") or "") for d in docs]
+    reference = np.array([embedding_codec.decode(d["embedding"]) for d in docs], dtype=np.float32)
+    return texts, reference
+
+
+def cosine_rows(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    na = np.linalg.norm(a, axis=1)
+    nb = np.linalg.norm(b, axis=1)
+    return np.einsum("ij,ij->i", a, b) / np.where(na * nb == 0, 1, na * nb)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=sorted(BACKENDS), required=True)
+    parser.add_argument("--sample", type=int, default=500)
+    parser.add_argument("--offline", action="store_true", help="compare with a fresh fp32 torch encode instead of stored vectors")
+    parser.add_argument("--min-mean", type=float, default=0.99)
+    parser.add_argument("--min-cosine", type=float, default=0.95)
+    args = parser.parse_args()
+
+    if args.offline:
+        texts = OFFLINE_TEXTS
+        reference = load_encoder(MODEL_NAME, "torch").encode(texts)
+    else:
+        texts, reference = load_sample(args.sample)
+    if not texts:
+        raise SystemExit("No stored embeddings to compare against")
+
+    started = time.perf_counter()
+    encoder = load_encoder(MODEL_NAME, args.backend)
+    print(f"Loaded {args.backend} in {time.perf_counter() - started:.2f}s")
+    vectors = encoder.encode(texts)
+    if vectors.shape != reference.shape:
+        raise SystemExit(f"Shape mismatch: {vectors.shape} vs stored {reference.shape}")
+
+    cos = cosine_rows(vectors, reference)
+    worst = np.argsort(cos)[:3]
+    print(f"{len(texts)} texts  mean {cos.mean():.5f}  p1 {np.percentile(cos, 1):.5f}  min {cos.min():.5f}")
+    for i in worst:
+        print(f"  {cos[i]:.5f}  {texts[i][:70]!r}")
+    if cos.mean() < args.min_mean or cos.min() < args.min_cosine:
+        print(f"FAIL: need mean >= {args.min_mean} and min >= {args.min_cosine}")
+        sys.exit(1)
+    print("OK")
@@ -0,0 +1,78 @@
+# scripts/compare_embedding_formats.py
+"""
+Measures search recall and storage size for each embedding format in
+search/embedding_codec.py against float64 ground truth.
+
+Every sampled vector is round-tripped through encode/decode, then a set of
+held-out vectors is used as queries; recall@k is the overlap between the
+exact top-k over the original vectors and over the decoded ones.
+
+Usage (from backend/):
+    python -m scripts.compare_embedding_formats [--sample 5000] [--queries 200] [--k 10]
+    python -m scripts.compare_embedding_formats --synthetic   # no database needed
+"""
+import argparse
+
+import numpy as np
+from bson import BSON
+
+from search import embedding_codec
+
+
+def load_sample(n: int) -> np.ndarray:
+    from db import get_sync_db
+    docs = get_sync_db().bookmarks.aggregate([
+        {"$match": {"embedding": {"$exists": True}}},
+        {"$sample": {"size": n}},
+        {"$project": {"embedding": 1}},
+    ])
+    return np.array([embedding_codec.decode(d["embedding"]) for d in docs], dtype=np.float64)
+
+
+def synthetic_sample(n: int, dim: int = 384, clusters: int = 50, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    return centers[rng.integers(clusters, size=n)] + 0.6 * rng.normal(size=(n, dim))
+
+
+def _normalize(m: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    return m / np.where(norms == 0, 1, norms)
+
+
+def _top_k(matrix: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    scores = queries @ matrix.T
+    return np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+
+def compare(vectors: np.ndarray, n_queries: int, k: int) -> list:
+    queries, corpus = _normalize(vectors[:n_queries]), vectors[n_queries:]
+    truth = _top_k(_normalize(corpus), queries, k)
+
+    rows = []
+    for fmt in embedding_codec.FORMATS:
+        encoded = [embedding_codec.encode(v, fmt) for v in corpus]
+        decoded = _normalize(np.array([embedding_codec.decode(e) for e in encoded], dtype=np.float64))
+        found = _top_k(decoded, queries, k)
+        recall = np.mean([len(set(t) & set(f)) / k for t, f in zip(truth, found)])
+        size = np.mean([len(BSON.encode({"embedding": e})) for e in encoded[:100]])
+        rows.append((fmt, recall, size))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sample", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--synthetic", action="store_true")
+    args = parser.parse_args()
+
+    vectors = synthetic_sample(args.sample) if args.synthetic else load_sample(args.sample)
+    if len(vectors) <= args.queries + args.k:
+        raise SystemExit(f"Need more than {args.queries + args.k} embeddings, found {len(vectors)}")
+
+    print(f"{len(vectors) - args.queries} vectors, {args.queries} queries, dim {vectors.shape[1]}")
+    print(f"{'format':8} {'recall@' + str(args.k):>10} {'bytes/vector':>13}")
+    for fmt, recall, size in compare(vectors, args.queries, args.k):
+        print(f"{fmt:8} {recall:10.4f} {size:13.0f}")
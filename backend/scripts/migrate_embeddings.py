@@ -0,0 +1,83 @@
+# scripts/migrate_embeddings.py
+"""
+Rewrites stored bookmark embeddings into another format (see
+search/embedding_codec.py) while the app keeps running.
+
+Usage (from backend/):
+    python -m scripts.migrate_embeddings [--to float32|int8|list] [--batch 500] [--pause 0.1] [--dry-run]
+
+Documents are walked in _id order in batches. Each rewrite is conditional
+on the embedding still holding the value that was read, so a bookmark
+edited mid-migration keeps its new embedding (already written in the
+current EMBEDDING_FORMAT) instead of being overwritten. updated_at is left
+alone: the vectors are equivalent, so search indexes need no resync.
+Safe to stop and re-run; converted documents are skipped.
+
+Going from int8 back to float32 does not recover the precision lost to
+quantization; re-embed instead if that matters.
+"""
+import argparse
+import time
+
+from bson import BSON
+from pymongo import UpdateOne
+
+from db import get_sync_db
+from search import embedding_codec
+
+
+def migrate(target: str, batch_size: int = 500, pause: float = 0.0, dry_run: bool = False) -> dict:
+    db = get_sync_db()
+    counts = {"scanned": 0, "converted": 0, "skipped": 0, "conflicts": 0, "bytes_before": 0, "bytes_after": 0}
+    query = {"embedding": {"$exists": True}}
+    last_id = None
+    while True:
+        page_query = dict(query)
+        if last_id is not None:
+            page_query["_id"] = {"$gt": last_id}
+        docs = list(db.bookmarks.find(page_query, {"embedding": 1}).sort("_id", 1).limit(batch_size))
+        if not docs:
+            break
+        last_id = docs[-1]["_id"]
+
+        ops = []
+        for doc in docs:
+            counts["scanned"] += 1
+            old = doc["embedding"]
+            if embedding_codec.format_of(old) == target:
+                counts["skipped"] += 1
+                continue
+            new = embedding_codec.encode(embedding_codec.decode(old), target)
+            counts["bytes_before"] += _size(old)
+            counts["bytes_after"] += _size(new)
+            ops.append(UpdateOne({"_id": doc["_id"], "embedding": old}, {"$set": {"embedding": new}}))
+
+        if ops and not dry_run:
+            res = db.bookmarks.bulk_write(ops, ordered=False)
+            counts["converted"] += res.modified_count
+            counts["conflicts"] += len(ops) - res.matched_count
+        elif ops:
+            counts["converted"] += len(ops)
+        print(f"... {counts['scanned']} scanned, {counts['converted']} converted")
+        if pause:
+            time.sleep(pause)
+    return counts
+
+
+def _size(value) -> int:
+    return len(BSON.encode({"embedding": value}))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--to", default=embedding_codec.EMBEDDING_FORMAT, choices=embedding_codec.FORMATS)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    result = migrate(args.to, args.batch, args.pause, args.dry_run)
+    print(result)
+    if result["bytes_before"]:
+        print(f"embedding bytes: {result['bytes_before']} -> {result['bytes_after']} "
+              f"({result['bytes_after'] / result['bytes_before']:.0%})")
@@ -0,0 +1,192 @@
+# search/ann.py
+"""
+Approximate nearest-neighbour segments for the per-user vector index.
+
+A segment is an immutable snapshot of a user's normalized embeddings,
+written to disk once and opened with np.load(mmap_mode="r"), so process
+restarts and sibling uvicorn workers share the same page cache instead of
+rebuilding from Mongo.
+
+Layout of a segment directory:
+    meta.json       backend name, build time, row count, dimension
+    vectors.npy     float32 (n, dim), rows grouped by inverted list
+    ids.npy         bookmark ids in the same row order
+    centroids.npy   float32 (nlist, dim) coarse quantizer   (ivf only)
+    offsets.npy     int64 (nlist + 1) list boundaries        (ivf only)
+
+Backends are registered in BACKENDS and selected with ANN_BACKEND.
+"""
+import json
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime
+
+import numpy as np
+
+INDEX_DIR = os.getenv("INDEX_DIR", "index_data")
+# Default number of inverted lists probed per query; higher means better
+# recall and slower queries. Requests can override it per search.
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "8"))
+# Stale segment directories are removed once they are this old; mappings
+# already held by other workers stay valid after unlink.
+SEGMENT_RETENTION_SECONDS = 3600
+
+
+def _kmeans(vectors: np.ndarray, nlist: int, iters: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on a training sample; returns normalized centroids."""
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    sample = vectors
+    if n > nlist * 64:
+        sample = vectors[rng.choice(n, nlist * 64, replace=False)]
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iters):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        counts = np.bincount(assign, minlength=nlist)
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.where(norms == 0, 1, norms)
+    return centroids.astype(np.float32)
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray, chunk: int = 8192) -> np.ndarray:
+    out = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk):
+        out[start:start + chunk] = np.argmax(vectors[start:start + chunk] @ centroids.T, axis=1)
+    return out
+
+
+class FlatSegment:
+    """Exact scan over a memory-mapped segment."""
+    name = "flat"
+
+    def __init__(self, path: str, meta: dict):
+        self.path = path
+        self.meta = meta
+        self.built_at = datetime.fromisoformat(meta["built_at"])
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.ids = [str(i) for i in np.load(os.path.join(path, "ids.npy"))]
+        self.rows = {bid: row for row, bid in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def write(cls, path: str, ids, vectors: np.ndarray) -> dict:
+        np.save(os.path.join(path, "vectors.npy"), vectors)
+        return {}
+
+    def _top(self, rows: np.ndarray, scores: np.ndarray, k: int):
+        if k < len(scores):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[rows[i]], float(scores[i])) for i in top]
+
+    def search(self, query: np.ndarray, k: int, nprobe: int = None):
+        return self._top(np.arange(len(self.ids)), np.asarray(self.vectors @ query), k)
+
+
+class IVFSegment(FlatSegment):
+    """Inverted-file index: only the nprobe lists closest to the query are scanned."""
+    name = "ivf"
+
+    def __init__(self, path: str, meta: dict):
+        super().__init__(path, meta)
+        self.centroids = np.load(os.path.join(path, "centroids.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"))
+
+    @classmethod
+    def write(cls, path: str, ids, vectors: np.ndarray) -> dict:
+        nlist = int(min(4096, max(1, np.sqrt(len(vectors)))))
+        centroids = _kmeans(vectors, nlist)
+        assign = _assign(vectors, centroids)
+        order = np.argsort(assign, kind="stable")
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assign, minlength=nlist))
+
+        np.save(os.path.join(path, "vectors.npy"), vectors[order])
+        np.save(os.path.join(path, "centroids.npy"), centroids)
+        np.save(os.path.join(path, "offsets.npy"), offsets)
+        return {"nlist": nlist, "order": order}
+
+    def search(self, query: np.ndarray, k: int, nprobe: int = None):
+        nlist = len(self.centroids)
+        nprobe = max(1, min(nlist, nprobe or ANN_NPROBE))
+        if nprobe >= nlist:
+            return super().search(query, k)
+
+        probe = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        rows = np.concatenate([
+            np.arange(self.offsets[i], self.offsets[i + 1]) for i in probe
+        ])
+        if len(rows) == 0:
+            return []
+        return self._top(rows, self.vectors[rows] @ query, k)
+
+
+BACKENDS = {cls.name: cls for cls in (FlatSegment, IVFSegment)}
+
+
+def _user_dir(user_id: str) -> str:
+    return os.path.join(INDEX_DIR, user_id)
+
+
+def open_segment(user_id: str):
+    """Opens the user's current segment, or returns None if there is none."""
+    user_dir = _user_dir(user_id)
+    try:
+        with open(os.path.join(user_dir, "CURRENT")) as f:
+            name = f.read().strip()
+        path = os.path.join(user_dir, name)
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        return BACKENDS[meta["backend"]](path, meta)
+    except (OSError, ValueError, KeyError) as e:
+        if not isinstance(e, FileNotFoundError):
+            print(f"Could not open index segment for {user_id}: {e}")
+        return None
+
+
+def build_segment(user_id: str, backend: str, ids, vectors: np.ndarray, built_at: datetime):
+    """Writes a new segment, atomically makes it current and returns it opened."""
+    cls = BACKENDS[backend]
+    user_dir = _user_dir(user_id)
+    name = f"seg-{int(time.time())}-{uuid.uuid4().hex[:8]}"
+    path = os.path.join(user_dir, name)
+    os.makedirs(path)
+
+    extra = cls.write(path, ids, vectors)
+    order = extra.pop("order", None)
+    id_array = np.asarray(ids, dtype="U24")
+    np.save(os.path.join(path, "ids.npy"), id_array if order is None else id_array[order])
+    meta = {
+        "backend": backend,
+        "built_at": built_at.isoformat(),
+        "count": len(ids),
+        "dim": int(vectors.shape[1]),
+        **extra,
+    }
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+    tmp = os.path.join(user_dir, f"CURRENT.{uuid.uuid4().hex[:8]}")
+    with open(tmp, "w") as f:
+        f.write(name)
+    os.replace(tmp, os.path.join(user_dir, "CURRENT"))
+    _cleanup(user_dir, keep=name)
+    return cls(path, meta)
+
+
+def _cleanup(user_dir: str, keep: str):
+    cutoff = time.time() - SEGMENT_RETENTION_SECONDS
+    for entry in os.scandir(user_dir):
+        if entry.is_dir() and entry.name != keep and entry.stat().st_mtime < cutoff:
+            shutil.rmtree(entry.path, ignore_errors=True)
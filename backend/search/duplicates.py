@@ -0,0 +1,135 @@
+# search/duplicates.py
+"""
+Near-duplicate detection over one user's library, for GET /bookmarks/duplicates.
+
+Two bookmarks are linked when
+  * their URLs, or the URLs they redirect to, share a canonical form
+    (utils.canonical_url: scheme, www., tracking params, param order,
+    fragments and trailing slashes ignored), or
+  * their embeddings have cosine similarity >= threshold.
+
+Similarity is computed exactly over all pairs, but tile by tile: the
+normalized float32 matrix is multiplied in DUPLICATE_TILE x DUPLICATE_TILE
+blocks on and above the diagonal into reused buffers, and only positions
+over the threshold leave NumPy. Memory stays at one tile whatever the
+library size; time is dominated by the n^2/2 dot products (BLAS, so it
+scales with the cores available).
+
+Linked bookmarks are grouped into clusters with a union-find that keeps
+each root's reasons and lowest linking score, so memory is O(n) however
+many pairs match. A scan that finds more than DUPLICATE_MAX_PAIRS pairs
+is stopped with TooManyPairs: at that point the threshold is too low to
+produce useful clusters.
+"""
+import os
+
+import numpy as np
+
+from utils import canonical_url
+
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", "0.95"))
+DUPLICATE_TILE = int(os.getenv("DUPLICATE_TILE", "1024"))
+DUPLICATE_MAX_PAIRS = int(os.getenv("DUPLICATE_MAX_PAIRS", "1000000"))
+
+
+class TooManyPairs(ValueError):
+    pass
+
+
+class _UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+        # Per root: why its members are linked and the lowest similarity used.
+        self.reasons = {}
+        self.score = {}
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, a: int, b: int, reason: str, score: float = None):
+        ra, rb = self.find(a), self.find(b)
+        root, child = min(ra, rb), max(ra, rb)
+        if ra != rb:
+            self.parent[child] = root
+            self.reasons.setdefault(root, set()).update(self.reasons.pop(child, ()))
+            if child in self.score:
+                self._lower(root, self.score.pop(child))
+        self.reasons.setdefault(root, set()).add(reason)
+        if score is not None:
+            self._lower(root, score)
+
+    def _lower(self, root: int, score: float):
+        current = self.score.get(root)
+        self.score[root] = score if current is None else min(current, score)
+
+
+def similar_pairs(vectors: np.ndarray, threshold: float, tile: int = DUPLICATE_TILE):
+    """Yields (i, j, cosine) with i < j for every pair at or above threshold."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    m = np.ascontiguousarray(vectors / np.where(norms == 0, 1, norms), dtype=np.float32)
+    n = len(m)
+    # Reused for every tile, so the scan allocates nothing per block.
+    scores_buf = np.empty((tile, tile), dtype=np.float32)
+    hits_buf = np.empty((tile, tile), dtype=bool)
+    upper = np.triu(np.ones((tile, tile), dtype=bool), k=1)
+    for i in range(0, n, tile):
+        block = m[i:i + tile]
+        for j in range(i, n, tile):
+            other = m[j:j + tile]
+            scores = np.matmul(block, other.T, out=scores_buf[:len(block), :len(other)])
+            hits = np.greater_equal(scores, threshold, out=hits_buf[:len(block), :len(other)])
+            if i == j:
+                # Each pair once, and never a row with itself.
+                hits &= upper[:len(block), :len(other)]
+            rows = np.flatnonzero(hits.any(axis=1))
+            if not len(rows):
+                continue
+            r, c = np.nonzero(hits[rows])
+            r = rows[r]
+            for a, b, s in zip(r.tolist(), c.tolist(), scores[r, c].tolist()):
+                yield i + a, j + b, s
+
+
+def find_clusters(
+    docs: list,
+    vectors: np.ndarray = None,
+    threshold: float = DUPLICATE_THRESHOLD,
+    max_pairs: int = DUPLICATE_MAX_PAIRS,
+) -> list:
+    """
+    Groups docs (dicts with url and optional final_url) into duplicate
+    clusters. vectors, if given, holds one embedding per doc, with rows of
+    zeros for docs without one.
+
+    Returns clusters as {"members": [doc indexes], "reasons": set, "score":
+    lowest linking similarity or None}, largest first. Raises TooManyPairs
+    once more than max_pairs similar pairs are found.
+    """
+    uf = _UnionFind(len(docs))
+
+    by_url = {}
+    for i, doc in enumerate(docs):
+        keys = {canonical_url(u) for u in (doc.get("url"), doc.get("final_url")) if u}
+        for key in keys:
+            first = by_url.setdefault(key, i)
+            if first != i:
+                uf.union(first, i, "url")
+
+    if vectors is not None and len(vectors) > 1:
+        for count, (i, j, s) in enumerate(similar_pairs(vectors, threshold), 1):
+            if count > max_pairs:
+                raise TooManyPairs(f"More than {max_pairs} pairs at threshold {threshold}")
+            uf.union(i, j, "similar", s)
+
+    groups = {}
+    for i in range(len(docs)):
+        groups.setdefault(uf.find(i), []).append(i)
+    clusters = [
+        {"members": members, "reasons": uf.reasons.get(root, set()), "score": uf.score.get(root)}
+        for root, members in groups.items()
+        if len(members) > 1
+    ]
+    return sorted(clusters, key=lambda c: len(c["members"]), reverse=True)
@@ -0,0 +1,76 @@
+# search/embedding_codec.py
+"""
+Storage format for bookmark embeddings.
+
+Embeddings are written as BSON Binary subtype 9 (the Mongo vector layout:
+one dtype byte, one padding byte, then the packed little-endian values):
+
+  float32  4 bytes per dimension; decoded with np.frombuffer as a read-only
+           view of the BSON bytes, no copy.
+  int8     1 byte per dimension, scalar-quantized as v / max|v| * 127. The
+           per-vector scale is not stored: search only uses cosine
+           similarity and every vector is re-normalized when indexed.
+  list     the legacy BSON array of doubles (about 9 bytes per dimension).
+
+EMBEDDING_FORMAT picks what new writes use; decode() reads all three, so
+documents can be migrated online with scripts/migrate_embeddings.py.
+"""
+import os
+
+import numpy as np
+from bson.binary import Binary, BinaryVectorDtype, VECTOR_SUBTYPE
+
+EMBEDDING_FORMAT = os.getenv("EMBEDDING_FORMAT", "float32")
+FORMATS = ("float32", "int8", "list")
+
+_DTYPES = {
+    "float32": (BinaryVectorDtype.FLOAT32.value, np.dtype("<f4")),
+    "int8": (BinaryVectorDtype.INT8.value, np.dtype("i1")),
+}
+_BY_HEADER = {header: (name, dtype) for name, (header, dtype) in _DTYPES.items()}
+
+
+def quantize_int8(vec) -> np.ndarray:
+    v = np.asarray(vec, dtype=np.float32)
+    peak = float(np.abs(v).max()) if v.size else 0.0
+    if peak == 0:
+        return np.zeros(v.shape, dtype=np.int8)
+    return np.clip(np.rint(v * (127.0 / peak)), -127, 127).astype(np.int8)
+
+
+def encode(vec, fmt: str = None):
+    """Returns the value to store in a bookmark's `embedding` field."""
+    fmt = fmt or EMBEDDING_FORMAT
+    if fmt == "list":
+        return np.asarray(vec, dtype=np.float64).tolist()
+    if fmt == "int8":
+        data = quantize_int8(vec)
+    elif fmt == "float32":
+        data = np.asarray(vec, dtype="<f4")
+    else:
+        raise ValueError(f"Unknown embedding format {fmt!r}; expected one of {FORMATS}")
+    header, _ = _DTYPES[fmt]
+    return Binary(header + b"\x00" + data.tobytes(), VECTOR_SUBTYPE)
+
+
+def _binary_entry(value):
+    entry = _BY_HEADER.get(bytes(value[:1]))
+    if entry is None:
+        raise ValueError("Unsupported binary embedding dtype")
+    return entry
+
+
+def format_of(value) -> str:
+    if isinstance(value, (bytes, bytearray)):
+        return _binary_entry(value)[0]
+    return "list"
+
+
+def decode(value) -> np.ndarray:
+    """
+    Returns the stored embedding as a 1-d array: a zero-copy float32 view
+    for float32 vectors, int8 for quantized ones, float32 for legacy lists.
+    """
+    if isinstance(value, (bytes, bytearray)):
+        return np.frombuffer(value, dtype=_binary_entry(value)[1], offset=2)
+    return np.asarray(value, dtype=np.float32)
@@ -0,0 +1,193 @@
+# search/lexical_index.py
+"""
+Per-user BM25 inverted index used by the lexical and hybrid modes of
+POST /search.
+
+Each bookmark is tokenized from its title, description, tags and URL host;
+fields are weighted by repeating their terms (FIELD_WEIGHTS), so an exact
+hit on a title, tag or domain outranks one buried in a description.
+Postings map term -> {bookmark_id: weighted tf}, and a query only touches
+the postings of its own terms.
+
+Lifecycle mirrors search/vector_index.py: built lazily on first search,
+kept current by the write paths calling upsert()/remove(), and synced from
+`updated_at` every INDEX_SYNC_SECONDS to pick up other workers' writes.
+"""
+import asyncio
+import heapq
+import math
+import re
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime
+from urllib.parse import urlsplit
+
+from bson import ObjectId
+
+from db import db
+from search.vector_index import INDEX_MAX_USERS, INDEX_SYNC_SECONDS, SYNC_SKEW
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+FIELD_WEIGHTS = {"title": 3, "tags": 2, "host": 2, "description": 1}
+TEXT_FIELDS = {"title": 1, "description": 1, "tags": 1, "url": 1}
+
+_TOKEN = re.compile(r"[^\W_]+")
+_HOST_NOISE = {"www", "com", "org", "net", "io"}
+
+
+def tokenize(text: str) -> list:
+    return _TOKEN.findall(text.lower()) if text else []
+
+
+def host_terms(url: str) -> list:
+    host = urlsplit(url or "").hostname or ""
+    return [t for t in tokenize(host) if t not in _HOST_NOISE]
+
+
+def doc_terms(doc: dict) -> Counter:
+    """Weighted term frequencies for one bookmark."""
+    terms = Counter()
+    for tok in tokenize(doc.get("title")):
+        terms[tok] += FIELD_WEIGHTS["title"]
+    for tok in tokenize(doc.get("description")):
+        terms[tok] += FIELD_WEIGHTS["description"]
+    for tok in tokenize(" ".join(doc.get("tags") or [])):
+        terms[tok] += FIELD_WEIGHTS["tags"]
+    for tok in host_terms(doc.get("url")):
+        terms[tok] += FIELD_WEIGHTS["host"]
+    return terms
+
+
+class LexicalIndex:
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.lock = asyncio.Lock()
+        self.loaded = False
+        self.synced_at = None
+        self.checked_at = 0.0
+        self.postings = {}
+        self.doc_len = {}
+        self.total_len = 0
+        self._terms = {}
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    def upsert(self, bid: str, terms: Counter):
+        self.remove(bid)
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[bid] = tf
+        length = sum(terms.values())
+        self._terms[bid] = list(terms)
+        self.doc_len[bid] = length
+        self.total_len += length
+
+    def remove(self, bid: str):
+        terms = self._terms.pop(bid, None)
+        if terms is None:
+            return
+        for term in terms:
+            plist = self.postings[term]
+            del plist[bid]
+            if not plist:
+                del self.postings[term]
+        self.total_len -= self.doc_len.pop(bid)
+
+    def search(self, query: str, k: int, candidates: set = None):
+        """Top k (bookmark_id, bm25 score), best first, optionally within candidates."""
+        n = len(self.doc_len)
+        if n == 0 or k <= 0:
+            return []
+        avg_len = self.total_len / n
+        scores = {}
+        for term in set(tokenize(query)):
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            idf = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            if candidates is None:
+                hits = plist.items()
+            elif len(candidates) < len(plist):
+                hits = ((bid, plist[bid]) for bid in candidates if bid in plist)
+            else:
+                hits = ((bid, tf) for bid, tf in plist.items() if bid in candidates)
+            for bid, tf in hits:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len[bid] / avg_len)
+                scores[bid] = scores.get(bid, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+_indexes = OrderedDict()
+
+
+def _get(user_id: str, create: bool):
+    idx = _indexes.get(user_id)
+    if idx is not None:
+        _indexes.move_to_end(user_id)
+    elif create:
+        idx = _indexes[user_id] = LexicalIndex(user_id)
+        while len(_indexes) > INDEX_MAX_USERS:
+            _indexes.popitem(last=False)
+    return idx
+
+
+async def _load(idx: LexicalIndex):
+    started = datetime.utcnow()
+    async for doc in db.bookmarks.find({"user_id": ObjectId(idx.user_id)}, TEXT_FIELDS):
+        idx.upsert(str(doc["_id"]), doc_terms(doc))
+    idx.loaded = True
+    idx.synced_at = started
+    idx.checked_at = time.monotonic()
+
+
+async def _sync(idx: LexicalIndex):
+    started = datetime.utcnow()
+    user_oid = ObjectId(idx.user_id)
+    changed = db.bookmarks.find(
+        {"user_id": user_oid, "updated_at": {"$gte": idx.synced_at - SYNC_SKEW}},
+        TEXT_FIELDS,
+    )
+    async for doc in changed:
+        idx.upsert(str(doc["_id"]), doc_terms(doc))
+
+    live = {str(d["_id"]) async for d in db.bookmarks.find({"user_id": user_oid}, {"_id": 1})}
+    for bid in [b for b in idx.doc_len if b not in live]:
+        idx.remove(bid)
+    idx.synced_at = started
+    idx.checked_at = time.monotonic()
+
+
+async def get_user_index(user_id: str) -> LexicalIndex:
+    """Returns the user's index, building or syncing it from Mongo as needed."""
+    idx = _get(str(user_id), create=True)
+    async with idx.lock:
+        if not idx.loaded:
+            await _load(idx)
+        elif time.monotonic() - idx.checked_at > INDEX_SYNC_SECONDS:
+            await _sync(idx)
+    return idx
+
+
+async def search(user_id: str, query: str, k: int, candidates: set = None):
+    idx = await get_user_index(user_id)
+    return idx.search(query, k, candidates)
+
+
+async def upsert_many(user_id: str, docs: list):
+    # Like the vector index, only users who already searched have one to update.
+    idx = _get(str(user_id), create=False)
+    if idx is None:
+        return
+    async with idx.lock:
+        if idx.loaded:
+            for doc in docs:
+                idx.upsert(str(doc["_id"]), doc_terms(doc))
+
+
+async def remove(user_id: str, bookmark_id):
+    idx = _get(str(user_id), create=False)
+    if idx is None:
+        return
+    async with idx.lock:
+        idx.remove(str(bookmark_id))
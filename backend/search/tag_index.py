@@ -0,0 +1,164 @@
+# search/tag_index.py
+"""
+Per-user tag counts for facets, autocomplete and multi-tag filters.
+
+Counts are stored in `user_tags` (one document per user and tag) and kept
+current by the add/edit/delete/import paths calling apply(); the stats
+reconciliation (workers/stats.py) rewrites them from the bookmarks in the
+same pass that recounts the global tags.
+
+For autocomplete each user's tags are also held in an in-memory prefix
+trie, loaded from `user_tags` on first use, updated in place by this
+process's writes and reloaded after TAG_INDEX_SYNC_SECONDS so writes from
+other app workers show up. None of this reads the bookmarks collection.
+"""
+import heapq
+import os
+import time
+from collections import Counter, OrderedDict
+
+from bson import ObjectId
+from pymongo import DESCENDING, UpdateOne
+
+from db import db
+
+TAG_INDEX_SYNC_SECONDS = float(os.getenv("TAG_INDEX_SYNC_SECONDS", "300"))
+TAG_INDEX_MAX_USERS = int(os.getenv("TAG_INDEX_MAX_USERS", "1000"))
+
+
+class TagTrie:
+    """Case-insensitive prefix trie mapping tags to bookmark counts."""
+
+    __slots__ = ("children", "tags")
+
+    def __init__(self):
+        self.children = {}
+        self.tags = None
+
+    def _node(self, key: str, create: bool):
+        node = self
+        for ch in key:
+            nxt = node.children.get(ch)
+            if nxt is None:
+                if not create:
+                    return None
+                nxt = node.children[ch] = TagTrie()
+            node = nxt
+        return node
+
+    def add(self, tag: str, delta: int):
+        node = self._node(tag.lower(), create=True)
+        if node.tags is None:
+            node.tags = {}
+        count = node.tags.get(tag, 0) + delta
+        if count > 0:
+            node.tags[tag] = count
+        else:
+            node.tags.pop(tag, None)
+
+    def _walk(self):
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node.tags:
+                yield from node.tags.items()
+            stack.extend(node.children.values())
+
+    def complete(self, prefix: str, limit: int) -> list:
+        """Most used tags starting with prefix, as (tag, count), best first."""
+        node = self._node(prefix.lower(), create=False)
+        if node is None:
+            return []
+        return heapq.nlargest(limit, node._walk(), key=lambda item: (item[1], item[0]))
+
+
+class _Entry:
+    __slots__ = ("trie", "loaded_at")
+
+    def __init__(self, trie: TagTrie):
+        self.trie = trie
+        self.loaded_at = time.monotonic()
+
+
+_tries = OrderedDict()
+
+
+async def _load(user_id: str) -> TagTrie:
+    trie = TagTrie()
+    async for doc in db.user_tags.find({"user_id": ObjectId(user_id), "count": {"$gt": 0}}, {"tag": 1, "count": 1}):
+        trie.add(doc["tag"], doc["count"])
+    return trie
+
+
+async def get_trie(user_id: str) -> TagTrie:
+    user_id = str(user_id)
+    entry = _tries.get(user_id)
+    if entry is None or time.monotonic() - entry.loaded_at > TAG_INDEX_SYNC_SECONDS:
+        entry = _tries[user_id] = _Entry(await _load(user_id))
+        while len(_tries) > TAG_INDEX_MAX_USERS:
+            _tries.popitem(last=False)
+    _tries.move_to_end(user_id)
+    return entry.trie
+
+
+def tag_deltas(before=(), after=()) -> Counter:
+    """Per-tag change when a bookmark's tags go from `before` to `after`."""
+    deltas = Counter(set(after or []))
+    deltas.subtract(Counter(set(before or [])))
+    return deltas
+
+
+async def apply(user_id, deltas: Counter):
+    """Applies tag count changes for one user; errors are logged, never raised."""
+    deltas = {t: n for t, n in deltas.items() if n}
+    if not deltas:
+        return
+    uid = ObjectId(user_id)
+    try:
+        await db.user_tags.bulk_write(
+            [UpdateOne({"user_id": uid, "tag": t}, {"$inc": {"count": n}}, upsert=True) for t, n in deltas.items()],
+            ordered=False,
+        )
+        dropped = [t for t, n in deltas.items() if n < 0]
+        if dropped:
+            await db.user_tags.delete_many({"user_id": uid, "tag": {"$in": dropped}, "count": {"$lte": 0}})
+    except Exception as e:
+        print(f"Tag count update failed for user {user_id}: {e}")
+    entry = _tries.get(str(user_id))
+    if entry is not None:
+        for tag, n in deltas.items():
+            entry.trie.add(tag, n)
+
+
+async def add_bookmarks(user_id, docs: list):
+    deltas = Counter()
+    for doc in docs:
+        deltas.update(tag_deltas(after=doc.get("tags")))
+    await apply(user_id, deltas)
+
+
+async def remove_bookmarks(user_id, docs: list):
+    deltas = Counter()
+    for doc in docs:
+        deltas.update(tag_deltas(before=doc.get("tags")))
+    await apply(user_id, deltas)
+
+
+async def facets(user_id: str, limit: int) -> list:
+    """The user's most used tags with their bookmark counts."""
+    return await (
+        db.user_tags.find({"user_id": ObjectId(user_id), "count": {"$gt": 0}}, {"_id": 0, "tag": 1, "count": 1})
+        .sort("count", DESCENDING)
+        .limit(limit)
+        .to_list()
+    )
+
+
+async def counts(user_id: str, tags: list) -> dict:
+    docs = db.user_tags.find({"user_id": ObjectId(user_id), "tag": {"$in": tags}}, {"tag": 1, "count": 1})
+    return {d["tag"]: d["count"] async for d in docs}
+
+
+def clear():
+    """Drops every cached trie, e.g. after the counts were rewritten."""
+    _tries.clear()
@@ -0,0 +1,303 @@
+# search/vector_index.py
+"""
+Per-user in-memory embedding index used by POST /search.
+
+Each user gets a contiguous, pre-normalized float32 matrix plus a parallel
+id array, so a query is a single matrix-vector product followed by an
+argpartition top-k. Indexes are built lazily on first search and kept
+current by the add/edit/delete/import paths calling upsert()/remove().
+Stored embeddings are decoded by search/embedding_codec.py, straight from
+the BSON bytes for packed vectors.
+
+The entry points are coroutines on the event loop; each index is guarded
+by an asyncio.Lock, and only CPU-heavy compaction leaves the loop.
+
+Other workers only see this process's writes through sync(), which pulls
+documents whose `updated_at` moved since the last sync and drops ids that
+no longer exist. It runs at most every INDEX_SYNC_SECONDS per user.
+
+Libraries of ANN_MIN_SIZE bookmarks or more are compacted into an on-disk
+ANN segment (see search/ann.py). The index then searches that memory-mapped
+segment plus a small in-memory delta of rows written since it was built;
+base rows that were edited or deleted are masked out via tombstones.
+Smaller libraries always use the exact scan.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import numpy as np
+from bson import ObjectId
+
+from db import db
+from search import ann, embedding_codec
+
+INDEX_SYNC_SECONDS = int(os.getenv("INDEX_SYNC_SECONDS", "300"))
+INDEX_MAX_USERS = int(os.getenv("INDEX_MAX_USERS", "1000"))
+# Clock skew allowance between app workers when comparing updated_at.
+SYNC_SKEW = timedelta(seconds=5)
+# Empty or "exact" disables ANN segments altogether.
+ANN_BACKEND = os.getenv("ANN_BACKEND", "ivf")
+ANN_MIN_SIZE = int(os.getenv("ANN_MIN_SIZE", "5000"))
+# Rebuild the segment once the delta plus tombstones exceed this share of it.
+ANN_COMPACT_RATIO = float(os.getenv("ANN_COMPACT_RATIO", "0.2"))
+
+
+def normalize(vec) -> np.ndarray:
+    v = np.asarray(vec, dtype=np.float32)
+    norm = np.linalg.norm(v, axis=-1, keepdims=True)
+    return v / np.where(norm == 0, 1, norm)
+
+
+class UserIndex:
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.lock = asyncio.Lock()
+        self.loaded = False
+        self.synced_at = None
+        self.checked_at = 0.0
+        self._matrix = np.empty((0, 0), dtype=np.float32)
+        self._ids = []
+        self._rows = {}
+        self.base = None
+        self.tombstones = set()
+
+    def __len__(self):
+        base = len(self.base) - len(self.tombstones) if self.base is not None else 0
+        return len(self._ids) + base
+
+    def live_ids(self):
+        ids = set(self._rows)
+        if self.base is not None:
+            ids.update(bid for bid in self.base.ids if bid not in self.tombstones)
+        return ids
+
+    def _ensure_capacity(self, dim: int, n: int):
+        cap, cur_dim = self._matrix.shape
+        if cur_dim != dim:
+            if self._ids:
+                raise ValueError(f"Embedding dimension changed from {cur_dim} to {dim}")
+            self._matrix = np.empty((0, dim), dtype=np.float32)
+            cap = 0
+        if n <= cap:
+            return
+        new_cap = max(n, 2 * cap, 64)
+        grown = np.empty((new_cap, dim), dtype=np.float32)
+        grown[:len(self._ids)] = self._matrix[:len(self._ids)]
+        self._matrix = grown
+
+    def upsert_many(self, ids, vectors):
+        if not ids:
+            return
+        vecs = normalize(vectors)
+        if self.base is not None:
+            self.tombstones.update(bid for bid in ids if bid in self.base.rows)
+        self._ensure_capacity(vecs.shape[1], len(self._ids) + len(ids))
+        for bid, vec in zip(ids, vecs):
+            row = self._rows.get(bid)
+            if row is None:
+                row = len(self._ids)
+                self._ids.append(bid)
+                self._rows[bid] = row
+            self._matrix[row] = vec
+
+    def remove_many(self, ids):
+        for bid in ids:
+            if self.base is not None and bid in self.base.rows:
+                self.tombstones.add(bid)
+            row = self._rows.pop(bid, None)
+            if row is None:
+                continue
+            last = len(self._ids) - 1
+            if row != last:
+                moved = self._ids[last]
+                self._matrix[row] = self._matrix[last]
+                self._ids[row] = moved
+                self._rows[moved] = row
+            self._ids.pop()
+
+    @staticmethod
+    def _top(ids, scores: np.ndarray, k: int):
+        n = len(ids)
+        if n == 0 or k <= 0:
+            return []
+        if k < n:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(n)
+        top = top[np.argsort(-scores[top])]
+        return [(ids[i], float(scores[i])) for i in top]
+
+    def _search_delta(self, query: np.ndarray, k: int):
+        n = len(self._ids)
+        if n == 0:
+            return []
+        return self._top(self._ids, self._matrix[:n] @ query, k)
+
+    def search_within(self, query: np.ndarray, candidates, k: int):
+        """Exact top-k over the candidate ids only, for pre-filtered searches."""
+        ids, parts = [], []
+        delta = [bid for bid in candidates if bid in self._rows]
+        if delta:
+            ids.extend(delta)
+            parts.append(self._matrix[[self._rows[bid] for bid in delta]])
+        if self.base is not None:
+            base = [
+                bid for bid in candidates
+                if bid in self.base.rows and bid not in self.tombstones and bid not in self._rows
+            ]
+            if base:
+                ids.extend(base)
+                parts.append(np.asarray(self.base.vectors[[self.base.rows[bid] for bid in base]]))
+        if not ids:
+            return []
+        return self._top(ids, np.concatenate(parts) @ query, k)
+
+    def search(self, query: np.ndarray, k: int, nprobe: int = None):
+        hits = self._search_delta(query, k)
+        if self.base is None:
+            return hits
+        base_hits = self.base.search(query, k + len(self.tombstones), nprobe)
+        hits.extend(h for h in base_hits if h[0] not in self.tombstones)
+        hits.sort(key=lambda h: h[1], reverse=True)
+        return hits[:k]
+
+    def needs_compaction(self) -> bool:
+        if ANN_BACKEND not in ann.BACKENDS or len(self) < ANN_MIN_SIZE:
+            return False
+        if self.base is None:
+            return True
+        return len(self._ids) + len(self.tombstones) > ANN_COMPACT_RATIO * len(self.base)
+
+    def compact(self):
+        """Folds the delta into a fresh on-disk segment and memory-maps it."""
+        ids, parts = [], []
+        if self.base is not None:
+            keep = np.array([bid not in self.tombstones for bid in self.base.ids], dtype=bool)
+            ids.extend(bid for bid, k in zip(self.base.ids, keep) if k)
+            parts.append(np.asarray(self.base.vectors[keep]))
+        ids.extend(self._ids)
+        parts.append(self._matrix[:len(self._ids)])
+        vectors = np.ascontiguousarray(np.concatenate(parts), dtype=np.float32)
+
+        self.base = ann.build_segment(self.user_id, ANN_BACKEND, ids, vectors, self.synced_at)
+        self.tombstones = set()
+        self._matrix = np.empty((0, vectors.shape[1]), dtype=np.float32)
+        self._ids = []
+        self._rows = {}
+
+
+_indexes = OrderedDict()
+
+
+def _get(user_id: str, create: bool):
+    idx = _indexes.get(user_id)
+    if idx is not None:
+        _indexes.move_to_end(user_id)
+    elif create:
+        idx = _indexes[user_id] = UserIndex(user_id)
+        while len(_indexes) > INDEX_MAX_USERS:
+            _indexes.popitem(last=False)
+    return idx
+
+
+async def _load(idx: UserIndex):
+    loop = asyncio.get_running_loop()
+    segment = None
+    if ANN_BACKEND in ann.BACKENDS:
+        segment = await loop.run_in_executor(None, ann.open_segment, idx.user_id)
+    if segment is not None:
+        # Reuse the persisted snapshot and only pull what changed since it was built.
+        idx.base = segment
+        idx.synced_at = segment.built_at
+        idx.loaded = True
+        await _sync(idx)
+        return
+
+    started = datetime.utcnow()
+    ids, vectors = [], []
+    cursor = db.bookmarks.find(
+        {"user_id": ObjectId(idx.user_id), "embedding": {"$exists": True}},
+        {"embedding": 1},
+    )
+    async for doc in cursor:
+        ids.append(str(doc["_id"]))
+        vectors.append(embedding_codec.decode(doc["embedding"]))
+    idx.upsert_many(ids, vectors)
+    idx.loaded = True
+    idx.synced_at = started
+    idx.checked_at = time.monotonic()
+
+
+async def _sync(idx: UserIndex):
+    started = datetime.utcnow()
+    user_oid = ObjectId(idx.user_id)
+    changed = await db.bookmarks.find(
+        {
+            "user_id": user_oid,
+            "embedding": {"$exists": True},
+            "updated_at": {"$gte": idx.synced_at - SYNC_SKEW},
+        },
+        {"embedding": 1},
+    ).to_list()
+    idx.upsert_many(
+        [str(d["_id"]) for d in changed],
+        [embedding_codec.decode(d["embedding"]) for d in changed],
+    )
+
+    live = {str(d["_id"]) async for d in db.bookmarks.find({"user_id": user_oid}, {"_id": 1})}
+    idx.remove_many([bid for bid in idx.live_ids() if bid not in live])
+    idx.synced_at = started
+    idx.checked_at = time.monotonic()
+
+
+async def get_user_index(user_id: str) -> UserIndex:
+    """Returns the user's index, building or syncing it from Mongo as needed."""
+    idx = _get(user_id, create=True)
+    async with idx.lock:
+        if not idx.loaded:
+            await _load(idx)
+        elif time.monotonic() - idx.checked_at > INDEX_SYNC_SECONDS:
+            await _sync(idx)
+        if idx.needs_compaction():
+            # Clustering is CPU-bound; writers wait on the lock meanwhile.
+            await asyncio.get_running_loop().run_in_executor(None, idx.compact)
+    return idx
+
+
+async def search(user_id: str, query_embedding, k: int, nprobe: int = None, candidates: set = None):
+    """
+    Returns up to k (bookmark_id, cosine score) pairs, best first.
+    nprobe trades recall for latency on ANN segments; None uses ANN_NPROBE.
+    With candidates, only those ids are scored, exactly.
+    """
+    idx = await get_user_index(user_id)
+    query = normalize(query_embedding)
+    async with idx.lock:
+        if candidates is not None:
+            return idx.search_within(query, candidates, k)
+        return idx.search(query, k, nprobe)
+
+
+async def upsert(user_id: str, bookmark_id, embedding):
+    await upsert_many(user_id, [bookmark_id], [embedding])
+
+
+async def upsert_many(user_id: str, bookmark_ids, embeddings):
+    # Indexes are built lazily, so writes for users who never searched are no-ops.
+    idx = _get(str(user_id), create=False)
+    if idx is None:
+        return
+    async with idx.lock:
+        if idx.loaded:
+            idx.upsert_many([str(b) for b in bookmark_ids], embeddings)
+
+
+async def remove(user_id: str, bookmark_id):
+    idx = _get(str(user_id), create=False)
+    if idx is None:
+        return
+    async with idx.lock:
+        idx.remove_many([str(bookmark_id)])
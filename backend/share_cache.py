@@ -0,0 +1,217 @@
+# share_cache.py
+"""
+Cache for the public GET /shared/{share_id} pages.
+
+Rendered pages (JSON body, next cursor, validators) are kept per share in an
+in-process LRU for SHARE_CACHE_TTL seconds, at most SHARE_CACHE_PAGES per
+share. Pages with no bookmarks (unknown share ids included) are never
+stored, so anonymous visitors cannot grow the cache with made-up links or
+parameters. When SHARE_CACHE_DIR is set, shares pushed out of the LRU are
+spilled there as one JSON file each and promoted back on the next hit, so a
+large set of circulating links does not fall through to Mongo; sweep()
+deletes expired spill files.
+
+The owner's share/edit/delete paths call touch(), which bumps the share's
+`updated_at` in the `shares` collection and drops both tiers for this
+process. Other app workers catch up when their entry expires, so
+SHARE_CACHE_TTL bounds how stale a shared page can be.
+
+Every page carries a strong ETag (a hash of the body) and a Last-Modified
+(the newest of the share's and its bookmarks' updated_at), so repeat
+visitors and intermediate caches get 304s.
+"""
+import asyncio
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from db import db
+from responses import dumps
+from utils import TTLCache
+
+SHARE_CACHE_SIZE = int(os.getenv("SHARE_CACHE_SIZE", "1000"))
+SHARE_CACHE_TTL = float(os.getenv("SHARE_CACHE_TTL", "60"))
+# Rendered pages kept per share (limit/cursor/fields combinations).
+SHARE_CACHE_PAGES = int(os.getenv("SHARE_CACHE_PAGES", "20"))
+# Empty disables the disk tier.
+SHARE_CACHE_DIR = os.getenv("SHARE_CACHE_DIR", "")
+
+# What a visitor of a share link may see; owner details stay private.
+PUBLIC_FIELDS = ("title", "url", "description", "tags", "category", "is_broken", "created_at", "updated_at")
+
+
+def public_projection(projection: dict) -> dict:
+    """Narrows a fields= projection to PUBLIC_FIELDS."""
+    wanted = [f for f, v in projection.items() if v == 1 and f in PUBLIC_FIELDS]
+    return {f: 1 for f in wanted or PUBLIC_FIELDS}
+
+
+def _path(share_id: str) -> str:
+    # share_id comes from the URL; never use it as a path component.
+    return os.path.join(SHARE_CACHE_DIR, hashlib.sha1(share_id.encode()).hexdigest() + ".json")
+
+
+def _write(share_id: str, pages: dict, seconds_left: float):
+    try:
+        os.makedirs(SHARE_CACHE_DIR, exist_ok=True)
+        tmp = _path(share_id) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"expires": datetime.utcnow().timestamp() + seconds_left, "pages": pages}, f)
+        os.replace(tmp, _path(share_id))
+    except OSError as e:
+        print(f"Share cache spill failed: {e}")
+
+
+def _read(share_id: str):
+    try:
+        with open(_path(share_id)) as f:
+            stored = json.load(f)
+        os.remove(_path(share_id))
+    except (OSError, ValueError):
+        return None, 0
+    return stored["pages"], stored["expires"] - datetime.utcnow().timestamp()
+
+
+def _prune() -> int:
+    """Deletes expired and half-written spill files; returns how many."""
+    now = datetime.utcnow().timestamp()
+    removed = 0
+    try:
+        names = os.listdir(SHARE_CACHE_DIR)
+    except OSError:
+        return 0
+    for name in names:
+        path = os.path.join(SHARE_CACHE_DIR, name)
+        try:
+            if name.endswith(".tmp"):
+                expired = os.path.getmtime(path) < now - SHARE_CACHE_TTL
+            elif name.endswith(".json"):
+                with open(path) as f:
+                    expired = json.load(f)["expires"] <= now
+            else:
+                continue
+        except (OSError, ValueError, KeyError, TypeError):
+            expired = True
+        if expired:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+def _remove(share_id: str):
+    try:
+        os.remove(_path(share_id))
+    except OSError:
+        pass
+
+
+def _spill(share_id: str, pages: dict, seconds_left: float):
+    if SHARE_CACHE_DIR:
+        asyncio.get_running_loop().run_in_executor(None, _write, share_id, pages, seconds_left)
+
+
+_memory = TTLCache(SHARE_CACHE_SIZE, SHARE_CACHE_TTL, on_evict=_spill)
+
+
+async def _pages(share_id: str):
+    pages = _memory.get(share_id)
+    if pages is None and SHARE_CACHE_DIR:
+        pages, seconds_left = await asyncio.get_running_loop().run_in_executor(None, _read, share_id)
+        if pages is not None and seconds_left > 0:
+            _memory.set(share_id, pages, ttl=seconds_left)
+        else:
+            pages = None
+    return pages
+
+
+async def sweep():
+    """Prunes expired spill files; no-op without SHARE_CACHE_DIR."""
+    if not SHARE_CACHE_DIR:
+        return
+    removed = await asyncio.get_running_loop().run_in_executor(None, _prune)
+    if removed:
+        print(f"Share cache sweep removed {removed} spill files")
+
+
+async def run_forever():
+    """Sweeps the disk tier at startup and then every SHARE_CACHE_TTL (at least a minute)."""
+    while True:
+        try:
+            await sweep()
+        except Exception as e:
+            print(f"Share cache sweep failed: {e}")
+        await asyncio.sleep(max(SHARE_CACHE_TTL, 60))
+
+
+def _http_date(when: datetime) -> str:
+    return format_datetime(when.replace(tzinfo=timezone.utc, microsecond=0), usegmt=True)
+
+
+async def get_page(share_id: str, limit: int, cursor, projection: dict, fetch) -> dict:
+    """
+    The cached page for these parameters; on a miss, fetch(projection) is
+    awaited for (docs, next_cursor) and the rendered page is stored.
+    """
+    projection = public_projection(projection)
+    key = f"{limit}:{cursor or ''}:{','.join(sorted(projection))}"
+    pages = await _pages(share_id)
+    page = pages.get(key) if pages is not None else None
+    if page is not None:
+        return page
+
+    docs, next_cursor = await fetch(projection)
+    share = await db.shares.find_one({"_id": share_id}) or {}
+    stamps = [share.get("updated_at")] + [d.get("updated_at") for d in docs]
+    modified = max((s for s in stamps if isinstance(s, datetime)), default=datetime(1970, 1, 1))
+    body = dumps(docs)
+    page = {
+        "body": body.decode(),
+        "etag": '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"',
+        "last_modified": _http_date(modified),
+        "next_cursor": next_cursor,
+    }
+    if not docs:
+        return page
+    if pages is None:
+        pages = {}
+        _memory.set(share_id, pages)
+    pages[key] = page
+    while len(pages) > SHARE_CACHE_PAGES:
+        pages.pop(next(iter(pages)))
+    return page
+
+
+def is_fresh(page: dict, if_none_match: str = None, if_modified_since: str = None) -> bool:
+    """Whether a conditional GET can be answered with 304."""
+    if if_none_match:
+        tags = [t.strip() for t in if_none_match.split(",")]
+        return "*" in tags or page["etag"] in tags
+    if if_modified_since:
+        try:
+            return parsedate_to_datetime(page["last_modified"]) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+async def invalidate(share_ids):
+    for share_id in share_ids:
+        _memory.pop(share_id)
+        if SHARE_CACHE_DIR:
+            await asyncio.get_running_loop().run_in_executor(None, _remove, share_id)
+
+
+async def touch(share_ids):
+    """Records that these shares changed and drops their cached pages."""
+    share_ids = [s for s in dict.fromkeys(share_ids) if isinstance(s, str)]
+    if not share_ids:
+        return
+    now = datetime.utcnow()
+    for share_id in share_ids:
+        await db.shares.update_one({"_id": share_id}, {"$set": {"updated_at": now}}, upsert=True)
+    await invalidate(share_ids)
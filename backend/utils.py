@@ -1,24 +1,89 @@
-from passlib.context import CryptContext
-from jose import JWTError
 import jwt
 import os
+import time
+from collections import OrderedDict, deque
 from datetime import datetime, timedelta
 from fastapi import Depends, HTTPException, status, Header
-from typing import Optional, Union
+from typing import Optional
 from bson import ObjectId
 from db import db
-from urllib.parse import urlparse
+import re
+from urllib.parse import parse_qsl, urlencode, urlparse, urlsplit
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 JWT_SECRET = os.getenv("JWT_SECRET")
+# Verified tokens and user records are reused for up to this many seconds.
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
 
 
-def hash_pass(password: str) -> str:
-    return pwd_context.hash(password)
+class TTLCache:
+    """
+    Bounded LRU mapping whose entries expire after ttl seconds.
+    on_evict(key, value, seconds_left) is called for live entries pushed
+    out by the size bound.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, on_evict=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._data = OrderedDict()
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: float = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            old_key, (old_value, expires) = self._data.popitem(last=False)
+            left = expires - time.monotonic()
+            if self.on_evict is not None and left > 0:
+                self.on_evict(old_key, old_value, left)
+
+    def pop(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class LatencyStats:
+    """Rolling window of durations with percentile summaries."""
+
+    def __init__(self, window: int = 2000):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+        self.count += 1
+
+    def summary(self) -> dict:
+        ordered = sorted(self.samples)
+
+        def pct(p):
+            return ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000 if ordered else None
+
+        return {"count": self.count, "window": len(ordered), "p50_ms": pct(0.50), "p95_ms": pct(0.95), "p99_ms": pct(0.99)}
 
 
-def verify_pass(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+_token_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+# No route changes or deletes a user record, so nothing invalidates this
+# cache: a user edited directly in the database is seen within AUTH_CACHE_TTL.
+_user_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
 
 
 def create_token(user_id: str, is_admin=False) -> str:
@@ -34,37 +99,84 @@ def decode_token(token: str):
     return jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
 
 
-async def get_current_user(authorization: Optional[str] = Header(None)):
+def _unauthorized(detail: str):
+    return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=detail)
+
+
+def verify_token(token: str) -> dict:
+    """Decoded payload of a valid token; cached until the TTL or the token's expiry."""
+    payload = _token_cache.get(token)
+    if payload is None:
+        try:
+            payload = decode_token(token)
+        except Exception:
+            raise _unauthorized("Invalid token")
+        if not payload.get("sub"):
+            raise _unauthorized("Invalid token payload")
+        _token_cache.set(token, payload, ttl=payload.get("exp", 0) - time.time())
+    return payload
+
+
+async def get_token_payload(authorization: Optional[str] = Header(None)) -> dict:
     if authorization is None or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing or invalid Authorization header")
+        raise _unauthorized("Missing or invalid Authorization header")
+    return verify_token(authorization[7:])
 
-    token = authorization[7:]
-    try:
-        payload = decode_token(token)
-        user_id = payload.get("sub")
-        if not user_id:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token payload")
 
-        user = db.users.find_one({"_id": ObjectId(user_id)})
+async def get_user_id(payload: dict = Depends(get_token_payload)) -> str:
+    """The authenticated user's id, from the token alone."""
+    return payload["sub"]
+
+
+async def require_admin(payload: dict = Depends(get_token_payload)) -> bool:
+    if not payload.get("admin"):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access only")
+    return True
+
+
+async def get_current_user(user_id: str = Depends(get_user_id)) -> dict:
+    """The authenticated user's record (without the password hash)."""
+    user = _user_cache.get(user_id)
+    if user is None:
+        try:
+            user = await db.users.find_one({"_id": ObjectId(user_id)}, {"password_hash": 0})
+        except Exception:
+            raise _unauthorized("Invalid token payload")
         if not user:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+            raise _unauthorized("User not found")
+        _user_cache.set(user_id, user)
+    return user
+
 
-        user.pop("password_hash", None)
-        return user
+# Listing endpoints page by _id (keyset pagination) and never return the
+# embedding unless it is asked for explicitly via fields=.
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+DEFAULT_BOOKMARK_PROJECTION = {"embedding": 0}
 
-    except (JWTError, Exception):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token decode failed")
 
+def bookmark_projection(fields: Optional[str] = None) -> dict:
+    """Projection for a comma-separated fields= selector, or the default one."""
+    names = [f.strip() for f in (fields or "").split(",") if f.strip()]
+    if not names:
+        return dict(DEFAULT_BOOKMARK_PROJECTION)
+    return {name: 1 for name in names}
 
-def convert_objectid_to_str(doc: Union[dict, list, ObjectId]):
-    if isinstance(doc, list):
-        return [convert_objectid_to_str(item) for item in doc]
-    if isinstance(doc, dict):
-        return {k: convert_objectid_to_str(v) for k, v in doc.items()}
-    if isinstance(doc, ObjectId):
-        return str(doc)
-    return doc
 
+async def find_page(collection, query: dict, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None, projection: Optional[dict] = None):
+    """
+    Returns (docs, next_cursor) for one page of query in _id order.
+    next_cursor is None on the last page.
+    """
+    if cursor:
+        try:
+            query = {**query, "_id": {"$gt": ObjectId(cursor)}}
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    docs = await collection.find(query, projection).sort("_id", 1).limit(limit + 1).to_list()
+    next_cursor = str(docs[limit - 1]["_id"]) if len(docs) > limit else None
+    return docs[:limit], next_cursor
 
 
 def normalize_url(url: str) -> str:
@@ -73,24 +185,38 @@ def normalize_url(url: str) -> str:
         return "https://" + url
     return url
 
+# Query parameters that only track where a click came from.
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "msclkid", "yclid", "igshid", "mc_cid", "mc_eid",
+    "_ga", "_gl", "ref", "ref_src", "spm", "si", "feature",
+}
+_INDEX_PAGES = ("/index.html", "/index.htm", "/index.php")
 
 
-import requests
-
-def check_url_health(url: str, timeout: int = 10) -> str:
+def canonical_url(url: str) -> str:
     """
-    Return 'alive' if URL is reachable and returns 2xx or 3xx status,
-    else 'broken'.
+    Comparison key for duplicate detection, not a URL to fetch: ignores
+    scheme, www., default ports, fragments, tracking parameters, parameter
+    order, index pages and trailing slashes.
     """
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36"
-    }
-
+    url = url.strip()
+    parts = urlsplit(url if "://" in url else "https://" + url)
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
     try:
-        response = requests.head(url, allow_redirects=True, timeout=timeout, headers=headers)
-        if response.status_code >= 200 and response.status_code < 400:
-            return "alive"
-        else:
-            return "broken"
-    except Exception:
-        return "alive"
+        port = parts.port
+    except ValueError:
+        port = None
+    if port and port not in (80, 443):
+        host = f"{host}:{port}"
+    path = re.sub(r"/{2,}", "/", parts.path)
+    for index in _INDEX_PAGES:
+        if path.endswith(index):
+            path = path[:-len(index)]
+    path = path.rstrip("/")
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS
+    )
+    return host + path + ("?" + urlencode(query) if query else "")
@@ -0,0 +1,449 @@
+# workers/import_jobs.py
+"""
+Background bookmark import jobs.
+
+POST /bookmarks/import stores the parsed rows in `import_rows` and a job
+document in `import_jobs`, then returns straight away. Rows are processed
+here in chunks; each row's state and the job's counters are checkpointed
+in Mongo as they complete, so a job picked up again after a restart only
+processes rows that are still pending.
+
+The parsed records are streamed into `import_rows` in batches while the
+upload is read; rows are keyed by utils.canonical_url, so repeats within
+the file (including http/https, www. and tracking-parameter variants) are
+dropped by the unique (job_id, url) index declared in db.INDEXES. Each
+chunk then resolves duplicates against the library with one $in query and
+writes its new bookmarks with a single unordered insert_many, so a chunk
+costs a handful of round trips regardless of size.
+
+A bookmark inserted by a job reuses its row's _id, which makes a row that
+was inserted but not yet marked before a crash recognisable on resume.
+
+Jobs are leased to one app worker at a time. The owner renews the lease in
+the background while it works, and every checkpoint is conditional on still
+holding it; a worker that finds its lease taken stops. A periodic sweep
+picks up queued jobs and jobs whose owner stopped renewing the lease, and
+fails uploads whose worker died before the last row was stored. A job's rows
+are deleted once it is done or failed; only the counters on the job
+document remain.
+"""
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from db import db
+from ml.enrich import enrich_async
+from ml.scraper import fetch_link
+from ml import clustering
+from search import embedding_codec, lexical_index, tag_index, vector_index
+from workers import stats
+from utils import canonical_url, normalize_url
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "500"))
+IMPORT_CONCURRENCY = int(os.getenv("IMPORT_CONCURRENCY", "20"))
+# Parsed records are written to import_rows in batches of this size.
+ROW_BATCH_SIZE = 1000
+LEASE_SECONDS = 600
+SWEEP_SECONDS = 60
+WORKER_ID = uuid.uuid4().hex
+
+# Jobs currently being processed by this worker.
+_running = {}
+
+
+class LeaseLost(Exception):
+    """Another worker took over the job; this one must stop."""
+
+
+def _lease_until() -> datetime:
+    return datetime.utcnow() + timedelta(seconds=LEASE_SECONDS)
+
+
+async def _renew(job_id, status: str) -> bool:
+    res = await db.import_jobs.update_one(
+        {"_id": job_id, "status": status, "lease_owner": WORKER_ID},
+        {"$set": {"lease_until": _lease_until()}},
+    )
+    return res.matched_count == 1
+
+
+async def _keep_lease(job_id):
+    """Renews a running job's lease until cancelled, so a slow chunk is not picked up twice."""
+    while True:
+        await asyncio.sleep(LEASE_SECONDS / 3)
+        try:
+            if not await _renew(job_id, "running"):
+                print(f"Import job {job_id} lost its lease")
+                return
+        except Exception as e:
+            print(f"Import job {job_id} lease renewal failed: {e}")
+
+
+def job_summary(job: dict) -> dict:
+    return {
+        "job_id": str(job["_id"]),
+        "status": job["status"],
+        "filename": job.get("filename"),
+        "total": job["total"],
+        "processed": job["inserted"] + job["duplicates"] + job["errors"],
+        "importedCount": job["inserted"],
+        "duplicatesSkipped": job["duplicates"],
+        "errors": job["errors"],
+        "created_at": job["created_at"],
+        "finished_at": job.get("finished_at"),
+    }
+
+
+async def _insert_rows(rows: list) -> int:
+    """Inserts rows, skipping URLs already seen in this job; returns how many were new."""
+    try:
+        return len((await db.import_rows.insert_many(rows, ordered=False)).inserted_ids)
+    except BulkWriteError as e:
+        dup = sum(1 for err in e.details["writeErrors"] if err.get("code") == 11000)
+        if dup != len(e.details["writeErrors"]):
+            raise
+        return e.details["nInserted"]
+
+
+async def create_job(user_id, filename: str, bookmarks) -> dict:
+    """
+    Streams parsed records (an async iterator) into a new job's rows and
+    queues it. Records whose url is not a non-empty string count as errors.
+    Returns None, leaving nothing behind, if no records arrived.
+    """
+    now = datetime.utcnow()
+    job = {
+        "_id": ObjectId(),
+        "user_id": ObjectId(user_id),
+        "filename": filename,
+        # Not picked up by the sweep until every row is stored.
+        "status": "uploading",
+        "total": 0,
+        "inserted": 0,
+        "duplicates": 0,
+        "errors": 0,
+        "created_at": now,
+        "updated_at": now,
+        # Held while uploading, so the sweep can fail uploads whose worker died.
+        "lease_owner": WORKER_ID,
+        "lease_until": _lease_until(),
+    }
+    await db.import_jobs.insert_one(job)
+    renewed = now
+
+    stored = 0
+    batch = []
+    try:
+        async for bm in bookmarks:
+            url = bm.get("url")
+            if not isinstance(url, str) or not url.strip():
+                # Counted against the job, never stored as a row.
+                job["total"] += 1
+                job["errors"] += 1
+                continue
+            url = normalize_url(url.strip())
+            batch.append({
+                "job_id": job["_id"],
+                "seq": job["total"],
+                "url": canonical_url(url),
+                "bookmark": {**bm, "url": url},
+                "state": "pending",
+            })
+            job["total"] += 1
+            if len(batch) >= ROW_BATCH_SIZE:
+                rows, batch = batch, []
+                stored += await _insert_rows(rows)
+                if (datetime.utcnow() - renewed).total_seconds() > LEASE_SECONDS / 3:
+                    renewed = datetime.utcnow()
+                    await _renew(job["_id"], "uploading")
+        if batch:
+            stored += await _insert_rows(batch)
+    except BaseException:
+        await db.import_jobs.update_one(
+            {"_id": job["_id"]}, {"$set": {"status": "failed", "total": job["total"]}}
+        )
+        await _drop_rows(job["_id"])
+        raise
+
+    if job["total"] == 0:
+        await db.import_jobs.delete_one({"_id": job["_id"]})
+        return None
+
+    job.update({
+        "status": "queued",
+        "duplicates": job["total"] - job["errors"] - stored,
+        "updated_at": datetime.utcnow(),
+        # Still ours: the route starts it here; the sweep takes over if we die first.
+        "lease_until": _lease_until(),
+    })
+    await db.import_jobs.update_one(
+        {"_id": job["_id"]},
+        {"$set": {k: job[k] for k in (
+            "status", "total", "duplicates", "errors", "updated_at", "lease_until"
+        )}},
+    )
+    return job
+
+
+async def _drop_rows(job_id):
+    """Deletes a finished job's rows; they hold a full copy of the upload."""
+    try:
+        await db.import_rows.delete_many({"job_id": job_id})
+    except Exception as e:
+        print(f"Dropping rows of import job {job_id} failed: {e}")
+
+
+async def get_job(job_id: str, user_id) -> dict:
+    try:
+        oid = ObjectId(job_id)
+    except Exception:
+        return None
+    return await db.import_jobs.find_one({"_id": oid, "user_id": ObjectId(user_id)})
+
+
+async def _claim(job_id) -> dict:
+    now = datetime.utcnow()
+    return await db.import_jobs.find_one_and_update(
+        {
+            "_id": job_id,
+            "status": {"$in": ["queued", "running"]},
+            "$or": [{"lease_until": {"$lt": now}}, {"lease_owner": WORKER_ID}],
+        },
+        {"$set": {
+            "status": "running",
+            "lease_owner": WORKER_ID,
+            "lease_until": _lease_until(),
+            "updated_at": now,
+        }},
+    )
+
+
+async def _build_doc(job: dict, row: dict) -> dict:
+    bm = row["bookmark"]
+    # One GET for health plus fallback title/description
+    link = await fetch_link(bm["url"])
+    title = bm.get("title") or link["title"]
+    description = bm.get("description") or link["description"]
+    broken = link["status"] == "broken"
+
+    tags, embedding = await enrich_async(title, description)
+
+    return {
+        "_id": row["_id"],
+        "user_id": job["user_id"],
+        "url": bm["url"],
+        "canonical_url": canonical_url(bm["url"]),
+        "title": title,
+        "description": description,
+        "category": " / ".join(bm.get("collections", [])) if bm.get("collections") else "",
+        "tags": tags,
+        "embedding": embedding_codec.encode(embedding),
+        "shared": False,
+        "created_at": datetime.utcnow(),
+        "status": link["status"],
+        "is_broken": broken,
+        "http_status": link["status_code"],
+        "final_url": link["final_url"],
+        "etag": link["etag"],
+        "last_modified": link["last_modified"],
+        "visit_count": 0,
+        "last_checked": datetime.utcnow(),
+        "updated_at": datetime.utcnow()
+    }
+
+
+async def _add_to_collections(user_id, rows: list, docs: list):
+    """Files inserted bookmarks into the collections (folders) they were exported from."""
+    by_row = {r["_id"]: r["bookmark"] for r in rows}
+    members = {}
+    for doc in docs:
+        for name in by_row[doc["_id"]].get("collections") or []:
+            if name:
+                members.setdefault(name, []).append(doc["_id"])
+    if not members:
+        return
+    await db.collections.bulk_write([
+        UpdateOne(
+            {"user_id": user_id, "name": name},
+            {"$addToSet": {"bookmarks": {"$each": ids}}},
+            upsert=True,
+        )
+        for name, ids in members.items()
+    ], ordered=False)
+
+
+async def _process_chunk(job: dict, rows: list):
+    states = {}
+
+    # Resolve duplicates for the whole chunk in one query.
+    # Bookmarks saved before canonical_url was stored only match on the exact url.
+    urls = [r["bookmark"]["url"] for r in rows]
+    keys = [canonical_url(u) for u in urls]
+    existing = {
+        canonical_url(d["url"]): d["_id"]
+        async for d in db.bookmarks.find(
+            {"user_id": job["user_id"], "$or": [{"canonical_url": {"$in": keys}}, {"url": {"$in": urls}}]},
+            {"url": 1},
+        )
+    }
+    todo = []
+    for row, key in zip(rows, keys):
+        match = existing.get(key)
+        if match is None:
+            todo.append(row)
+        else:
+            # A match on our own row id means we inserted it before a restart.
+            states[row["_id"]] = ("inserted" if match == row["_id"] else "duplicate", None)
+
+    semaphore = asyncio.Semaphore(IMPORT_CONCURRENCY)
+
+    async def build(row):
+        async with semaphore:
+            try:
+                return await _build_doc(job, row)
+            except Exception as e:
+                print(f"Error importing bookmark {row['bookmark'].get('url')}: {e}")
+                states[row["_id"]] = ("error", str(e))
+                return None
+
+    docs = [d for d in await asyncio.gather(*(build(r) for r in todo)) if d is not None]
+
+    # Fetching can outlast the lease; never write a chunk another worker now owns.
+    if not await _renew(job["_id"], "running"):
+        raise LeaseLost()
+    if docs:
+        failed = {}
+        try:
+            await db.bookmarks.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            failed = {docs[err["index"]]["_id"]: err.get("errmsg", "insert failed") for err in e.details["writeErrors"]}
+        for doc in docs:
+            if doc["_id"] in failed:
+                states[doc["_id"]] = ("error", failed[doc["_id"]])
+            else:
+                states[doc["_id"]] = ("inserted", None)
+        ok = [d for d in docs if d["_id"] not in failed]
+        embeddings = [embedding_codec.decode(d["embedding"]) for d in ok]
+        await vector_index.upsert_many(job["user_id"], [d["_id"] for d in ok], embeddings)
+        await clustering.assign(job["user_id"], ok, embeddings)
+        await lexical_index.upsert_many(job["user_id"], ok)
+        await _add_to_collections(job["user_id"], rows, ok)
+        await stats.on_bookmarks_added(ok)
+        await tag_index.add_bookmarks(job["user_id"], ok)
+
+    counts = {"inserted": 0, "duplicate": 0, "error": 0}
+    ops = []
+    for row_id, (state, error) in states.items():
+        counts[state] += 1
+        ops.append(UpdateOne({"_id": row_id}, {"$set": {"state": state, "error": error}}))
+
+    now = datetime.utcnow()
+    await db.import_rows.bulk_write(ops, ordered=False)
+    res = await db.import_jobs.update_one(
+        {"_id": job["_id"], "lease_owner": WORKER_ID},
+        {
+            "$inc": {
+                "inserted": counts["inserted"],
+                "duplicates": counts["duplicate"],
+                "errors": counts["error"],
+            },
+            "$set": {
+                "updated_at": now,
+                "lease_until": _lease_until(),
+            },
+        },
+    )
+    if res.matched_count == 0:
+        raise LeaseLost()
+
+
+async def run_job(job_id):
+    job = await _claim(job_id)
+    if not job:
+        return
+    keeper = asyncio.create_task(_keep_lease(job["_id"]))
+    try:
+        while True:
+            rows = await (
+                db.import_rows.find({"job_id": job["_id"], "state": "pending"})
+                .sort("seq", 1)
+                .limit(IMPORT_CHUNK_SIZE)
+                .to_list()
+            )
+            if not rows:
+                break
+            await _process_chunk(job, rows)
+
+        res = await db.import_jobs.update_one(
+            {"_id": job["_id"], "lease_owner": WORKER_ID},
+            {"$set": {"status": "done", "finished_at": datetime.utcnow(), "lease_owner": None}},
+        )
+        if res.matched_count == 0:
+            raise LeaseLost()
+        print(f"Import job {job['_id']} finished")
+        await _drop_rows(job["_id"])
+    except asyncio.CancelledError:
+        # Shutting down: leave the job running so the lease expires and it resumes elsewhere.
+        raise
+    except LeaseLost:
+        print(f"Import job {job['_id']} was taken over by another worker; stopping")
+    except Exception as e:
+        print(f"Import job {job['_id']} failed: {e}")
+        res = await db.import_jobs.update_one(
+            {"_id": job["_id"], "lease_owner": WORKER_ID},
+            {"$set": {"status": "failed", "error": str(e), "finished_at": datetime.utcnow()}},
+        )
+        if res.matched_count:
+            await _drop_rows(job["_id"])
+    finally:
+        keeper.cancel()
+
+
+def start_job(job_id):
+    if job_id in _running:
+        return
+    task = asyncio.create_task(run_job(job_id))
+    _running[job_id] = task
+    task.add_done_callback(lambda _: _running.pop(job_id, None))
+
+
+async def resume_forever():
+    """
+    Picks up queued jobs and jobs abandoned by a stopped worker, and fails
+    uploads whose worker stopped before storing every row.
+    """
+    while True:
+        try:
+            now = datetime.utcnow()
+            jobs = await db.import_jobs.find(
+                {"status": {"$in": ["queued", "running"]}, "lease_until": {"$lt": now}},
+                {"_id": 1},
+            ).to_list()
+            for job in jobs:
+                start_job(job["_id"])
+            stalled = await db.import_jobs.find(
+                {"status": "uploading", "lease_until": {"$lt": now}}, {"_id": 1}
+            ).to_list()
+            for job in stalled:
+                res = await db.import_jobs.update_one(
+                    {"_id": job["_id"], "status": "uploading", "lease_until": {"$lt": now}},
+                    {"$set": {"status": "failed", "error": "Upload did not finish", "finished_at": now}},
+                )
+                if res.matched_count:
+                    print(f"Import job {job['_id']} failed: upload did not finish")
+                    await _drop_rows(job["_id"])
+        except Exception as e:
+            print(f"Import job sweep failed: {e}")
+        await asyncio.sleep(SWEEP_SECONDS)
+
+
+async def shutdown():
+    tasks = list(_running.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,195 @@
+# workers/link_checker.py
+"""
+Background re-validation of bookmark links.
+
+Each round picks the distinct URLs checked longest ago (never-checked
+first) across all users, re-fetches them with conditional requests
+(If-None-Match / If-Modified-Since from the last response) under a
+per-domain rate limit, and writes the verdicts back to every bookmark with
+that URL in one unordered bulk_write.
+
+Only one app worker runs a round at a time, coordinated through a lease
+document in the `locks` collection that is renewed while the round runs.
+"""
+import asyncio
+import os
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+from pymongo import UpdateMany
+from pymongo.errors import DuplicateKeyError
+
+from db import db
+from ml.scraper import fetch_link
+from workers import stats
+
+LINK_CHECK_ENABLED = os.getenv("LINK_CHECK_ENABLED", "1") == "1"
+# Links are due for a re-check once their last check is older than this.
+LINK_CHECK_MAX_AGE_HOURS = float(os.getenv("LINK_CHECK_MAX_AGE_HOURS", "24"))
+LINK_CHECK_BATCH = int(os.getenv("LINK_CHECK_BATCH", "200"))
+LINK_CHECK_CONCURRENCY = int(os.getenv("LINK_CHECK_CONCURRENCY", "20"))
+# Minimum gap between two requests to the same host.
+LINK_CHECK_DOMAIN_DELAY = float(os.getenv("LINK_CHECK_DOMAIN_DELAY", "1.0"))
+LINK_CHECK_IDLE_SECONDS = float(os.getenv("LINK_CHECK_IDLE_SECONDS", "300"))
+
+LEASE_ID = "link_checker"
+LEASE_SECONDS = 600
+WORKER_ID = uuid.uuid4().hex
+
+metrics = {
+    "rounds": 0,
+    "urls_checked": 0,
+    "bookmarks_updated": 0,
+    "not_modified": 0,
+    "became_broken": 0,
+    "became_alive": 0,
+    "last_round_at": None,
+    "last_round_seconds": None,
+    "last_round_urls_per_second": None,
+}
+
+
+class DomainRateLimiter:
+    """Spaces out requests to the same host by at least `delay` seconds."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self._next = defaultdict(float)
+
+    async def wait(self, host: str):
+        now = time.monotonic()
+        slot = max(now, self._next[host])
+        self._next[host] = slot + self.delay
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+def _cutoff() -> datetime:
+    return datetime.utcnow() - timedelta(hours=LINK_CHECK_MAX_AGE_HOURS)
+
+
+def _stale_query() -> dict:
+    return {"$or": [{"last_checked": None}, {"last_checked": {"$lt": _cutoff()}}]}
+
+
+async def _acquire_lease() -> bool:
+    now = datetime.utcnow()
+    try:
+        await db.locks.find_one_and_update(
+            {"_id": LEASE_ID, "$or": [{"until": {"$lt": now}}, {"owner": WORKER_ID}]},
+            {"$set": {"until": now + timedelta(seconds=LEASE_SECONDS), "owner": WORKER_ID}},
+            upsert=True,
+        )
+        return True
+    except DuplicateKeyError:
+        # Another worker holds an unexpired lease.
+        return False
+
+
+async def _keep_lease():
+    """Renews the lease until cancelled, so a slow round is not started twice."""
+    while True:
+        await asyncio.sleep(LEASE_SECONDS / 3)
+        try:
+            if not await _acquire_lease():
+                print("Link checker lost its lease mid-round")
+        except Exception as e:
+            print(f"Link checker lease renewal failed: {e}")
+
+
+async def _next_batch():
+    cursor = await db.bookmarks.aggregate([
+        {"$match": _stale_query()},
+        {"$sort": {"last_checked": 1}},
+        {"$limit": LINK_CHECK_BATCH * 5},
+        {"$group": {
+            "_id": "$url",
+            "etag": {"$first": "$etag"},
+            "last_modified": {"$first": "$last_modified"},
+            "status": {"$first": "$status"},
+        }},
+        {"$limit": LINK_CHECK_BATCH},
+    ])
+    return await cursor.to_list()
+
+
+async def run_round() -> int:
+    """Checks one batch of due URLs; returns how many were checked."""
+    if not await _acquire_lease():
+        return 0
+    batch = await _next_batch()
+    if not batch:
+        return 0
+
+    started = time.perf_counter()
+    limiter = DomainRateLimiter(LINK_CHECK_DOMAIN_DELAY)
+    semaphore = asyncio.Semaphore(LINK_CHECK_CONCURRENCY)
+
+    async def check(entry):
+        # Wait for the host's slot before taking a concurrency slot, so a
+        # batch dominated by one domain does not starve the other hosts.
+        await limiter.wait(urlparse(entry["_id"]).hostname or "")
+        async with semaphore:
+            return entry, await fetch_link(
+                entry["_id"], entry.get("etag"), entry.get("last_modified"), read_metadata=False
+            )
+
+    keeper = asyncio.create_task(_keep_lease())
+    try:
+        results = await asyncio.gather(*(check(e) for e in batch))
+    finally:
+        keeper.cancel()
+
+    checked_at = datetime.utcnow()
+    ops = []
+    for entry, link in results:
+        update = {
+            "status": link["status"],
+            "is_broken": link["status"] == "broken",
+            "last_checked": checked_at,
+        }
+        if link["status_code"] == 304:
+            metrics["not_modified"] += 1
+        else:
+            update.update({
+                "http_status": link["status_code"],
+                "final_url": link["final_url"],
+                "etag": link["etag"],
+                "last_modified": link["last_modified"],
+            })
+        if entry.get("status") != link["status"]:
+            metrics["became_broken" if link["status"] == "broken" else "became_alive"] += 1
+        ops.append(UpdateMany({"url": entry["_id"]}, {"$set": update}))
+
+    res = await db.bookmarks.bulk_write(ops, ordered=False)
+    await stats.on_links_checked(len(results), sum(1 for _, link in results if link["status"] == "broken"))
+
+    elapsed = time.perf_counter() - started
+    metrics["rounds"] += 1
+    metrics["urls_checked"] += len(results)
+    metrics["bookmarks_updated"] += res.modified_count
+    metrics["last_round_at"] = checked_at
+    metrics["last_round_seconds"] = elapsed
+    metrics["last_round_urls_per_second"] = len(results) / elapsed if elapsed else None
+    return len(results)
+
+
+async def run_forever():
+    while True:
+        try:
+            checked = await run_round()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Link check round failed: {e}")
+            checked = 0
+        if checked < LINK_CHECK_BATCH:
+            await asyncio.sleep(LINK_CHECK_IDLE_SECONDS)
+
+
+async def get_metrics() -> dict:
+    backlog = await db.bookmarks.count_documents(_stale_query())
+    return {**metrics, "backlog": backlog}
@@ -0,0 +1,210 @@
+# workers/stats.py
+"""
+Materialized analytics for the admin dashboard.
+
+Counters live in small collections that the write paths update as they go:
+
+  stats        one document ("global") with users / bookmarks / broken totals
+  tag_counts   one document per tag with the number of bookmarks carrying it
+  daily_stats  one document per UTC day: bookmarks added and deleted, links
+               checked and found broken
+
+/admin/analytics then reads a fixed number of documents however large the
+data grows. Hooks never fail the request that called them; anything they
+miss (a crash between writes, link checks flipping many bookmarks at
+once, edits made outside the API) is corrected by reconcile(), which
+recomputes the totals and tag counts (global and per user, see
+search/tag_index.py) from the source collections every
+STATS_RECONCILE_SECONDS under a lease so only one app worker runs it.
+"""
+import asyncio
+import os
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+
+from pymongo import DESCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from db import db
+from search import tag_index
+
+STATS_RECONCILE_SECONDS = float(os.getenv("STATS_RECONCILE_SECONDS", "3600"))
+STATS_DAYS = 30
+
+GLOBAL_ID = "global"
+LEASE_ID = "stats_reconcile"
+WORKER_ID = uuid.uuid4().hex
+
+
+def _day(when: datetime = None) -> str:
+    return (when or datetime.utcnow()).strftime("%Y-%m-%d")
+
+
+async def _apply(totals: dict = None, tags: Counter = None, daily: dict = None):
+    """Applies counter deltas; errors are logged, never raised."""
+    totals = {k: v for k, v in (totals or {}).items() if v}
+    tags = {t: n for t, n in (tags or {}).items() if n}
+    daily = {k: v for k, v in (daily or {}).items() if v}
+    try:
+        if totals:
+            await db.stats.update_one({"_id": GLOBAL_ID}, {"$inc": totals}, upsert=True)
+        if tags:
+            await db.tag_counts.bulk_write(
+                [UpdateOne({"_id": t}, {"$inc": {"count": n}}, upsert=True) for t, n in tags.items()],
+                ordered=False,
+            )
+        if daily:
+            await db.daily_stats.update_one({"_id": _day()}, {"$inc": daily}, upsert=True)
+    except Exception as e:
+        print(f"Stats update failed: {e}")
+
+
+def _tag_counter(docs, sign: int = 1) -> Counter:
+    counts = Counter()
+    for doc in docs:
+        for tag in set(doc.get("tags") or []):
+            counts[tag] += sign
+    return counts
+
+
+async def on_user_created():
+    await _apply(totals={"users": 1})
+
+
+async def on_bookmarks_added(docs: list):
+    broken = sum(1 for d in docs if d.get("is_broken"))
+    await _apply(
+        totals={"bookmarks": len(docs), "broken": broken},
+        tags=_tag_counter(docs),
+        daily={"added": len(docs)},
+    )
+
+
+async def on_bookmark_changed(before: dict, after: dict):
+    tags = _tag_counter([after])
+    tags.subtract(_tag_counter([before]))
+    broken = int(bool(after.get("is_broken"))) - int(bool(before.get("is_broken")))
+    await _apply(totals={"broken": broken}, tags=tags)
+
+
+async def on_bookmarks_deleted(docs: list):
+    broken = sum(1 for d in docs if d.get("is_broken"))
+    await _apply(
+        totals={"bookmarks": -len(docs), "broken": -broken},
+        tags=_tag_counter(docs, sign=-1),
+        daily={"deleted": len(docs)},
+    )
+
+
+async def on_links_checked(checked: int, broken: int):
+    await _apply(daily={"links_checked": checked, "links_broken": broken})
+
+
+async def get_dashboard(top: int = 10, days: int = STATS_DAYS) -> dict:
+    totals = await db.stats.find_one({"_id": GLOBAL_ID}) or {}
+    top_tags = await (
+        db.tag_counts.find({"count": {"$gt": 0}}).sort("count", DESCENDING).limit(top).to_list()
+    )
+    since = _day(datetime.utcnow() - timedelta(days=days - 1))
+    daily = await db.daily_stats.find({"_id": {"$gte": since}}).sort("_id", 1).to_list()
+    for bucket in daily:
+        checked = bucket.get("links_checked", 0)
+        bucket["broken_rate"] = bucket.get("links_broken", 0) / checked if checked else None
+    bookmarks = totals.get("bookmarks", 0)
+    return {
+        "total_users": totals.get("users", 0),
+        "total_bookmarks": bookmarks,
+        "broken_bookmarks": totals.get("broken", 0),
+        "broken_rate": totals.get("broken", 0) / bookmarks if bookmarks else 0.0,
+        "top_tags": top_tags,
+        "daily": daily,
+        "reconciled_at": totals.get("reconciled_at"),
+    }
+
+
+async def _acquire_lease() -> bool:
+    now = datetime.utcnow()
+    try:
+        await db.locks.find_one_and_update(
+            {"_id": LEASE_ID, "$or": [{"until": {"$lt": now}}, {"owner": WORKER_ID}]},
+            {"$set": {"until": now + timedelta(seconds=STATS_RECONCILE_SECONDS), "owner": WORKER_ID}},
+            upsert=True,
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+async def reconcile() -> dict:
+    """
+    Recomputes totals, global and per-user tag counts, and backfills
+    per-day added counts, from the source data.
+    """
+    started = datetime.utcnow()
+    users = await db.users.count_documents({})
+    bookmarks = await db.bookmarks.count_documents({})
+    broken = await db.bookmarks.count_documents({"is_broken": True})
+    await db.stats.update_one(
+        {"_id": GLOBAL_ID},
+        {"$set": {"users": users, "bookmarks": bookmarks, "broken": broken, "reconciled_at": started}},
+        upsert=True,
+    )
+
+    # One pass yields per-user counts (search/tag_index.py) and the global ones.
+    cursor = await db.bookmarks.aggregate([
+        {"$project": {"user_id": 1, "tags": {"$setUnion": [{"$ifNull": ["$tags", []]}, []]}}},
+        {"$unwind": "$tags"},
+        {"$group": {"_id": {"user_id": "$user_id", "tag": "$tags"}, "count": {"$sum": 1}}},
+    ])
+    per_user = {}
+    actual = Counter()
+    async for row in cursor:
+        per_user[(row["_id"]["user_id"], row["_id"]["tag"])] = row["count"]
+        actual[row["_id"]["tag"]] += row["count"]
+
+    ops = [UpdateOne({"_id": t}, {"$set": {"count": n}}, upsert=True) for t, n in actual.items()]
+    for i in range(0, len(ops), 1000):
+        await db.tag_counts.bulk_write(ops[i:i + 1000], ordered=False)
+    gone = [t["_id"] async for t in db.tag_counts.find({}, {"_id": 1}) if t["_id"] not in actual]
+    for i in range(0, len(gone), 1000):
+        await db.tag_counts.delete_many({"_id": {"$in": gone[i:i + 1000]}})
+
+    ops = [
+        UpdateOne({"user_id": uid, "tag": t}, {"$set": {"count": n}}, upsert=True)
+        for (uid, t), n in per_user.items()
+    ]
+    for i in range(0, len(ops), 1000):
+        await db.user_tags.bulk_write(ops[i:i + 1000], ordered=False)
+    gone = [
+        d["_id"] async for d in db.user_tags.find({}, {"user_id": 1, "tag": 1})
+        if (d["user_id"], d["tag"]) not in per_user
+    ]
+    for i in range(0, len(gone), 1000):
+        await db.user_tags.delete_many({"_id": {"$in": gone[i:i + 1000]}})
+    tag_index.clear()
+
+    since = datetime.utcnow() - timedelta(days=STATS_DAYS)
+    cursor = await db.bookmarks.aggregate([
+        {"$match": {"created_at": {"$gte": since}}},
+        {"$group": {"_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}}, "added": {"$sum": 1}}},
+    ])
+    # $max: the incremental count also includes bookmarks deleted since, which a recount cannot see.
+    ops = [UpdateOne({"_id": d["_id"]}, {"$max": {"added": d["added"]}}, upsert=True) async for d in cursor]
+    if ops:
+        await db.daily_stats.bulk_write(ops, ordered=False)
+
+    print(f"Stats reconciled: {bookmarks} bookmarks, {len(actual)} tags")
+    return {"users": users, "bookmarks": bookmarks, "broken": broken, "tags": len(actual)}
+
+
+async def run_forever():
+    while True:
+        try:
+            if await _acquire_lease():
+                await reconcile()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Stats reconciliation failed: {e}")
+        await asyncio.sleep(STATS_RECONCILE_SECONDS)
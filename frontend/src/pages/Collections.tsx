@@ -40,6 +40,7 @@ export const Collections: React.FC = () => {
   const [collections, setCollections] = useState<Collection[]>([]);
   const [selectedCollectionId, setSelectedCollectionId] = useState<string>('all');
   const [editingCollection, setEditingCollection] = useState<Collection | null>(null);
+  const [collectionBookmarkIds, setCollectionBookmarkIds] = useState<Set<string> | null>(null);
 
   // UI State
   const [searchQuery, setSearchQuery] = useState('');
@@ -60,10 +61,23 @@ export const Collections: React.FC = () => {
     loadData();
   }, []);
 
+  useEffect(() => {
+    // Collection listings carry counts only; member ids are fetched for the selected one.
+    if (selectedCollectionId === 'all') {
+      setCollectionBookmarkIds(null);
+      return;
+    }
+    let cancelled = false;
+    apiService.getCollectionBookmarkIds(selectedCollectionId)
+      .then(ids => { if (!cancelled) setCollectionBookmarkIds(new Set(ids)); })
+      .catch(() => toast.error('Failed to load collection'));
+    return () => { cancelled = true; };
+  }, [collections, selectedCollectionId]);
+
   useEffect(() => {
     applyFiltersAndSort();
     setSelectedBookmarks(new Set()); // clear selection on filter/sort change
-  }, [bookmarks, collections, searchQuery, sortBy, filterBy, selectedCollectionId]);
+  }, [bookmarks, collectionBookmarkIds, searchQuery, sortBy, filterBy, selectedCollectionId]);
 
   const loadData = async () => {
     try {
@@ -84,9 +98,8 @@ export const Collections: React.FC = () => {
   const applyFiltersAndSort = () => {
     let filtered = [...bookmarks];
 
-    if (selectedCollectionId !== 'all' && currentCollection) {
-      const collectionBookmarkIds = new Set(currentCollection.bookmarks);
-      filtered = filtered.filter(b => collectionBookmarkIds.has(b._id));
+    if (selectedCollectionId !== 'all') {
+      filtered = collectionBookmarkIds ? filtered.filter(b => collectionBookmarkIds.has(b._id)) : [];
     }
 
     if (searchQuery.trim()) {
@@ -440,7 +453,7 @@ const ManageCollectionModal: React.FC<ManageCollectionModalProps> = ({ isOpen, o
                     {collections.map(collection => (
                         <li key={collection._id} onClick={() => void onAddToCollection(collection._id)} className="p-3 flex justify-between items-center hover:bg-gray-100 dark:hover:bg-gray-700 cursor-pointer rounded-md">
                             <span className="font-medium text-gray-800 dark:text-gray-200">{collection.name}</span>
-                            <span className="text-sm text-gray-500">{collection.bookmarks.length} items</span>
+                            <span className="text-sm text-gray-500">{collection.bookmark_count} items</span>
                         </li>
                     ))}
                 </ul>
@@ -63,8 +63,24 @@ export const Settings: React.FC = () => {
         throw new Error(errorData.detail || 'Import failed');
       }
 
-      const data = await response.json();
+      // The import runs as a background job; poll it until it finishes.
+      let data = await response.json();
+      while (data.status === 'queued' || data.status === 'running') {
+        await new Promise((resolve) => setTimeout(resolve, 2000));
+        const poll = await fetch(`${import.meta.env.VITE_API_URL || 'http://localhost:8000'}/bookmarks/import/${data.job_id}`, {
+          headers: {
+            Authorization: `Bearer ${token}`,
+          },
+        });
+        if (!poll.ok) {
+          throw new Error('Lost track of the import job');
+        }
+        data = await poll.json();
+      }
       console.log(data);
+      if (data.status === 'failed') {
+        throw new Error('Import failed');
+      }
       toast.success(`Imported ${data.importedCount} bookmarks. Skipped Duplicates: ${data.duplicatesSkipped}. Errors: ${data.errors}`);
     } catch (error: any) {
       toast.error(error.message || 'Failed to import bookmarks');
@@ -1,4 +1,4 @@
-import { Collection, CollectionCreate, CollectionUpdate, ShareResponse, Bookmark, AuthResponse, BookmarkCreate, BookmarkUpdate, Analytics } from '../types/index';
+import { Collection, CollectionCreate, CollectionUpdate, ShareResponse, Bookmark, AuthResponse, BookmarkCreate, BookmarkUpdate, Analytics, SearchOptions, DuplicatesResponse, CollectionSuggestions } from '../types/index';
 
 const API_BASE_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
 
@@ -75,6 +75,35 @@ class ApiService {
     }
   }
 
+  /**
+   * Fetches every page of a cursor-paginated listing endpoint, following the
+   * X-Next-Cursor response header until the last page.
+   * @template T The type of a single item.
+   * @param {string} endpoint The listing endpoint to call.
+   * @returns {Promise<T[]>} All items across pages.
+   */
+  private async requestAllPages<T>(endpoint: string): Promise<T[]> {
+    const items: T[] = [];
+    let cursor: string | null = null;
+    do {
+      const separator = endpoint.includes('?') ? '&' : '?';
+      const url = `${this.baseUrl}${endpoint}${cursor ? `${separator}cursor=${encodeURIComponent(cursor)}` : ''}`;
+      let response: Response;
+      try {
+        response = await fetch(url, { headers: this.getAuthHeaders() });
+      } catch {
+        throw new Error('A network error occurred. Please try again.');
+      }
+      if (!response.ok) {
+        const errorData = await response.json().catch(() => ({ detail: `HTTP ${response.status} Error` }));
+        throw new ApiError(response.status, errorData.detail || `An unknown error occurred.`);
+      }
+      items.push(...(await response.json()));
+      cursor = response.headers.get('X-Next-Cursor');
+    } while (cursor);
+    return items;
+  }
+
   // --- Auth endpoints ---
   async register(email: string, password: string): Promise<AuthResponse> {
     return this.request('/register', {
@@ -99,7 +128,7 @@ class ApiService {
 
   // --- Bookmark endpoints ---
   async getBookmarks(): Promise<Bookmark[]> {
-    return this.request('/bookmarks/');
+    return this.requestAllPages('/bookmarks/');
   }
 
   async addBookmark(bookmark: BookmarkCreate): Promise<Bookmark> {
@@ -130,23 +159,57 @@ class ApiService {
   }
   
   async getSharedBookmarks(shareId: string): Promise<Bookmark[]> {
-    return this.request(`/shared/${shareId}`);
+    return this.requestAllPages(`/shared/${shareId}`);
   }
 
-  async searchBookmarks(query: string, limit = 20): Promise<Bookmark[]> {
+  async searchBookmarks(query: string, limit = 20, options: SearchOptions = {}): Promise<Bookmark[]> {
     return this.request('/search', {
       method: 'POST',
-      body: JSON.stringify({ query, limit }),
+      body: JSON.stringify({ query, limit, ...options }),
+    });
+  }
+
+  async findDuplicates(threshold?: number): Promise<DuplicatesResponse> {
+    return this.request(`/bookmarks/duplicates${threshold ? `?threshold=${threshold}` : ''}`);
+  }
+
+  async mergeDuplicates(groups: { keep: string; duplicates: string[] }[]): Promise<{ merged: number; removed: number }> {
+    return this.request('/bookmarks/duplicates/merge', {
+      method: 'POST',
+      body: JSON.stringify({ groups }),
     });
   }
 
   async getBrokenBookmarks(tag?: string): Promise<{ count: number; bookmarks: Bookmark[] }> {
-    const query = tag ? `?tag=${encodeURIComponent(tag)}` : '';
-    return this.request(`/bookmarks/broken${query}`);
+    const query = tag ? `tag=${encodeURIComponent(tag)}&` : '';
+    const bookmarks: Bookmark[] = [];
+    let count = 0;
+    let cursor: string | null = null;
+    do {
+      const page: { count: number; bookmarks: Bookmark[]; next_cursor: string | null } =
+        await this.request(`/bookmarks/broken?${query}${cursor ? `cursor=${encodeURIComponent(cursor)}` : ''}`);
+      count = page.count;
+      bookmarks.push(...page.bookmarks);
+      cursor = page.next_cursor;
+    } while (cursor);
+    return { count, bookmarks };
   }
 
   async getBookmarksByTag(tag: string): Promise<Bookmark[]> {
-    return this.request(`/bookmarks/tag/${encodeURIComponent(tag)}`);
+    return this.requestAllPages(`/bookmarks/tag/${encodeURIComponent(tag)}`);
+  }
+
+  async getBookmarksByTags(tags: string[], mode: 'and' | 'or' = 'and'): Promise<Bookmark[]> {
+    const query = `tags=${encodeURIComponent(tags.join(','))}&mode=${mode}`;
+    return this.requestAllPages(`/bookmarks/tags?${query}`);
+  }
+
+  async getTagFacets(limit = 20): Promise<Array<{ tag: string; count: number }>> {
+    return this.request(`/tags/facets?limit=${limit}`);
+  }
+
+  async autocompleteTags(prefix: string, limit = 10): Promise<Array<{ tag: string; count: number }>> {
+    return this.request(`/tags/autocomplete?prefix=${encodeURIComponent(prefix)}&limit=${limit}`);
   }
 
   // --- Collections endpoints ---
@@ -158,6 +221,22 @@ class ApiService {
     return this.request(`/collections/${id}`);
   }
 
+  async getCollectionSuggestions(): Promise<CollectionSuggestions> {
+    return this.request('/collections/suggestions');
+  }
+
+  async acceptCollectionSuggestion(clusterId: number, name?: string): Promise<Collection> {
+    return this.request(`/collections/suggestions/${clusterId}/accept`, {
+      method: 'POST',
+      body: JSON.stringify({ name }),
+    });
+  }
+
+  async getCollectionBookmarkIds(id: string): Promise<string[]> {
+    const bookmarks = await this.requestAllPages<{ _id: string }>(`/collections/${id}/bookmarks?fields=_id&limit=500`);
+    return bookmarks.map(b => b._id);
+  }
+
   async createCollection(data: CollectionCreate): Promise<Collection> {
     return this.request('/collections/', {
       method: 'POST',
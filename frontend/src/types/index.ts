@@ -24,6 +24,31 @@ export interface Bookmark {
   created_at: string;
   updated_at?: string;
   similarity_score?: number;
+  lexical_score?: number;
+  score?: number;
+}
+
+export interface DuplicateCluster {
+  keep: string;
+  reasons: ('url' | 'similar')[];
+  min_similarity: number | null;
+  bookmarks: Bookmark[];
+}
+
+export interface DuplicatesResponse {
+  clusters: DuplicateCluster[];
+  total_clusters: number;
+  scanned: number;
+  elapsed_ms: number;
+}
+
+export interface SearchOptions {
+  mode?: 'hybrid' | 'semantic' | 'lexical';
+  tags?: string[];
+  collection_id?: string;
+  is_broken?: boolean;
+  created_after?: string;
+  created_before?: string;
 }
 
 export interface BookmarkCreate {
@@ -46,8 +71,24 @@ export interface Collection {
   _id: string;
   name: string;
   user_id: string;
-  bookmarks: string[]; // Array of bookmark IDs
-  created_at: string;
+  bookmark_count: number;
+  preview?: Pick<Bookmark, '_id' | 'title' | 'url'>[]; // Latest members, in list responses
+  bookmarks?: Bookmark[]; // One page of members, from getCollection
+  created_at?: string;
+}
+
+export interface CollectionSuggestion {
+  id: number;
+  label: string;
+  tags: string[];
+  size: number;
+  sample: Pick<Bookmark, '_id' | 'title' | 'url'>[];
+}
+
+export interface CollectionSuggestions {
+  status: 'ready' | 'rebuilding' | 'building' | 'empty';
+  built_at?: string;
+  suggestions: CollectionSuggestion[];
 }
 
 export interface CollectionCreate {
@@ -75,6 +116,17 @@ export interface Analytics {
   total_bookmarks: number;
   top_tags: Array<{ _id: string; count: number }>;
   top_categories: Array<{ _id: string; count: number }>;
+  broken_bookmarks?: number;
+  broken_rate?: number;
+  daily?: Array<{
+    _id: string;
+    added?: number;
+    deleted?: number;
+    links_checked?: number;
+    links_broken?: number;
+    broken_rate: number | null;
+  }>;
+  reconciled_at?: string | null;
 }
 
 export interface Theme {